@@ -2,7 +2,7 @@ import os
 import uuid
 from typing import Any, List, Optional
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, status, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Response, status, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 import requests
@@ -17,7 +17,6 @@ from app.models import User, Video, FireDetection, UserHistory, Notification
 from app.schemas import Video as VideoSchema, VideoWithDetections, VideoCreate, VideoUpload
 from app.models.enums import VideoTypeEnum, StatusEnum
 from app.utils.video import save_upload_file, download_youtube_video
-from app.services.fire_detection import FireDetectionService
 from app.utils.cloudinary_service import upload_bytes_to_cloudinary, download_from_cloudinary, delete_from_cloudinary
 from app.utils.email_service import send_fire_detection_notification
 from app.core.config import settings
@@ -27,7 +26,6 @@ from app.controllers.user_history_controller import UserHistoryController
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-fire_service = FireDetectionService()
 
 
 
@@ -121,6 +119,83 @@ async def read_video(
     return video
 
 
+@router.get("/{video_id}/timeline")
+async def read_video_timeline(
+    *,
+    db: Session = Depends(get_db),
+    video_id: uuid.UUID,
+    start: int = 0,
+    end: Optional[int] = None,
+    step: int = 1,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Lấy timeline phát hiện theo từng frame (nhị phân, xem app/services/detection_timeline.py)
+    """
+    video = VideoController.get_video_by_id(db=db, video_id=video_id)
+    
+    if not video:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Video không tồn tại"
+        )
+    
+    # Kiểm tra quyền truy cập
+    if video.user_id != current_user.user_id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Không có quyền truy cập video này"
+        )
+    
+    content = await asyncio.to_thread(VideoController.get_video_timeline, db, video_id, start, end, step)
+    return Response(content=content, media_type="application/octet-stream")
+
+
+@router.post("/{video_id}/render", response_model=VideoSchema)
+async def rerender_video(
+    *,
+    db: Session = Depends(get_db),
+    video_id: uuid.UUID,
+    min_confidence: float = 0.0,
+    scale: float = 1.0,
+    fill_alpha: float = 0.3,
+    show_track_id: bool = True,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Vẽ lại video đã xử lý từ timeline phát hiện đã lưu (không phân tích lại)
+    """
+    video = VideoController.get_video_by_id(db=db, video_id=video_id)
+    
+    if not video:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Video không tồn tại"
+        )
+    
+    # Kiểm tra quyền truy cập
+    if video.user_id != current_user.user_id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Không có quyền truy cập video này"
+        )
+    
+    video = await asyncio.to_thread(
+        VideoController.rerender_video, db, video_id,
+        min_confidence=min_confidence, scale=scale, fill_alpha=fill_alpha, show_track_id=show_track_id
+    )
+    
+    # Thêm lịch sử
+    UserHistoryController.add_history(
+        db=db,
+        user_id=current_user.user_id,
+        action_type="rerender_video",
+        description=f"Vẽ lại video: {video.file_name or video.video_id}"
+    )
+    
+    return video
+
+
 @router.delete("/{video_id}")
 async def delete_video(
     *,
@@ -7,7 +7,8 @@ import time
 import logging
 import tempfile
 import asyncio
-from typing import Dict, List, Optional, Union, Tuple
+import threading
+from typing import Any, Dict, List, Optional, Union, Tuple
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException, Depends
 from starlette.websockets import WebSocketState
 from pydantic import BaseModel
@@ -15,9 +16,17 @@ from sqlalchemy.orm import Session
 from jose import jwt, JWTError
 from datetime import datetime
 
-from app.services.fire_detection import FireDetectionService, predict_and_display
-from app.utils.cloudinary_service import upload_bytes_to_cloudinary
-from app.utils.video import download_youtube_video_file
+from app.services.fire_detection import predict_and_display
+from app.services.async_pipeline import AsyncFrameStream
+from app.services.preview_encoder import PreviewEncoder
+from app.services.frame_protocol import create_frame_encoder, negotiate_frame_protocol
+from app.services.preview_sender import PreviewSender
+from app.services.chunked_upload import ChunkError, chunked_uploads
+from app.services.result_cache import content_sha256, file_sha256, get_result_cache, model_version
+from app.services.detection_timeline import TimelineWriter, store_timeline
+from app.services.model_registry import model_registry
+from app.utils.cloudinary_service import upload_stream_to_cloudinary, delete_from_cloudinary
+from app.utils.video import download_youtube_video_file, spool_video_bytes
 from app.utils.email_service import send_fire_detection_notification
 from app.models.notification import Notification
 from app.models.user import User
@@ -31,7 +40,6 @@ from app.controllers.websocket_controller import WebSocketController
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-fire_service = FireDetectionService()
 
 # Xử lý xác thực được tích hợp trực tiếp vào endpoint
 
@@ -51,6 +59,26 @@ async def process_direct_video_websocket(websocket: WebSocket):
     # Khởi tạo biến lưu tên file và loại video
     original_file_name = None 
     video_type_enum = None
+    # Model dùng chung lấy từ registry khi bắt đầu xử lý
+    fire_service = None
+    # Bộ mã hóa frame xem trước của phiên
+    preview_encoder = None
+    # Yêu cầu của client trong message đầu tiên (token, giao thức gửi frame)
+    auth_data = {}
+    # Bộ mã hóa message của giao thức binary (None = giao thức JSON)
+    frame_encoder = None
+    # Task gửi frame xem trước và message điều khiển của phiên
+    preview_sender = None
+    # Bản sao cục bộ của video gốc, pipeline giải mã từ file này
+    source_path = None
+    # sha256 nội dung video gốc (khóa của cache kết quả)
+    content_hash = None
+    # Timeline phát hiện theo từng frame, ghi dần trong lúc xử lý
+    timeline_writer = None
+    # Task tải video gốc lên Cloudinary chạy nền; video gốc chỉ được giữ khi phiên hoàn tất
+    original_upload = None
+    original_cancel = threading.Event()
+    original_kept = False
     
     try:
         # Xử lý token nếu có (tùy chọn)
@@ -92,6 +120,16 @@ async def process_direct_video_websocket(websocket: WebSocket):
                 await websocket.send_json({"status": "auth", "message": "Bỏ qua xác thực, tiếp tục dưới dạng khách"})
             except:
                 pass
+        
+        # Thỏa thuận giao thức gửi frame: client cũ không yêu cầu thì giữ giao thức JSON (2 message mỗi frame)
+        frame_protocol = negotiate_frame_protocol(auth_data if isinstance(auth_data, dict) else {})
+        frame_encoder = create_frame_encoder(frame_protocol)
+        if isinstance(auth_data, dict) and "frame_protocol" in auth_data:
+            try:
+                await websocket.send_json({"status": "protocol", **frame_protocol})
+            except WebSocketDisconnect:
+                logger.info("Client ngắt kết nối khi thỏa thuận giao thức")
+                return
             
         # Nhận thông tin loại video
         try:
@@ -112,153 +150,127 @@ async def process_direct_video_websocket(websocket: WebSocket):
         
         video_data = None
         
-        # Biến để lưu trữ các phần (chunks) của file lớn
-        chunked_data = {
-            "total_chunks": 0,
-            "chunks": {},
-            "received_chunks": 0,
-            "file_size": 0,
-            "file_name": "",
-            "mime_type": ""
-        }
-        
         # Xử lý theo loại video (upload thường, YouTube, hoặc chunking)
         if video_type == "chunk_info":
-            # Nhận thông tin về chuỗi phần
-            total_chunks = data.get("totalChunks", 0)
-            file_size = data.get("fileSize", 0)
-            file_name = data.get("fileName", "uploaded_video.mp4")
-            mime_type = data.get("mimeType", "video/mp4")
-            
-            # Lưu thông tin file name vào log để debug
-            logger.info(f"Chế độ chunk: Nhận tên file: {file_name}")
-            
-            # Kiểm tra thông tin hợp lệ
-            if total_chunks <= 0 or file_size <= 0:
-                try:
-                    logger.error(f"Thông tin file không hợp lệ: total_chunks={total_chunks}, file_size={file_size}")
-                    await websocket.send_json({"status": "error", "message": "Thông tin file không hợp lệ"})
-                except:
-                    pass
-                return
-            
-            # Lưu trữ thông tin về các phần
-            chunked_data["total_chunks"] = total_chunks
-            chunked_data["file_size"] = file_size
-            chunked_data["file_name"] = file_name
-            chunked_data["mime_type"] = mime_type
-            chunked_data["chunks"] = {}
-            chunked_data["received_chunks"] = 0  # Khởi tạo số phần đã nhận
-            
-            # Thông báo sẵn sàng nhận chuỗi phần
-            try:
-                logger.info(f"Sẵn sàng nhận file lớn {file_name} ({file_size/1024/1024:.2f} MB) trong {total_chunks} phần")
-                await websocket.send_json({"status": "ready", "message": f"Sẵn sàng nhận {total_chunks} phần"})  
-            except Exception as e:
-                logger.error(f"Lỗi khi gửi thông báo sẵn sàng nhận chunk: {str(e)}")
-                return
-        
-        # Xử lý metadata cho từng phần
-        elif video_type == "chunk_meta":
-            # Kiểm tra xem đã khởi tạo chunked_data chưa
-            if "total_chunks" not in chunked_data or "chunks" not in chunked_data:
-                logger.error("Nhận chunk_meta trước khi gửi chunk_info")
-                try:
-                    await websocket.send_json({"status": "error", "message": "Cần gửi chunk_info trước khi gửi chunk_meta"})
-                except:
-                    pass
-                return
-                
-            # Nhận thông tin về phần chuỗi hiện tại
-            chunk_index = data.get("chunkIndex", 0)
-            total_chunks = data.get("totalChunks", chunked_data.get("total_chunks", 0))
-            chunk_size = data.get("chunkSize", 0)
-            
-            # Kiểm tra thông tin hợp lệ
-            if chunk_index < 0 or chunk_index >= total_chunks:
-                logger.error(f"Chỉ số chunk không hợp lệ: {chunk_index}/{total_chunks}")
+            # Nhận file lớn theo từng phần, mỗi phần được ghi thẳng vào đúng vị trí trong file spool
+            # (không giữ các phần trong RAM). Client kết nối lại gửi kèm uploadId để gửi tiếp các phần còn thiếu
+            # Phiên tải lên gắn với client tạo ra nó (người dùng, hoặc địa chỉ IP với khách)
+            upload_owner = str(user.user_id) if user else (websocket.client.host if websocket.client else None)
+            upload = chunked_uploads.get(data.get("uploadId"), owner=upload_owner)
+            if upload is None:
                 try:
-                    await websocket.send_json({"status": "error", "message": f"Chỉ số chunk không hợp lệ: {chunk_index}/{total_chunks}"})
-                except:
-                    pass
-                return
+                    upload = await asyncio.to_thread(
+                        chunked_uploads.create,
+                        file_size=data.get("fileSize", 0),
+                        total_chunks=data.get("totalChunks", 0),
+                        chunk_size=data.get("chunkSize"),
+                        file_name=data.get("fileName", "uploaded_video.mp4"),
+                        mime_type=data.get("mimeType", "video/mp4"),
+                        owner=upload_owner,
+                    )
+                except (ValueError, OSError) as e:
+                    logger.error(f"Thông tin file không hợp lệ: {str(e)}")
+                    try:
+                        await websocket.send_json({"status": "error", "message": f"Thông tin file không hợp lệ: {str(e)}"})
+                    except:
+                        pass
+                    return
+            else:
+                logger.info(f"Tiếp tục phiên tải lên {upload.upload_id}, đã có {upload.received_chunks}/{upload.total_chunks} phần")
             
-            logger.info(f"Chuẩn bị nhận phần {chunk_index + 1}/{chunked_data['total_chunks']} kích thước {chunk_size/1024:.2f} KB")
+            original_file_name = upload.file_name
+            video_type_enum = VideoTypeEnum.UPLOAD
+            youtube_title = None
+            logger.info(f"Chế độ chunk: Nhận tên file: {original_file_name}")
             
             try:
-                # Báo sẵn sàng nhận chunk
-                await websocket.send_json({"status": "chunk_ready", "message": f"Sẵn sàng nhận phần {chunk_index + 1}"})
+                # Thông báo sẵn sàng nhận chuỗi phần, kèm uploadId và các phần còn thiếu
+                await websocket.send_json({
+                    "status": "ready",
+                    "message": f"Sẵn sàng nhận {upload.total_chunks} phần",
+                    **upload.status()
+                })
                 
-                # Nhận dữ liệu binary cho phần này
-                chunk_data = await websocket.receive_bytes()
-                
-                if not isinstance(chunk_data, bytes):
-                    raise ValueError(f"Dữ liệu chunk không phải bytes: {type(chunk_data).__name__}")
-                
-                # Kiểm tra kích thước
-                actual_size = len(chunk_data)
-                logger.info(f"Nhận được chunk {chunk_index + 1} kích thước {actual_size/1024:.2f} KB")
-                
-                # Lưu trữ phần dữ liệu này
-                chunked_data["chunks"][chunk_index] = chunk_data
-                chunked_data["received_chunks"] += 1
-                
-                # Thông báo tiến trình
-                percent = min(100, int((chunked_data["received_chunks"] / chunked_data["total_chunks"]) * 100))
-                try:
-                    await websocket.send_json({
-                        "status": "receiving", 
-                        "message": f"Nhận phần {chunked_data['received_chunks']}/{chunked_data['total_chunks']} ({percent}%)",
-                        "percent": percent,
-                        "currentChunk": chunked_data["received_chunks"],
-                        "totalChunks": chunked_data["total_chunks"]
-                    })
-                except Exception as e:
-                    logger.warning(f"Không gửi được thông báo tiến trình: {str(e)}")
-                
-                # Kiểm tra xem đã nhận đủ các phần chưa
-                if chunked_data["received_chunks"] == chunked_data["total_chunks"]:
-                    # Ghép tất cả phần lại với nhau
-                    logger.info(f"Đã nhận đủ {chunked_data['total_chunks']} phần, đang ghép lại")
-                    all_chunks = bytearray()
+                while not upload.complete:
+                    message = await websocket.receive_json()
+                    message_type = message.get("type")
+                    
+                    # Client hỏi các phần còn thiếu
+                    if message_type == "chunk_status":
+                        await websocket.send_json({"status": "chunk_status", **upload.status()})
+                        continue
+                    if message_type != "chunk_meta":
+                        await websocket.send_json({"status": "error", "message": f"Cần gửi chunk_meta, nhận được: {message_type}"})
+                        continue
                     
-                    # Ghép theo thứ tự các phần
-                    for i in range(chunked_data["total_chunks"]):
-                        if i in chunked_data["chunks"]:
-                            chunk = chunked_data["chunks"][i]
-                            all_chunks.extend(chunk)
-                            logger.info(f"Ghép phần {i+1}/{chunked_data['total_chunks']}, kích thước {len(chunk)/1024:.2f} KB")
+                    # Nhận thông tin về phần hiện tại rồi nhận dữ liệu binary của phần đó
+                    chunk_index = message.get("chunkIndex", -1)
+                    await websocket.send_json({"status": "chunk_ready", "message": f"Sẵn sàng nhận phần {chunk_index + 1}"})
+                    chunk_data = await websocket.receive_bytes()
                     
-                    # Chuyển thành dạng bytes
-                    video_data = bytes(all_chunks)
-                    logger.info(f"Hoàn tất ghép file, tổng kích thước {len(video_data)/1024/1024:.2f} MB")
+                    # Kiểm tra checksum và ghi vào file spool (ngoài event loop)
+                    try:
+                        await asyncio.to_thread(upload.write_chunk, chunk_index, chunk_data,
+                                                message.get("checksum"), message.get("checksumAlgorithm", "sha256"))
+                    except ChunkError as e:
+                        logger.warning(f"Phần {chunk_index + 1} không hợp lệ: {str(e)}")
+                        await websocket.send_json({"status": "chunk_error", "chunkIndex": chunk_index, "message": str(e)})
+                        continue
+                    finally:
+                        del chunk_data
                     
-                    # Thông báo hoàn tất nhận
+                    # Thông báo tiến trình
+                    percent = min(100, int((upload.received_chunks / upload.total_chunks) * 100))
                     try:
                         await websocket.send_json({
-                            "status": "received", 
-                            "message": f"Đã nhận xong tất cả {chunked_data['total_chunks']} phần, tổng cộng {len(video_data)/1024/1024:.2f} MB"
+                            "status": "receiving", 
+                            "message": f"Nhận phần {upload.received_chunks}/{upload.total_chunks} ({percent}%)",
+                            "percent": percent,
+                            "chunkIndex": chunk_index,
+                            "currentChunk": upload.received_chunks,
+                            "totalChunks": upload.total_chunks
                         })
+                    except WebSocketDisconnect:
+                        raise
                     except Exception as e:
-                        logger.error(f"Lỗi khi gửi thông báo hoàn tất nhận: {str(e)}")
-                    
-                    # Xóa bỏ các chunk riêng lẻ để tiết kiệm bộ nhớ
-                    chunked_data["chunks"].clear()
-                    
-                    # Tiếp tục xử lý video
-                    # (code tiếp tục ở phần sau, video_data đã sẵn sàng để xử lý)
+                        logger.warning(f"Không gửi được thông báo tiến trình: {str(e)}")
+                
+                # Đã nhận đủ: file spool thuộc về phiên xử lý này
+                source_path = await asyncio.to_thread(upload.finish)
+                content_hash = upload.content_hash
+                chunked_uploads.pop(upload.upload_id)
+                logger.info(f"Đã nhận đủ {upload.total_chunks} phần, tổng kích thước {upload.file_size/1024/1024:.2f} MB")
+                
+                # Thông báo hoàn tất nhận
+                try:
+                    await websocket.send_json({
+                        "status": "received", 
+                        "message": f"Đã nhận xong tất cả {upload.total_chunks} phần, tổng cộng {upload.file_size/1024/1024:.2f} MB"
+                    })
+                except Exception as e:
+                    logger.error(f"Lỗi khi gửi thông báo hoàn tất nhận: {str(e)}")
                     
             except WebSocketDisconnect:
-                logger.info(f"Client ngắt kết nối khi đang gửi phần {chunk_index + 1}")
+                logger.info(f"Client ngắt kết nối khi đang gửi phần, giữ phiên {upload.upload_id} để tiếp tục "
+                            f"({upload.received_chunks}/{upload.total_chunks} phần)")
                 return
             except Exception as e:
-                logger.error(f"Lỗi khi nhận phần {chunk_index + 1}: {str(e)}")
+                logger.error(f"Lỗi khi nhận dữ liệu theo phần: {str(e)}")
                 try:
-                    await websocket.send_json({"status": "error", "message": f"Lỗi khi nhận phần {chunk_index + 1}: {str(e)}"})
+                    await websocket.send_json({"status": "error", "message": f"Lỗi khi nhận dữ liệu theo phần: {str(e)}"})
                 except:
                     pass
                 return
         
+        # chunk_meta chỉ hợp lệ sau chunk_info trong cùng kết nối
+        elif video_type == "chunk_meta":
+            logger.error("Nhận chunk_meta trước khi gửi chunk_info")
+            try:
+                await websocket.send_json({"status": "error", "message": "Cần gửi chunk_info trước khi gửi chunk_meta"})
+            except:
+                pass
+            return
+        
         # Xử lý upload thông thường
         elif video_type == "upload":
             try:
@@ -314,6 +326,7 @@ async def process_direct_video_websocket(websocket: WebSocket):
                         raise ValueError("Dữ liệu video trống, không thể xử lý")
                     
                     video_data = binary_data
+                    binary_data = None
                     # Trong trường hợp upload, youtube_title luôn là None
                     youtube_title = None
                     logger.info(f"Nhận thành công {len(video_data)/1024/1024:.2f} MB dữ liệu")
@@ -371,8 +384,9 @@ async def process_direct_video_websocket(websocket: WebSocket):
             # Tải video từ YouTube
             try:
                 # Sử dụng hàm đa luồng để tải video từ YouTube và lấy tiêu đề
-                video_data, youtube_title = await download_youtube_video(youtube_url, websocket)
-                logger.info(f"Tải video YouTube thành công, kích thước: {len(video_data)/1024/1024:.2f} MB")
+                # File yt-dlp tải về được dùng trực tiếp làm bản sao cục bộ, không đọc vào RAM
+                source_path, youtube_title = await download_youtube_video(youtube_url, websocket)
+                logger.info(f"Tải video YouTube thành công, kích thước: {os.path.getsize(source_path)/1024/1024:.2f} MB")
                 if youtube_title:
                     logger.info(f"Tiêu đề video YouTube: {youtube_title}")
             except WebSocketDisconnect:
@@ -395,48 +409,54 @@ async def process_direct_video_websocket(websocket: WebSocket):
                 pass
             return
             
-        # Tải video lên Cloudinary (một lần duy nhất)
-        try:
-            await websocket.send_json({"status": "uploading", "message": "Đang tải video lên Cloudinary..."})
-        except:
-            logger.info("Client ngắt kết nối trước khi tải lên")
-            return
-        
-        # Khai báo các biến lưu thông tin Cloudinary
-        cloudinary_url = None
-        cloudinary_public_id = None
-        
-        # Chuẩn bị tên file để tải lên
+        # Lưu bản sao cục bộ của video để pipeline giải mã trực tiếp từ ổ đĩa, không phải tải lại từ Cloudinary
+        # (file nhận theo phần và file tải từ YouTube đã nằm sẵn trên ổ đĩa)
         try:
-            filename = f"fire_detection_{uuid.uuid4()}.mp4"
-            upload_success, upload_message, upload_result = upload_bytes_to_cloudinary(video_data, filename)
-            
-            # Lưu lại URL và public_id
-            if upload_success:
-                cloudinary_url = upload_result.get("secure_url")
-                cloudinary_public_id = upload_result.get("public_id")
-                logger.info(f"Tải lên Cloudinary thành công, URL: {cloudinary_url}, public_id: {cloudinary_public_id}")
+            if source_path is None:
+                source_path = await asyncio.to_thread(spool_video_bytes, video_data)
+                content_hash = await asyncio.to_thread(content_sha256, video_data)
+            elif content_hash is None:
+                # Nguồn không tính sẵn sha256 khi nhận: băm file trên ổ đĩa để mọi đường tải lên đều dùng được cache
+                content_hash = await asyncio.to_thread(file_sha256, source_path)
+            # Từ đây chỉ dùng bản sao trên ổ đĩa, giải phóng dữ liệu trong RAM
+            video_data = None
         except Exception as e:
-            logger.error(f"Lỗi khi tải video lên Cloudinary: {str(e)}")
+            logger.error(f"Lỗi khi lưu video tạm: {str(e)}")
             try:
-                await websocket.send_json({"status": "error", "message": f"Lỗi khi tải video lên Cloudinary: {str(e)}"})
+                await websocket.send_json({"status": "error", "message": f"Lỗi khi lưu video tạm: {str(e)}"})
                 await websocket.close()
             except:
                 pass
             return
-            
-        # Sử dụng URL và public_id đã lưu ở trên
-        if cloudinary_url is None and "upload_result" in locals():
-            cloudinary_url = upload_result.get('secure_url')
-            cloudinary_public_id = upload_result.get('public_id')
+        
+        # Video giống hệt đã được phân tích với cùng model và cấu hình: trả ngay kết quả đã lưu,
+        # không suy luận và không tải lên lại
+        result_cache = get_result_cache() if settings.RESULT_CACHE_ENABLED and content_hash else None
+        cache_model = None
+        cache_key = None
+        if result_cache is not None:
+            cache_model = model_version()
+            cache_key = result_cache.make_key(content_hash, cache_model)
+            cached_result = result_cache.get(cache_key)
+            if cached_result is not None:
+                logger.info(f"Video đã được phân tích trước đó (sha256={content_hash[:12]}), dùng lại kết quả")
+                file_name = original_file_name or youtube_title or f"video_{content_hash[:12]}.mp4"
+                await complete_from_cache(websocket, db, user, cached_result, video_type_enum, file_name,
+                                          youtube_url if video_type_enum == VideoTypeEnum.YOUTUBE else None)
+                return
+        
+        # Khai báo các biến lưu thông tin Cloudinary (có sau khi tải video gốc xong)
+        cloudinary_url = None
+        cloudinary_public_id = None
+        
+        # Tải video gốc lên Cloudinary chạy nền, song song với xử lý; bản ghi CSDL được hoàn tất khi cả hai xong
+        filename = f"fire_detection_{uuid.uuid4()}.mp4"
+        original_upload = asyncio.create_task(asyncio.to_thread(upload_stream_to_cloudinary, source_path, filename,
+                                                                cancel_event=original_cancel))
         try:
-            await websocket.send_json({
-                "status": "info", 
-                "message": "Đã tải video lên Cloudinary thành công",
-                "original_url": cloudinary_url
-            })
+            await websocket.send_json({"status": "uploading", "message": "Đang tải video lên Cloudinary (chạy song song với xử lý)..."})
         except:
-            logger.info("Client ngắt kết nối sau khi tải lên Cloudinary thành công")
+            logger.info("Client ngắt kết nối trước khi tải lên")
             return
         
         # Tạo file output tạm thời
@@ -444,6 +464,8 @@ async def process_direct_video_websocket(websocket: WebSocket):
             temp_output = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
             temp_output_path = temp_output.name
             temp_output.close()
+            if settings.TIMELINE_ENABLED:
+                timeline_writer = TimelineWriter(os.path.join(settings.TEMP_DIR, f"timeline_{uuid.uuid4().hex}.fdtl"))
         except Exception as e:
             logger.error(f"Lỗi khi tạo file tạm: {str(e)}")
             try:
@@ -484,101 +506,137 @@ async def process_direct_video_websocket(websocket: WebSocket):
             fire_areas = []
             consecutive_fire_frames = 0
             
-            for frame, frame_info in predict_and_display(fire_service.model, cloudinary_url, temp_output_path):
-                frame_count += 1
-                
-                # Nếu phát hiện lửa trong frame
-                current_frame_has_fire = frame_info.get("fire_detected", False)
-                
-                if current_frame_has_fire:
-                    # Tăng số frame phát hiện có cháy và tăng số frame liên tiếp
-                    fire_frames_count += 1
-                    consecutive_fire_frames += 1
+            # Thống kê phiên xử lý (số frame bị bỏ / phải chờ trong hàng đợi, thông lượng suy luận)
+            pipeline_stats = {}
+            # Đã báo cho client video gốc được tải lên Cloudinary hay chưa
+            original_notified = False
+            
+            fire_service = await asyncio.to_thread(model_registry.acquire)
+            # Frame xem trước được thu nhỏ và mã hóa JPEG trên thread pool riêng, chất lượng và
+            # độ phân giải tự điều chỉnh theo thời gian gửi (video đã xử lý vẫn giữ độ phân giải gốc)
+            preview_encoder = PreviewEncoder()
+            # Gửi qua task riêng: client chậm chỉ bị bỏ frame xem trước, phân tích vẫn chạy hết tốc độ;
+            # cảnh báo và tiến độ luôn được gửi
+            preview_sender = PreviewSender(websocket, preview_encoder, frame_encoder).start()
+            
+            # Đọc kết quả và vẽ chạy trên luồng riêng, coroutine chỉ nhận kết quả qua hàng đợi asyncio
+            # có giới hạn nên không chặn các kết nối khác trên cùng worker.
+            # Mọi frame giải mã đều được ghi vào video kết quả và timeline. Frame nào được suy luận do
+            # ANALYSIS_TARGET_FPS và cổng chuyển động quyết định (nằm trong khóa cache); kết quả được lưu lại
+            # nên không dùng ngân sách độ trễ, tránh bỏ suy luận theo tốc độ máy.
+            # Xem trực tiếp ưu tiên frame mới nhất nhờ PreviewSender chỉ giữ frame xem trước mới nhất
+            frame_stream = AsyncFrameStream(
+                lambda: predict_and_display(fire_service.model, source_path, temp_output_path,
+                                            session_stats=pipeline_stats, queue_policy="block",
+                                            latency_budget=0, timeline=timeline_writer),
+                # Frame vẽ xong được đưa ngay vào thread pool mã hóa, luồng xử lý tiếp tục với frame sau
+                transform=lambda item: (preview_encoder.submit(item[0]), item[1]),
+            )
+            async with frame_stream:
+                async for encoded_frame, frame_info in frame_stream:
+                    frame_count += 1
                     
-                    # Thu thập thông tin confidence và diện tích
-                    if "total_area" in frame_info:
-                        fire_areas.append(frame_info["total_area"])
+                    # Báo cho client khi video gốc đã được tải lên Cloudinary (chạy nền song song)
+                    if not original_notified and original_upload.done():
+                        original_notified = True
+                        original_success, _, original_result = original_upload.result()
+                        if original_success:
+                            preview_sender.send_json({
+                                "status": "info", 
+                                "message": "Đã tải video lên Cloudinary thành công",
+                                "original_url": original_result.get("secure_url")
+                            })
                     
-                    # Cập nhật thông tin để tính confidence chính xác
-                    confidence = frame_info.get("confidence", 0)
-                    if confidence > 0:
-                        confidence_values.append(confidence)
+                    # Nếu phát hiện lửa trong frame
+                    current_frame_has_fire = frame_info.get("fire_detected", False)
                     
-                    # Nếu đạt đủ số frame liên tiếp có cháy và chưa đánh dấu là phát hiện cháy
-                    if consecutive_fire_frames >= 5 and not fire_detected:
-                        fire_detected = True
-                        detection_frame_info = frame_info.copy()
+                    if current_frame_has_fire:
+                        # Tăng số frame phát hiện có cháy và tăng số frame liên tiếp
+                        fire_frames_count += 1
+                        consecutive_fire_frames += 1
                         
-                        # Cập nhật thông tin cho detection_frame_info
-                        if confidence_values:
-                            detection_frame_info["confidence"] = sum(confidence_values) / len(confidence_values)
-                        if fire_areas:
-                            detection_frame_info["total_area"] = sum(fire_areas) / len(fire_areas)
+                        # Thu thập thông tin confidence và diện tích
+                        if "total_area" in frame_info:
+                            fire_areas.append(frame_info["total_area"])
                         
-                        # Gửi thông báo phát hiện lửa qua WebSocket
-                        try:
-                            await websocket.send_json({
-                                "status": "alert", 
-                                "message": f"PHÁT HIỆN LỬA! Đã xác nhận qua {consecutive_fire_frames} frame liên tiếp.",
-                                "frame_info": detection_frame_info
-                            })
-                        except:
-                            pass
+                        # Cập nhật thông tin để tính confidence chính xác
+                        confidence = frame_info.get("confidence", 0)
+                        if confidence > 0:
+                            confidence_values.append(confidence)
                         
-                        # Chỉ ghi nhận phát hiện lửa, không gửi email ngay (sẽ gửi sau khi hoàn tất xử lý)
-                        if user:
-                            # Ghi log debug
-                            logger.info(f"Người dùng đã đăng nhập: {user.username}, user_id: {user.user_id}")
+                        # Nếu đạt đủ số frame liên tiếp có cháy và chưa đánh dấu là phát hiện cháy
+                        if consecutive_fire_frames >= 5 and not fire_detected:
+                            fire_detected = True
+                            detection_frame_info = frame_info.copy()
                             
-                            # Kiểm tra cài đặt thông báo của người dùng
-                            notification_settings = db.query(Notification).filter(Notification.user_id == user.user_id).first()
+                            # Cập nhật thông tin cho detection_frame_info
+                            if confidence_values:
+                                detection_frame_info["confidence"] = sum(confidence_values) / len(confidence_values)
+                            if fire_areas:
+                                detection_frame_info["total_area"] = sum(fire_areas) / len(fire_areas)
                             
-                            # Ghi log thông tin notification settings
-                            if notification_settings:
-                                logger.info(f"Tìm thấy cài đặt thông báo: enable_email_notification={notification_settings.enable_email_notification}")
-                                # Thông báo cho client về trạng thái email
-                                if notification_settings.enable_email_notification:
-                                    await websocket.send_json({"status": "info", "message": "Sẽ gửi email thông báo sau khi xử lý hoàn tất..."})
-                            else:
-                                logger.info(f"Không tìm thấy cài đặt thông báo cho user_id={user.user_id}")
-                else:
-                    # Reset số frame liên tiếp khi không có cháy
-                    consecutive_fire_frames = 0
-                
-                # Chuyển frame thành JPEG và gửi qua WebSocket
-                try:
-                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                    frame_bytes = buffer.tobytes()
-                    
-                    # Gửi frame
-                    await websocket.send_bytes(frame_bytes)
+                            # Gửi thông báo phát hiện lửa qua WebSocket
+                            try:
+                                preview_sender.send_json({
+                                    "status": "alert", 
+                                    "message": f"PHÁT HIỆN LỬA! Đã xác nhận qua {consecutive_fire_frames} frame liên tiếp.",
+                                    "frame_info": detection_frame_info
+                                })
+                            except:
+                                pass
+                            
+                            # Chỉ ghi nhận phát hiện lửa, không gửi email ngay (sẽ gửi sau khi hoàn tất xử lý)
+                            if user:
+                                # Ghi log debug
+                                logger.info(f"Người dùng đã đăng nhập: {user.username}, user_id: {user.user_id}")
+                                
+                                # Kiểm tra cài đặt thông báo của người dùng
+                                notification_settings = db.query(Notification).filter(Notification.user_id == user.user_id).first()
+                                
+                                # Ghi log thông tin notification settings
+                                if notification_settings:
+                                    logger.info(f"Tìm thấy cài đặt thông báo: enable_email_notification={notification_settings.enable_email_notification}")
+                                    # Thông báo cho client về trạng thái email
+                                    if notification_settings.enable_email_notification:
+                                        preview_sender.send_json({"status": "info", "message": "Sẽ gửi email thông báo sau khi xử lý hoàn tất..."})
+                                else:
+                                    logger.info(f"Không tìm thấy cài đặt thông báo cho user_id={user.user_id}")
+                    else:
+                        # Reset số frame liên tiếp khi không có cháy
+                        consecutive_fire_frames = 0
                     
-                    # Gửi thông tin trạng thái
-                    await websocket.send_json({
-                        "status": "frame", 
-                        "frame_info": frame_info
-                    })
+                    # Giao frame JPEG và thông tin frame cho task gửi (không chờ gửi xong)
+                    try:
+                        preview_sender.send_frame(encoded_frame, frame_info)
+                        
+                        # Nếu đã xử lý nhiều hơn 100 frame mà chưa có thông báo, thông báo tiến độ
+                        if frame_count % 100 == 0:
+                            preview_sender.send_json({
+                                "status": "progress", 
+                                "frames_processed": frame_count
+                            })
+                    except WebSocketDisconnect:
+                        logger.info(f"Client ngắt kết nối sau khi đã xử lý {frame_count} frames")
+                        await preview_sender.close(flush=False)
+                        # Hủy xử lý và xóa file
+                        if os.path.exists(temp_output_path):
+                            try:
+                                os.remove(temp_output_path)
+                            except:
+                                pass
+                        return
+                    except Exception as e:
+                        logger.error(f"Lỗi khi gửi frame: {str(e)}")
+                        # Tiếp tục xử lý các frame tiếp theo dù gặp lỗi gửi
+                        continue
                     
-                    # Nếu đã xử lý nhiều hơn 100 frame mà chưa có thông báo, thông báo tiến độ
-                    if frame_count % 100 == 0:
-                        await websocket.send_json({
-                            "status": "progress", 
-                            "frames_processed": frame_count
-                        })
-                except WebSocketDisconnect:
-                    logger.info(f"Client ngắt kết nối sau khi đã xử lý {frame_count} frames")
-                    # Hủy xử lý và xóa file
-                    if os.path.exists(temp_output_path):
-                        try:
-                            os.remove(temp_output_path)
-                        except:
-                            pass
-                    return
-                except Exception as e:
-                    logger.error(f"Lỗi khi gửi frame: {str(e)}")
-                    # Tiếp tục xử lý các frame tiếp theo dù gặp lỗi gửi
-                    continue
-                
+            # Gửi nốt cảnh báo, tiến độ và frame cuối trước các message tiếp theo
+            await preview_sender.close()
+            logger.info(f"Frame xem trước: đã gửi {preview_sender.frames_sent}, bỏ {preview_sender.frames_dropped} do client nhận chậm")
+            if timeline_writer is not None:
+                timeline_writer.close()
+                logger.info(f"Timeline phát hiện: {timeline_writer.stats()}")
+            
             # Đóng tài nguyên
             cv2.destroyAllWindows()
             
@@ -595,31 +653,45 @@ async def process_direct_video_websocket(websocket: WebSocket):
                         pass
                 return
             
-            try:
-                with open(temp_output_path, "rb") as f:
-                    processed_data = f.read()
-            except Exception as e:
-                logger.error(f"Lỗi khi đọc file đã xử lý: {str(e)}")
+            processed_filename = f"processed_fire_detection_{uuid.uuid4()}.mp4"
+            loop = asyncio.get_running_loop()
+            # Tiến trình tải lên đi qua hàng đợi điều khiển của một PreviewSender mới: lỗi gửi do client
+            # ngắt kết nối được task gửi xử lý, luồng tải lên không phải chờ hay kiểm tra kết quả gửi
+            preview_sender = PreviewSender(websocket).start()
+            
+            def queue_upload_progress(message):
+                if preview_sender.error is None:
+                    preview_sender.send_json(message)
+            
+            def report_upload_progress(uploaded: int, total: int):
+                # Được gọi từ luồng tải lên sau mỗi phần, chuyển thông báo tiến trình về event loop
+                percent = int(uploaded / total * 100)
                 try:
-                    await websocket.send_json({"status": "error", "message": f"Lỗi khi đọc file đã xử lý: {str(e)}"})
-                    # Xóa file tạm
-                    if os.path.exists(temp_output_path):
-                        os.remove(temp_output_path)
-                except:
+                    loop.call_soon_threadsafe(queue_upload_progress, {
+                        "status": "uploading",
+                        "message": f"Đang tải video đã xử lý lên Cloudinary ({percent}%)",
+                        "percent": percent
+                    })
+                except RuntimeError:
+                    # Event loop đã đóng: bỏ thông báo tiến trình, không làm hỏng việc tải lên
                     pass
-                return
-                
-            processed_filename = f"processed_fire_detection_{uuid.uuid4()}.mp4"
+            
             try:
-                upload_success, upload_message, processed_result = upload_bytes_to_cloudinary(
-                    processed_data, 
-                    filename=processed_filename
+                # Tải lên theo từng phần trực tiếp từ file đã xử lý, không đọc toàn bộ vào bộ nhớ
+                upload_success, upload_message, processed_result = await asyncio.to_thread(
+                    upload_stream_to_cloudinary,
+                    temp_output_path, 
+                    filename=processed_filename,
+                    progress_callback=report_upload_progress
                 )
+                # Gửi nốt tiến trình tải lên trước các message tiếp theo
+                await preview_sender.close()
                 
                 # Lấy public_id của video đã xử lý
                 cloudinary_processed_id = processed_result.get("public_id")
             except Exception as e:
                 logger.error(f"Lỗi khi tải video đã xử lý lên Cloudinary: {str(e)}")
+                await preview_sender.close(flush=False)
                 try:
                     await websocket.send_json({"status": "error", "message": f"Lỗi khi tải video đã xử lý: {str(e)}"})
                 except:
@@ -639,10 +711,35 @@ async def process_direct_video_websocket(websocket: WebSocket):
                     os.remove(temp_output_path)
                 except Exception as e:
                     logger.warning(f"Không thể xóa file tạm: {str(e)}")
+            
+            # Chờ tải video gốc lên Cloudinary (chạy nền từ trước khi xử lý) để hoàn tất bản ghi
+            original_success, original_message, original_result = await original_upload
+            if original_success:
+                cloudinary_url = original_result.get("secure_url")
+                cloudinary_public_id = original_result.get("public_id")
+                logger.info(f"Tải lên Cloudinary thành công, URL: {cloudinary_url}, public_id: {cloudinary_public_id}")
+            else:
+                logger.error(f"Lỗi khi tải video lên Cloudinary: {original_message}")
+                try:
+                    await websocket.send_json({"status": "error", "message": f"Lỗi khi tải video lên Cloudinary: {original_message}"})
+                except:
+                    pass
+                # Không lưu video đã xử lý khi không có video gốc đi kèm
+                if upload_success and cloudinary_processed_id:
+                    await asyncio.to_thread(delete_from_cloudinary, cloudinary_processed_id)
+                return
                 
             if upload_success:
                 processed_url = processed_result.get("secure_url")
                 cloudinary_processed_id = processed_result.get("public_id")
+                # Có đủ video gốc và video đã xử lý: video gốc thuộc về kết quả của phiên
+                original_kept = True
+                
+                # Lưu timeline phát hiện để xem lại biểu đồ / tua video mà không cần suy luận lại
+                timeline_url = None
+                if timeline_writer is not None:
+                    timeline_url = await asyncio.to_thread(store_timeline, timeline_writer.path, uuid.uuid4().hex)
+                saved_video_id = None
                 
                 # Lưu thông tin video vào cơ sở dữ liệu
                 if user and user.user_id and db:
@@ -689,7 +786,8 @@ async def process_direct_video_websocket(websocket: WebSocket):
                             fire_detected=fire_detected,
                             file_name=file_name,
                             cloudinary_public_id=cloudinary_public_id,
-                            cloudinary_processed_id=cloudinary_processed_id
+                            cloudinary_processed_id=cloudinary_processed_id,
+                            timeline_url=timeline_url
                         )
                         db.add(new_video)
                         
@@ -705,6 +803,7 @@ async def process_direct_video_websocket(websocket: WebSocket):
                         
                         # Lưu vào cơ sở dữ liệu
                         db.commit()
+                        saved_video_id = video_id
                         
                         logger.info(f"Lưu thông tin video thành công, video_id={video_id}")
                     except Exception as db_error:
@@ -722,6 +821,26 @@ async def process_direct_video_websocket(websocket: WebSocket):
                     video_saved = True
                     save_message = "Đã xử lý và lưu video vào tài khoản của bạn"
                 
+                # Lưu kết quả để lần gửi lại cùng video không phải phân tích lại. Phiên có frame bị bỏ suy luận
+                # vì trễ hạn cho kết quả phụ thuộc tốc độ máy, không lưu để lần sau phân tích lại đầy đủ
+                deadline_skips = pipeline_stats.get("scheduler", {}).get("skipped_by_deadline", 0)
+                if result_cache is not None and deadline_skips:
+                    logger.info(f"Không lưu cache kết quả: {deadline_skips} frame bị bỏ suy luận vì trễ hạn")
+                elif result_cache is not None:
+                    # Ghi file cache (có khóa file giữa các worker) ngoài event loop
+                    await asyncio.to_thread(result_cache.put, cache_key, {
+                        "original_url": cloudinary_url,
+                        "cloudinary_public_id": cloudinary_public_id,
+                        "processed_url": processed_url,
+                        "cloudinary_processed_id": cloudinary_processed_id,
+                        "fire_detected": fire_detected,
+                        "frames_processed": frame_count,
+                        "fire_frames": fire_frames_count,
+                        "confidence": round(sum(confidence_values) / len(confidence_values), 4) if confidence_values else 0.0,
+                        "detection": detection_frame_info,
+                        "timeline_url": timeline_url,
+                    }, cache_model)
+                
                 # Thông báo hoàn thành
                 try:
                     await websocket.send_json({
@@ -731,6 +850,12 @@ async def process_direct_video_websocket(websocket: WebSocket):
                         "processed_url": processed_url,
                         "fire_detected": fire_detected,
                         "frames_processed": frame_count,
+                        "frames_dropped": pipeline_stats.get("dropped_frames", 0),
+                        "queue_blocked": pipeline_stats.get("blocked_puts", 0),
+                        "preview": preview_encoder.stats(),
+                        "previews_dropped": preview_sender.frames_dropped,
+                        "video_id": str(saved_video_id) if saved_video_id else None,
+                        "timeline": timeline_writer.stats() if timeline_url else None,
                         "video_saved": video_saved,
                         "requires_login": not video_saved
                     })
@@ -838,8 +963,7 @@ async def process_direct_video_websocket(websocket: WebSocket):
                 try:
                     await websocket.send_json({
                         "status": "error",
-                        "message": f"Lỗi khi tải video đã xử lý: {upload_message}",
-                        "original_url": cloudinary_url
+                        "message": f"Lỗi khi tải video đã xử lý: {upload_message}"
                     })
                 except:
                     logger.info("Client ngắt kết nối trước khi nhận thông báo lỗi")
@@ -875,26 +999,144 @@ async def process_direct_video_websocket(websocket: WebSocket):
         except:
             pass
     finally:
+        if preview_sender is not None:
+            await preview_sender.close(flush=False)
+        # Luồng tải video gốc còn đọc file nguồn: chờ xong (hoặc hủy) trước khi xóa file
+        if original_upload is not None:
+            await settle_original_upload(original_upload, original_cancel, keep=original_kept)
+        if source_path is not None and os.path.exists(source_path):
+            try:
+                os.remove(source_path)
+            except Exception as e:
+                logger.warning(f"Không thể xóa file tạm: {str(e)}")
+        if preview_encoder is not None:
+            logger.info(f"Thống kê mã hóa frame xem trước: {preview_encoder.stats()}")
+            preview_encoder.close()
+        if frame_encoder is not None:
+            logger.info(f"Thống kê giao thức binary: {frame_encoder.stats()}")
+        if timeline_writer is not None:
+            # Timeline chưa được lưu (phiên bị ngắt hoặc lỗi) thì bỏ file tạm
+            timeline_writer.close()
+            if os.path.exists(timeline_writer.path):
+                os.remove(timeline_writer.path)
+        if fire_service is not None:
+            model_registry.release(fire_service)
         try:
             await websocket.close()
         except:
             pass
 
 
-async def download_youtube_video(youtube_url: str, websocket: Optional[WebSocket] = None) -> Tuple[bytes, Optional[str]]:
+async def settle_original_upload(task: "asyncio.Task", cancel_event: threading.Event, keep: bool) -> None:
+    """
+    Kết thúc task tải video gốc chạy nền. Phiên bị ngắt hoặc lỗi (keep=False) thì dừng tải lên trước
+    phần tiếp theo và xóa video gốc nếu đã tải xong, không để lại tài nguyên không bản ghi nào tham chiếu.
+    Task luôn được chờ xong để lấy kết quả (ngoại lệ không bị bỏ qua).
+    """
+    if not keep:
+        cancel_event.set()
+    try:
+        success, _, result = await task
+    except Exception as e:
+        logger.error(f"Lỗi khi tải video gốc lên Cloudinary: {str(e)}")
+        return
+    if not keep and success and result and result.get("public_id"):
+        logger.info(f"Phiên xử lý không hoàn tất, xóa video gốc đã tải lên: {result.get('public_id')}")
+        await asyncio.to_thread(delete_from_cloudinary, result.get("public_id"))
+
+
+async def complete_from_cache(websocket: WebSocket, db: Session, user: Optional[User], cached_result: Dict[str, Any],
+                              video_type_enum: Optional[VideoTypeEnum], file_name: str, youtube_url: Optional[str]) -> None:
+    """
+    Hoàn tất phiên bằng kết quả đã lưu trong cache: lưu bản ghi video mới dùng chung video gốc
+    và video đã xử lý trên Cloudinary, rồi gửi kết quả cho client
+    
+    Args:
+        websocket: Kết nối WebSocket
+        db: Phiên CSDL
+        user: Người dùng đã đăng nhập (None nếu là khách)
+        cached_result: Kết quả từ ResultCache
+        video_type_enum: Loại video
+        file_name: Tên hiển thị của video
+        youtube_url: URL YouTube (nếu có)
+    """
+    video_saved = bool(user and user.user_id)
+    video_id = None
+    if video_saved:
+        try:
+            video_id = uuid.uuid4()
+            db.add(Video(
+                video_id=video_id,
+                user_id=user.user_id,
+                video_type=video_type_enum or VideoTypeEnum.UPLOAD,
+                youtube_url=youtube_url,
+                original_video_url=cached_result["original_url"],
+                processed_video_url=cached_result["processed_url"],
+                status=StatusEnum.COMPLETED,
+                fire_detected=cached_result["fire_detected"],
+                file_name=file_name,
+                cloudinary_public_id=cached_result["cloudinary_public_id"],
+                cloudinary_processed_id=cached_result["cloudinary_processed_id"],
+                timeline_url=cached_result.get("timeline_url")
+            ))
+            db.add(UserHistory(
+                history_id=uuid.uuid4(),
+                user_id=user.user_id,
+                action_type="upload_video_websocket",
+                video_id=video_id,
+                description=f"Tải lên video qua WebSocket (dùng lại kết quả đã phân tích). Loại: {video_type_enum}, "
+                            f"Phát hiện đám cháy: {'Có' if cached_result['fire_detected'] else 'Không'}"
+            ))
+            db.commit()
+            logger.info(f"Lưu thông tin video từ kết quả đã lưu thành công, video_id={video_id}")
+        except Exception as db_error:
+            logger.error(f"Lỗi khi lưu thông tin video vào cơ sở dữ liệu: {str(db_error)}")
+            db.rollback()
+            video_saved = False
+            video_id = None
+    
+    if video_saved:
+        save_message = "Video đã được phân tích trước đó, đã lưu kết quả vào tài khoản của bạn"
+    else:
+        save_message = "Video đã được phân tích trước đó. Hãy đăng nhập để lưu video vào tài khoản của bạn"
+    
+    if cached_result.get("detection"):
+        await websocket.send_json({
+            "status": "alert",
+            "message": "PHÁT HIỆN LỬA! (kết quả phân tích trước đó)",
+            "frame_info": cached_result["detection"]
+        })
+    await websocket.send_json({
+        "status": "completed",
+        "message": save_message,
+        "cached": True,
+        "original_url": cached_result["original_url"],
+        "processed_url": cached_result["processed_url"],
+        "fire_detected": cached_result["fire_detected"],
+        "frames_processed": cached_result["frames_processed"],
+        "fire_frames": cached_result["fire_frames"],
+        "confidence": cached_result["confidence"],
+        "video_id": str(video_id) if video_id else None,
+        "video_saved": video_saved,
+        "requires_login": not video_saved
+    })
+
+
+async def download_youtube_video(youtube_url: str, websocket: Optional[WebSocket] = None) -> Tuple[str, Optional[str]]:
     """
-    Tải video từ YouTube URL và lấy tiêu đề video
+    Tải video từ YouTube URL vào file tạm và lấy tiêu đề video
     
     Args:
         youtube_url: URL YouTube
         websocket: WebSocket để thông báo tiến độ (nếu có)
         
     Returns:
-        Tuple[bytes, Optional[str]]: Dữ liệu video và tiêu đề video (nếu có)
+        Tuple[str, Optional[str]]: Đường dẫn file video tạm (người gọi chịu trách nhiệm xóa) và tiêu đề video (nếu có)
     """
     # Tạo file tạm thời
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_file:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=settings.TEMP_DIR) as temp_file:
         temp_path = temp_file.name
+    downloaded = False
     
     try:
         if websocket:
@@ -941,22 +1183,20 @@ async def download_youtube_video(youtube_url: str, websocket: Optional[WebSocket
                 "message": f"Đã tải xong video YouTube ({file_size:.2f} MB)"
             })
         
-        # Đọc dữ liệu nhị phân
-        with open(temp_path, "rb") as f:
-            video_data = f.read()
-            
-        return video_data, video_title
+        downloaded = True
+        return temp_path, video_title
     
     except Exception as e:
         logger.error(f"Lỗi khi tải video từ YouTube: {str(e)}")
         raise
     finally:
-        # Dọn dẹp file tạm
-        if os.path.exists(temp_path):
+        # Dọn dẹp file tạm khi tải không thành công
+        if not downloaded and os.path.exists(temp_path):
             try:
                 os.remove(temp_path)
             except:
                 pass
+
 @router.websocket("/ws/process/{video_id}")
 async def process_video_streaming(
     websocket: WebSocket,
@@ -13,7 +13,11 @@ from typing import Dict, Optional, Any, Tuple, List
 from fastapi import WebSocket, WebSocketDisconnect
 
 from app.core.config import settings
-from app.services.fire_detection import FireDetectionService
+from app.services.model_registry import model_registry
+from app.services.motion_gate import MotionGate, create_motion_gate
+from app.services.fire_prefilter import FireColorPrefilter, create_fire_prefilter
+from app.services.overlay import FrameRenderer
+from app.services.detections import box_area_percent, fire_only, results_to_detections, results_to_masks
 
 logger = logging.getLogger(__name__)
 
@@ -24,9 +28,9 @@ class CameraController:
     
     def __init__(self):
         """
-        Khởi tạo controller camera với FireDetectionService
+        Khởi tạo controller camera. Model được lấy từ registry khi có kết nối đầu tiên
         """
-        self.fire_detection_service = FireDetectionService()
+        self.fire_detection_service = None
         self.connected_clients = set()
         logger.info("Khởi tạo CameraController thành công")
     
@@ -41,7 +45,11 @@ class CameraController:
         self.connected_clients.add(websocket)
         logger.info(f"Client kết nối thành công, đang khởi động camera...")
         
+        # Registry trả về cùng một service cho mọi kết nối, mỗi kết nối giữ một tham chiếu
+        fire_service = None
         try:
+            fire_service = await asyncio.to_thread(model_registry.acquire)
+            self.fire_detection_service = fire_service
             await self._process_camera_feed(websocket)
         except WebSocketDisconnect:
             logger.info("Client đã ngắt kết nối")
@@ -50,6 +58,8 @@ class CameraController:
             logger.error(f"Lỗi không mong muốn: {str(e)}")
             logger.error(f"Chi tiết lỗi: {error_details}")
         finally:
+            if fire_service is not None:
+                model_registry.release(fire_service)
             if websocket in self.connected_clients:
                 self.connected_clients.remove(websocket)
             
@@ -68,6 +78,11 @@ class CameraController:
             websocket: Đối tượng WebSocket của client
         """
         cap = None
+        # Mỗi kết nối có cổng chuyển động riêng (frame tham chiếu và kết quả dùng lại)
+        motion_gate = create_motion_gate()
+        prefilter = create_fire_prefilter()
+        # Bộ vẽ lớp phủ của kết nối, dùng lại bộ đệm giữa các frame
+        renderer = FrameRenderer()
         try:
             # Khởi tạo camera với backend mặc định
             cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
@@ -124,7 +139,7 @@ class CameraController:
 
                 # Xử lý frame
                 processed_frame, frame_info = self._process_frame(
-                    frame, frame_idx, width, height, fps
+                    frame, frame_idx, width, height, fps, motion_gate, prefilter, renderer
                 )
                 
                 # Gửi frame và thông tin phát hiện
@@ -145,6 +160,11 @@ class CameraController:
                 cap.release()
                 logger.info("Đã giải phóng camera")
             
+            if motion_gate is not None:
+                logger.info(f"Cổng chuyển động của phiên camera: {motion_gate.stats()}")
+            if prefilter is not None:
+                logger.info(f"Bộ lọc màu lửa của phiên camera: {prefilter.stats()}")
+            
             # Tránh đóng kết nối đã đóng
             try:
                 await websocket.close()
@@ -152,7 +172,10 @@ class CameraController:
             except RuntimeError as e:
                 logger.info(f"Kết nối WebSocket đã đóng trước đó: {str(e)}")
     
-    def _process_frame(self, frame: np.ndarray, frame_idx: int, width: int, height: int, fps: int = 0) -> Tuple[np.ndarray, Dict[str, Any]]:
+    def _process_frame(self, frame: np.ndarray, frame_idx: int, width: int, height: int, fps: int = 0,
+                       motion_gate: Optional[MotionGate] = None,
+                       prefilter: Optional[FireColorPrefilter] = None,
+                       renderer: Optional[FrameRenderer] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
         """
         Xử lý một frame từ camera để phát hiện đám cháy
         
@@ -161,58 +184,55 @@ class CameraController:
             frame_idx: Chỉ số của frame
             width: Chiều rộng frame
             height: Chiều cao frame
+            fps: FPS hiện tại của camera
+            motion_gate: Cổng chuyển động của phiên (nếu có), dùng lại kết quả khi khung cảnh không đổi
+            prefilter: Bộ lọc màu lửa của phiên (nếu có), bỏ qua model khi không có màu lửa
+            renderer: Bộ vẽ lớp phủ của phiên (nếu None, tạo mới cho frame này)
             
         Returns:
             Tuple[np.ndarray, Dict[str, Any]]: Frame đã xử lý và thông tin kèm theo
         """
+        if renderer is None:
+            renderer = FrameRenderer()
         try:
             # Đảo ngược hình ảnh camera để phù hợp hiển thị
             frame = cv2.flip(frame, 1)
             current_time = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
             
-            # Phát hiện đám cháy bằng mô hình
-            results = self.fire_detection_service.model.predict(
-                frame, save=False, save_txt=False, conf=0.5, verbose=False
-            )[0]
+            # Khung cảnh không đổi so với frame suy luận gần nhất thì dùng lại kết quả cũ
+            results = None
+            inference_reused = False
+            if motion_gate is not None and not motion_gate.should_infer(frame, time.time()):
+                results = motion_gate.last_result
+                inference_reused = results is not None
+            
+            # Phát hiện đám cháy bằng mô hình, kết quả được chép sang bộ nhớ host một lần
+            if results is None:
+                result = self.fire_detection_service.predict(frame, prefilter, conf=0.5)[0]
+                results = (results_to_detections(result), results_to_masks(result))
+                if motion_gate is not None:
+                    motion_gate.last_result = results
             
-            detections = results.boxes
-            segments = getattr(results, 'masks', None)
+            detections, segments = results
+            fire_detections = fire_only(detections)  # Class 0 là đám cháy
+            fire_detected = len(fire_detections) > 0
             
-            # Xử lý phân đoạn nếu có
+            # Xử lý phân đoạn nếu có: tô tất cả mask trong một lượt trên mask hợp nhất
+            # Sử dụng cùng màu với bounding box (255, 0, 0), cộng màu với alpha 0.7 để nổi bật hơn
             if segments is not None:
-                masks = segments.data.cpu().numpy()
-                for mask in masks:
-                    mask_resized = cv2.resize(mask, (frame.shape[1], frame.shape[0]))
-                    colored_mask = np.zeros_like(frame, dtype=np.uint8)
-                    # Sử dụng cùng màu với bounding box (255, 0, 0) - màu đỏ trong BGR
-                    colored_mask[mask_resized > 0.5] = (255, 0, 0)
-                    # Tăng alpha cho mask để nổi bật hơn (giá trị từ 0.3 đến 0.7 là phù hợp)
-                    frame = cv2.addWeighted(frame, 1.0, colored_mask, 0.7, 0)
-            
-            # Phân tích các phát hiện
-            total_fire_area = 0.0
-            fire_detected = False
+                # Diện tích từ mask hợp nhất, các vùng chồng lấn không bị đếm hai lần
+                total_fire_area = renderer.draw_masks(frame, segments, color=(255, 0, 0), alpha=0.7, additive=True)
+            else:
+                # Tính diện tích theo box khi model không trả về mask
+                total_fire_area = box_area_percent(fire_detections, width, height)
             
             # Hiển thị FPS ở góc trái
             fps_text = f"FPS: {fps}"
             cv2.putText(frame, fps_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
             
-            # Vẽ bounding box và tính toán diện tích
-            for det in detections:
-                if int(det.cls[0].item()) == 0:  # Class 0 là đám cháy
-                    x1, y1, x2, y2 = det.xyxy[0].cpu().numpy().astype(int)
-                    conf = float(det.conf[0].item())
-                    
-                    # Vẽ bounding box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 4)
-                    label = f"{conf:.2f}"
-                    cv2.putText(frame, label, (x1 + 3, y1 - 4),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                    
-                    # Tính diện tích
-                    area = ((x2 - x1) * (y2 - y1)) / (width * height) * 100
-                    total_fire_area += area
-                    fire_detected = True
+            # Vẽ tất cả bounding box lửa trong một lần gọi
+            renderer.draw_boxes(frame, fire_detections, color=(255, 0, 0),
+                                font_scale=1, label_background=False, show_track_id=False)
             
             # Mã hóa frame thành base64 để gửi qua WebSocket
             _, buffer = cv2.imencode('.jpg', frame)
@@ -225,6 +245,7 @@ class CameraController:
                 "fire_detected": fire_detected,
                 "total_area": round(total_fire_area, 4),
                 "fps": fps,
+                "inference_reused": inference_reused,
                 "frame": frame_b64
             }
             
@@ -1,19 +1,25 @@
 import os
 import uuid
 import logging
+import asyncio
+import tempfile
 from typing import List, Optional, Tuple, Dict, Any, BinaryIO
 from datetime import datetime
 from fastapi import UploadFile, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
+from app.core.config import settings
 from app.models import User, Video, FireDetection, UserHistory, Notification
 from app.schemas import VideoCreate, VideoUpdate
 from app.models.enums import VideoTypeEnum, StatusEnum
 from app.utils.video import save_upload_file, download_youtube_video
-from app.utils.cloudinary_service import upload_bytes_to_cloudinary, download_from_cloudinary, delete_from_cloudinary
+from app.utils.cloudinary_service import upload_bytes_to_cloudinary, upload_stream_to_cloudinary, download_cloudinary_file, delete_from_cloudinary
 from app.utils.email_service import send_fire_detection_notification
-from app.services.fire_detection import FireDetectionService
+from app.services.model_registry import model_registry
+from app.services.result_cache import get_result_cache
+from app.services.detection_timeline import TimelineWriter, delete_timeline, encode_timeline_response, open_timeline, store_timeline
+from app.services.timeline_render import render_from_timeline
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +29,6 @@ class VideoController:
     Controller xử lý logic nghiệp vụ liên quan đến video
     """
     
-    fire_service = FireDetectionService()
-    
     @staticmethod
     def get_video_by_id(db: Session, video_id: uuid.UUID) -> Optional[Video]:
         """Lấy video theo ID"""
@@ -206,37 +210,42 @@ class VideoController:
         video.status = StatusEnum.PROCESSING
         db.commit()
         
+        fire_service = None
+        temp_output_path = None
+        timeline_writer = None
         try:
-            # Tải xuống video từ Cloudinary URL vào bộ nhớ
-            logger.info(f"Tải xuống video từ Cloudinary: {video.video_url}")
-            success, message, video_data = download_from_cloudinary(video.video_url)
+            # Lấy model dùng chung từ registry (chỉ tải một lần cho toàn tiến trình)
+            fire_service = await asyncio.to_thread(model_registry.acquire)
+            
+            # Lấy video gốc qua cache trên ổ đĩa (chỉ tải từ Cloudinary ở lần xử lý đầu tiên)
+            logger.info(f"Tải xuống video từ Cloudinary: {video.original_video_url}")
+            success, message, video_path = download_cloudinary_file(video.original_video_url)
             
-            if not success or not video_data:
+            if not success or not video_path:
                 logger.error(f"Không thể tải xuống video: {message}")
                 raise Exception(f"Không thể tải xuống video: {message}")
             
-            # Phát hiện đám cháy trực tiếp từ dữ liệu nhị phân
+            # Phát hiện đám cháy và đánh dấu video trong một lượt giải mã, một lượt suy luận
             logger.info(f"Bắt đầu phát hiện đám cháy")
+            temp_output = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=settings.TEMP_DIR)
+            temp_output_path = temp_output.name
+            temp_output.close()
             
             # Thử phát hiện đám cháy với số lần thử tối đa
             max_retries = 3
             current_retry = 0
             
+            # (registry chỉ trả về service đã tải model, không cần tải lại model ở đây)
             while current_retry < max_retries:
-                if not VideoController.fire_service.model:
-                    logger.warning(f"Model YOLO chưa được tải. Đang thử tải lại model (lần {current_retry + 1}/{max_retries}).")
-                    if VideoController.fire_service.load_model():
-                        logger.info("Đã tải lại model YOLO thành công")
-                    else:
-                        logger.error("Không thể tải lại model YOLO")
-                        current_retry += 1
-                        if current_retry >= max_retries:
-                            raise Exception("Không thể tải model YOLO sau nhiều lần thử, không thể tiếp tục xử lý")
-                        continue
-                
                 try:
-                    # Thử phát hiện đám cháy
-                    fire_detected, detections, max_fire_frame = VideoController.fire_service.detect_fire_from_memory(video_data)
+                    # Thử phân tích video (timeline phát hiện theo từng frame được ghi dần trong lúc phân tích)
+                    if settings.TIMELINE_ENABLED:
+                        if timeline_writer is not None:
+                            # Bỏ timeline dở dang của lần thử trước
+                            timeline_writer.close()
+                        timeline_writer = TimelineWriter(temp_output_path + ".fdtl")
+                    analysis = fire_service.analyze_video(video_path, output_path=temp_output_path,
+                                                          timeline=timeline_writer)
                     break  # Nếu không có lỗi, thoát khỏi vòng lặp
                 except Exception as e:
                     logger.error(f"Lỗi khi phát hiện đám cháy: {str(e)}")
@@ -244,19 +253,18 @@ class VideoController:
                     if current_retry >= max_retries:
                         raise Exception(f"Không thể phát hiện đám cháy sau nhiều lần thử: {str(e)}")
             
-            # Xử lý video (đánh dấu vùng phát hiện đám cháy)
-            logger.info(f"Xử lý video với vùng phát hiện đám cháy trong bộ nhớ")
-            success, processed_video_data, detection_info = VideoController.fire_service.process_video_from_memory(video_data)
+            detections = analysis["detections"]
+            max_fire_frame = analysis["max_fire_frame"]
             
-            if not success or not processed_video_data:
+            if not os.path.exists(temp_output_path) or os.path.getsize(temp_output_path) == 0:
                 logger.error("Không thể xử lý video")
                 raise Exception("Không thể xử lý video")
             
             # Tải video đã xử lý lên Cloudinary
             processed_filename = f"processed_{uuid.uuid4()}.mp4"
             logger.info(f"Tải video đã xử lý lên Cloudinary")
-            upload_success, upload_message, result = upload_bytes_to_cloudinary(
-                processed_video_data, 
+            upload_success, upload_message, result = upload_stream_to_cloudinary(
+                temp_output_path, 
                 filename=processed_filename
             )
             
@@ -276,6 +284,15 @@ class VideoController:
             video.status = StatusEnum.COMPLETED
             video.processed_video_url = processed_video_url
             video.cloudinary_processed_id = cloudinary_processed_id
+            
+            # Lưu timeline mới, bỏ timeline của lần xử lý trước
+            if timeline_writer is not None:
+                timeline_url = store_timeline(timeline_writer.close(), uuid.uuid4().hex)
+                if timeline_url:
+                    if video.timeline_url and not VideoController._is_shared_asset(db, Video.timeline_url, video.timeline_url, video_id):
+                        delete_timeline(video.timeline_url)
+                        get_result_cache().invalidate_asset(video.timeline_url)
+                    video.timeline_url = timeline_url
             db.commit()
             
             # Nếu phát hiện đám cháy, chỉ gửi email nếu user bật nhận cảnh báo qua email
@@ -308,6 +325,23 @@ class VideoController:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Lỗi khi xử lý video: {str(e)}"
             )
+        finally:
+            if fire_service is not None:
+                model_registry.release(fire_service)
+            if temp_output_path and os.path.exists(temp_output_path):
+                os.remove(temp_output_path)
+            if timeline_writer is not None:
+                timeline_writer.close()
+                if os.path.exists(timeline_writer.path):
+                    os.remove(timeline_writer.path)
+    
+    @staticmethod
+    def _is_shared_asset(db: Session, column, value: str, video_id: uuid.UUID) -> bool:
+        """
+        Kiểm tra tài nguyên (video trên Cloudinary, timeline) còn được bản ghi video khác tham chiếu không.
+        Video tải lên lại dùng lại kết quả đã phân tích nên dùng chung tài nguyên với bản ghi cũ.
+        """
+        return db.query(Video).filter(column == value, Video.video_id != video_id).first() is not None
     
     @staticmethod
     def delete_video(db: Session, video_id: uuid.UUID, user_id: uuid.UUID, is_admin: bool = False) -> None:
@@ -329,20 +363,31 @@ class VideoController:
                 detail="Không có quyền xóa video này"
             )
         
+        # Tài nguyên dùng chung với bản ghi khác (video tải lên lại) chỉ bị xóa khi không còn ai tham chiếu
+        def is_shared(column, value) -> bool:
+            return VideoController._is_shared_asset(db, column, value, video_id)
+        
         # Xóa video gốc từ Cloudinary nếu có
-        if video.cloudinary_public_id:
+        if video.cloudinary_public_id and not is_shared(Video.cloudinary_public_id, video.cloudinary_public_id):
             try:
                 delete_from_cloudinary(video.cloudinary_public_id)
+                get_result_cache().invalidate_asset(video.cloudinary_public_id)
             except Exception as e:
                 logger.error(f"Lỗi khi xóa video gốc từ Cloudinary: {str(e)}")
         
         # Xóa video đã xử lý từ Cloudinary nếu có
-        if video.cloudinary_processed_id:
+        if video.cloudinary_processed_id and not is_shared(Video.cloudinary_processed_id, video.cloudinary_processed_id):
             try:
                 delete_from_cloudinary(video.cloudinary_processed_id)
+                get_result_cache().invalidate_asset(video.cloudinary_processed_id)
             except Exception as e:
                 logger.error(f"Lỗi khi xóa video đã xử lý từ Cloudinary: {str(e)}")
         
+        # Xóa timeline phát hiện nếu có
+        if video.timeline_url and not is_shared(Video.timeline_url, video.timeline_url):
+            delete_timeline(video.timeline_url)
+            get_result_cache().invalidate_asset(video.timeline_url)
+        
         # Xóa các bản ghi liên quan trong database
         db.query(FireDetection).filter(FireDetection.video_id == video_id).delete()
         db.query(UserHistory).filter(UserHistory.video_id == video_id).delete()
@@ -352,6 +397,110 @@ class VideoController:
         db.delete(video)
         db.commit()
     
+    @staticmethod
+    def get_video_timeline(db: Session, video_id: uuid.UUID, start: int = 0, end: Optional[int] = None, step: int = 1) -> bytes:
+        """
+        Lấy timeline phát hiện theo từng frame của video trong đoạn [start, end)
+
+        Returns:
+            bytes: Khối nhị phân của encode_timeline_response
+        """
+        video = db.query(Video).filter(Video.video_id == video_id).first()
+        if not video or not video.timeline_url:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Video không có timeline phát hiện"
+            )
+        
+        try:
+            reader = open_timeline(video.timeline_url)
+            rows, boxes = reader.query(start, end, max(1, step))
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc timeline của video {video_id}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Không thể đọc timeline phát hiện"
+            )
+        return encode_timeline_response(reader.fps, rows, boxes)
+    
+    @staticmethod
+    def rerender_video(db: Session, video_id: uuid.UUID, min_confidence: float = 0.0, scale: float = 1.0,
+                       fill_alpha: float = 0.3, show_track_id: bool = True) -> Video:
+        """
+        Vẽ lại video đã xử lý từ video gốc và timeline phát hiện đã lưu (không chạy lại model),
+        dùng khi đổi ngưỡng hiển thị, kiểu lớp phủ hoặc độ phân giải đầu ra
+        """
+        video = VideoController.get_video_by_id(db, video_id)
+        if not video:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Không tìm thấy video"
+            )
+        if not video.timeline_url or not video.original_video_url:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Video chưa có timeline phát hiện, cần xử lý lại video"
+            )
+        if not 0 < scale <= 2 or not 0 <= fill_alpha <= 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Tham số vẽ lại không hợp lệ"
+            )
+        
+        temp_output_path = None
+        try:
+            success, message, video_path = download_cloudinary_file(video.original_video_url)
+            if not success or not video_path:
+                raise Exception(f"Không thể tải xuống video: {message}")
+            
+            temp_output = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=settings.TEMP_DIR)
+            temp_output_path = temp_output.name
+            temp_output.close()
+            
+            render_stats = render_from_timeline(
+                video_path,
+                open_timeline(video.timeline_url),
+                temp_output_path,
+                min_confidence=min_confidence,
+                scale=scale,
+                fill_alpha=fill_alpha,
+                show_track_id=show_track_id,
+            )
+            
+            upload_success, upload_message, result = upload_stream_to_cloudinary(
+                temp_output_path,
+                filename=f"processed_{uuid.uuid4()}.mp4"
+            )
+            if not upload_success:
+                raise Exception(f"Lỗi khi tải video đã vẽ lại lên Cloudinary: {upload_message}")
+            
+            # Bỏ video đã xử lý cũ nếu không còn bản ghi nào khác dùng
+            old_processed_id = video.cloudinary_processed_id
+            if old_processed_id and not VideoController._is_shared_asset(db, Video.cloudinary_processed_id, old_processed_id, video_id):
+                try:
+                    delete_from_cloudinary(old_processed_id)
+                    get_result_cache().invalidate_asset(old_processed_id)
+                except Exception as e:
+                    logger.error(f"Lỗi khi xóa video đã xử lý cũ từ Cloudinary: {str(e)}")
+            
+            video.processed_video_url = result.get("secure_url")
+            video.cloudinary_processed_id = result.get("public_id")
+            db.commit()
+            logger.info(f"Đã vẽ lại video {video_id} từ timeline: {render_stats}")
+            return video
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi vẽ lại video: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Lỗi khi vẽ lại video: {str(e)}"
+            )
+        finally:
+            if temp_output_path and os.path.exists(temp_output_path):
+                os.remove(temp_output_path)
+    
     @staticmethod
     def _send_fire_notification(db: Session, video: Video, detections: List[Dict]):
         """Gửi thông báo khi phát hiện đám cháy"""
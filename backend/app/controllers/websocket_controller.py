@@ -1,6 +1,8 @@
+import os
 import json
 import asyncio
 import uuid
+import tempfile
 import logging
 from typing import Dict, List, Any, Optional
 import traceback
@@ -9,12 +11,16 @@ from fastapi import WebSocket, WebSocketDisconnect, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
+from app.core.config import settings
 from app.models import Video, FireDetection, UserHistory
 from app.models.enums import StatusEnum
-from app.services.fire_detection import FireDetectionService
-from app.utils.cloudinary_service import upload_bytes_to_cloudinary, download_from_cloudinary
+from app.services.model_registry import model_registry
+from app.services.result_cache import get_result_cache
+from app.services.detection_timeline import TimelineWriter, delete_timeline, store_timeline
+from app.utils.cloudinary_service import upload_bytes_to_cloudinary, upload_stream_to_cloudinary, download_cloudinary_file
 from app.utils.video import download_youtube_video
 from app.controllers.user_history_controller import UserHistoryController
+from app.controllers.video_controller import VideoController
 
 
 logger = logging.getLogger(__name__)
@@ -25,8 +31,6 @@ class WebSocketController:
     Controller xử lý logic liên quan đến WebSocket cho xử lý video
     """
     
-    fire_service = FireDetectionService()
-    
     @staticmethod
     async def process_video_by_id(websocket: WebSocket, video_id: uuid.UUID, db: Session):
         """
@@ -56,17 +60,23 @@ class WebSocketController:
             video.status = StatusEnum.PROCESSING
             db.commit()
             
+            fire_service = None
+            temp_output_path = None
+            timeline_writer = None
             try:
-                # Tải xuống video từ Cloudinary URL vào bộ nhớ
+                # Lấy model dùng chung từ registry (chỉ tải một lần cho toàn tiến trình)
+                fire_service = await asyncio.to_thread(model_registry.acquire)
+                
+                # Lấy video gốc qua cache trên ổ đĩa (chỉ tải từ Cloudinary ở lần xử lý đầu tiên)
                 await websocket.send_json({
                     "status": "processing",
                     "message": "Đang tải xuống video...",
                     "progress": 10
                 })
                 
-                success, message, video_data = download_from_cloudinary(video.video_url)
+                success, message, video_path = await asyncio.to_thread(download_cloudinary_file, video.original_video_url)
                 
-                if not success or not video_data:
+                if not success or not video_path:
                     logger.error(f"Không thể tải xuống video: {message}")
                     raise Exception(f"Không thể tải xuống video: {message}")
                 
@@ -77,18 +87,18 @@ class WebSocketController:
                     "progress": 30
                 })
                 
-                # Tải model nếu cần
-                if not WebSocketController.fire_service.model:
-                    await websocket.send_json({
-                        "status": "processing",
-                        "message": "Đang tải model AI...",
-                        "progress": 35
-                    })
-                    if not WebSocketController.fire_service.load_model():
-                        raise Exception("Không thể tải model YOLO")
-                
-                # Phát hiện đám cháy
-                fire_detected, detections, max_fire_frame = WebSocketController.fire_service.detect_fire_from_memory(video_data)
+                # Phát hiện đám cháy và đánh dấu video trong một lượt giải mã, một lượt suy luận
+                temp_output = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=settings.TEMP_DIR)
+                temp_output_path = temp_output.name
+                temp_output.close()
+                # Timeline phát hiện theo từng frame được ghi dần trong lúc phân tích
+                if settings.TIMELINE_ENABLED:
+                    timeline_writer = TimelineWriter(temp_output_path + ".fdtl")
+                analysis = await asyncio.to_thread(fire_service.analyze_video, video_path, temp_output_path,
+                                                   timeline=timeline_writer)
+                fire_detected = analysis["fire_detected"]
+                detections = analysis["detections"]
+                max_fire_frame = analysis["max_fire_frame"]
                 
                 # Gửi kết quả phát hiện
                 await websocket.send_json({
@@ -99,10 +109,7 @@ class WebSocketController:
                     "detections_count": len(detections)
                 })
                 
-                # Xử lý video với vùng phát hiện
-                success, processed_video_data, detection_info = WebSocketController.fire_service.process_video_from_memory(video_data)
-                
-                if not success or not processed_video_data:
+                if not os.path.exists(temp_output_path) or os.path.getsize(temp_output_path) == 0:
                     raise Exception("Không thể xử lý video")
                 
                 # Tải video đã xử lý lên Cloudinary
@@ -113,8 +120,8 @@ class WebSocketController:
                 })
                 
                 processed_filename = f"processed_{uuid.uuid4()}.mp4"
-                upload_success, upload_message, result = upload_bytes_to_cloudinary(
-                    processed_video_data, 
+                upload_success, upload_message, result = upload_stream_to_cloudinary(
+                    temp_output_path, 
                     filename=processed_filename
                 )
                 
@@ -134,6 +141,15 @@ class WebSocketController:
                 video.status = StatusEnum.COMPLETED
                 video.processed_video_url = processed_video_url
                 video.cloudinary_processed_id = cloudinary_processed_id
+                
+                # Lưu timeline mới, bỏ timeline của lần xử lý trước
+                if timeline_writer is not None:
+                    timeline_url = await asyncio.to_thread(store_timeline, timeline_writer.close(), uuid.uuid4().hex)
+                    if timeline_url:
+                        if video.timeline_url and not VideoController._is_shared_asset(db, Video.timeline_url, video.timeline_url, video_id):
+                            await asyncio.to_thread(delete_timeline, video.timeline_url)
+                            await asyncio.to_thread(get_result_cache().invalidate_asset, video.timeline_url)
+                        video.timeline_url = timeline_url
                 db.commit()
                 
                 # Lưu các phát hiện vào cơ sở dữ liệu
@@ -172,7 +188,7 @@ class WebSocketController:
                     "progress": 100,
                     "fire_detected": has_fire,
                     "detections_count": len(detections),
-                    "video_url": video.video_url,
+                    "video_url": video.original_video_url,
                     "processed_video_url": processed_video_url
                 })
                 
@@ -207,6 +223,15 @@ class WebSocketController:
                         action_type="process_video_error",
                         description=f"Lỗi khi xử lý video: {str(e)}"
                     )
+            finally:
+                if fire_service is not None:
+                    model_registry.release(fire_service)
+                if temp_output_path and os.path.exists(temp_output_path):
+                    os.remove(temp_output_path)
+                if timeline_writer is not None:
+                    timeline_writer.close()
+                    if os.path.exists(timeline_writer.path):
+                        os.remove(timeline_writer.path)
         
         except WebSocketDisconnect:
             logger.warning(f"WebSocket bị đóng kết nối trong quá trình xử lý video {video_id}")
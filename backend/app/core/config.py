@@ -18,11 +18,61 @@ class Settings(BaseSettings):
     
     MODEL_PATH: str
     
+    # Cấu hình suy luận (inference)
+    INFERENCE_BACKEND: str = "torch"  # torch, onnx, openvino hoặc onnx_int8
+    INFERENCE_THREADS: int = 0  # Số luồng CPU cho suy luận (0 = dùng toàn bộ lõi)
+    INFERENCE_BATCH_SIZE: int = 1  # Số frame gom lại cho một lần suy luận (1 = từng frame)
+    INFERENCE_BATCH_MAX_WAIT_MS: int = 50  # Thời gian tối đa chờ gom đủ batch
+    
+    # Cấu hình hàng đợi giữa các luồng giải mã / suy luận / vẽ
+    FRAME_QUEUE_SIZE: int = 32  # Số frame thô tối đa chờ suy luận
+    RESULT_QUEUE_SIZE: int = 32  # Số kết quả tối đa chờ vẽ
+    QUEUE_POLICY: str = "block"  # block (xử lý offline, giữ đủ frame) hoặc drop_oldest
+    STREAM_QUEUE_SIZE: int = 4  # Số kết quả tối đa chờ coroutine WebSocket lấy (cầu nối luồng xử lý -> asyncio)
+    
+    # Cấu hình lập lịch suy luận (chọn frame cần phân tích)
+    ANALYSIS_TARGET_FPS: float = 15.0  # Số frame suy luận mỗi giây video (0 = mọi frame)
+    ANALYSIS_LATENCY_BUDGET_MS: int = 1000  # Độ trễ tối đa của một frame khi chỉ xem trực tiếp, không lưu kết quả (0 = không giới hạn)
+    ANALYSIS_MAX_GAP_MS: int = 500  # Khoảng cách tối đa giữa hai frame được suy luận (độ phủ tối thiểu)
+    
+    # Cấu hình cổng chuyển động (bỏ qua suy luận khi khung cảnh không đổi)
+    MOTION_GATE_ENABLED: bool = True
+    MOTION_GATE_WIDTH: int = 160  # Chiều rộng ảnh thu nhỏ dùng để so sánh
+    MOTION_PIXEL_THRESHOLD: int = 15  # Chênh lệch mức xám để coi một điểm ảnh là thay đổi
+    MOTION_CHANGED_RATIO: float = 0.001  # Tỉ lệ điểm ảnh thay đổi tối thiểu để chạy lại model
+    MOTION_MAX_STALENESS_MS: int = 2000  # Thời gian tối đa được dùng lại kết quả cũ
+    
+    # Cấu hình bộ lọc màu lửa trước model
+    PREFILTER_MODE: str = "off"  # off, on hoặc evaluate (luôn chạy model, đo recall bị mất)
+    PREFILTER_CROPS: bool = False  # Chỉ suy luận trên vùng cắt quanh điểm ảnh màu lửa
+    PREFILTER_WIDTH: int = 160  # Chiều rộng ảnh thu nhỏ dùng để kiểm tra màu
+    PREFILTER_MIN_PIXELS: int = 4  # Số điểm ảnh màu lửa tối thiểu để chạy model
+    
+    # Cấu hình theo dõi vùng cháy (tracker)
+    TRACKER_IOU_THRESHOLD: float = 0.3  # IoU tối thiểu để ghép box mới với vùng cháy đang theo dõi
+    TRACKER_MAX_MISSES: int = 1  # Số lần suy luận liên tiếp không thấy lại trước khi bỏ vùng cháy
+    TRACKER_MAX_AGE_FRAMES: int = 30  # Số frame tối đa giữ vùng cháy kể từ lần phát hiện cuối
+    
+    # Cấu hình mã hóa frame xem trước gửi qua WebSocket
+    PREVIEW_MAX_WIDTH: int = 960  # Chiều rộng tối đa của frame xem trước (0 = giữ nguyên độ phân giải gốc)
+    PREVIEW_MIN_WIDTH: int = 320  # Chiều rộng thấp nhất khi mạng chậm
+    PREVIEW_JPEG_QUALITY: int = 80  # Chất lượng JPEG ban đầu (và tối đa)
+    PREVIEW_MIN_QUALITY: int = 40  # Chất lượng JPEG thấp nhất khi mạng chậm
+    PREVIEW_TARGET_SEND_MS: int = 50  # Thời gian gửi mục tiêu mỗi frame (0 = không tự điều chỉnh)
+    PREVIEW_ENCODER_THREADS: int = 2  # Số luồng mã hóa JPEG
+    PREVIEW_USE_TURBOJPEG: bool = False  # Dùng libjpeg-turbo (cần cài PyTurboJPEG), nếu không có thì dùng OpenCV
+    
+    # Cấu hình lượng tử hóa INT8 (backend onnx_int8)
+    QUANT_CALIBRATION_DIR: str = "./model/calibration"  # Thư mục ảnh/video cục bộ dùng để hiệu chuẩn
+    QUANT_CALIBRATION_FRAMES: int = 64
+    
     # Cấu hình Cloudinary
     CLOUDINARY_CLOUD_NAME: str
     CLOUDINARY_API_KEY: str
     CLOUDINARY_API_SECRET: str
     CLOUDINARY_FOLDER: str = "fire_detection"
+    CLOUDINARY_UPLOAD_CHUNK_SIZE: int = 20 * 1024 * 1024  # Kích thước mỗi phần khi tải video lên theo phần (tối thiểu 5 MB)
+    CLOUDINARY_UPLOAD_PREFIX: Optional[str] = None  # Địa chỉ API tải lên thay thế (vd. server giả lập cục bộ khi kiểm thử)
     DELETE_LOCAL_FILES_AFTER_UPLOAD: bool = True
     
     # Cấu hình Email (SMTP)
@@ -35,6 +85,29 @@ class Settings(BaseSettings):
     
     # Thư mục tạm của hệ thống
     TEMP_DIR: str = tempfile.gettempdir()
+    # Thời gian giữ phiên tải lên theo phần còn dở dang để client kết nối lại và gửi tiếp
+    CHUNK_UPLOAD_TTL_S: int = 1800
+    # Giới hạn cho tải lên theo phần (thông tin file do client gửi, kiểm tra trước khi cấp phát file spool)
+    MAX_UPLOAD_SIZE: int = 2 * 1024 * 1024 * 1024  # Kích thước file tối đa (byte)
+    CHUNK_UPLOAD_MAX_CHUNKS: int = 10000  # Số phần tối đa của một file
+    CHUNK_UPLOAD_MAX_SESSIONS: int = 3  # Số phiên tải lên dở dang tối đa của một client (người dùng hoặc địa chỉ IP)
+    
+    # Cache trên ổ đĩa cho video tải về từ Cloudinary (phân tích lại không cần tải lại)
+    DOWNLOAD_CACHE_DIR: Optional[str] = None  # Mặc định TEMP_DIR/fire_detection_cache
+    DOWNLOAD_CACHE_MAX_MB: int = 2048  # Tổng dung lượng tối đa, vượt quá thì xóa file ít dùng gần đây nhất
+    DOWNLOAD_POOL_SIZE: int = 8  # Số kết nối giữ trong pool HTTP
+    DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024  # Kích thước mỗi lần đọc khi tải dạng stream
+    
+    # Cache kết quả phân tích theo nội dung video (video giống hệt không phải phân tích lại)
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_ENTRIES: int = 500
+    RESULT_CACHE_PATH: Optional[str] = None  # Mặc định TEMP_DIR/fire_detection_results.json
+    
+    # Timeline phát hiện theo từng frame (lưu dạng cột, nén theo khối)
+    TIMELINE_ENABLED: bool = True
+    TIMELINE_STORAGE: str = "local"  # local (thư mục TIMELINE_DIR) hoặc cloudinary (tài nguyên raw)
+    TIMELINE_DIR: str = "./data/timelines"
+    TIMELINE_BLOCK_FRAMES: int = 512  # Số frame mỗi khối nén (truy vấn một đoạn chỉ giải nén các khối liên quan)
     
     class Config:
         env_file = ".env"
@@ -9,6 +9,7 @@ from fastapi.templating import Jinja2Templates
 from app.api.api import api_router
 from app.core.config import settings
 from app.utils.cloudinary_service import init_cloudinary
+from app.services.model_registry import model_registry
 
 # Thiết lập logging
 logging.basicConfig(
@@ -45,6 +46,13 @@ init_cloudinary()
 # Đăng ký router API
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.on_event("shutdown")
+def release_models():
+    """
+    Giải phóng các model dùng chung khi tắt ứng dụng
+    """
+    model_registry.unload_all()
+
 @app.get("/")
 def read_root():
     """
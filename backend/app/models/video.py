@@ -24,6 +24,7 @@ class Video(Base):
     file_name = Column(String(255), nullable=True)  # Tên file video gốc hoặc tiêu đề YouTube
     cloudinary_public_id = Column(String(255), nullable=True)  # ID công khai của video gốc trên Cloudinary
     cloudinary_processed_id = Column(String(255), nullable=True)  # ID công khai của video đã xử lý trên Cloudinary
+    timeline_url = Column(String(255), nullable=True)  # Timeline phát hiện theo từng frame (đường dẫn cục bộ hoặc URL Cloudinary)
     created_at = Column(DateTime, default=utcnow_vn)
     updated_at = Column(DateTime, default=utcnow_vn, onupdate=utcnow_vn)
     
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Iterator, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Đánh dấu generator đã chạy hết
+_END = object()
+
+
+class _PipelineError:
+    """Ngoại lệ xảy ra trong luồng xử lý, được ném lại ở phía coroutine"""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class AsyncFrameStream:
+    """
+    Cầu nối không chặn giữa generator đồng bộ (vd. predict_and_display) và coroutine WebSocket.
+    Generator (đọc kết quả, vẽ) và bước biến đổi từng phần tử (vd. mã hóa JPEG) chạy trên một
+    luồng riêng; kết quả được chuyển sang event loop qua asyncio.Queue có giới hạn. Hàng đợi đầy
+    thì luồng xử lý chờ (backpressure), event loop không bao giờ bị chặn nên một phiên xử lý
+    nặng không làm tăng độ trễ của các kết nối khác trên cùng worker.
+
+    Sử dụng:
+        async with AsyncFrameStream(lambda: predict_and_display(...), transform=encode) as stream:
+            async for item in stream:
+                ...
+    """
+
+    def __init__(self, generator_factory: Callable[[], Iterator[Any]],
+                 transform: Optional[Callable[[Any], Any]] = None, maxsize: Optional[int] = None):
+        """
+        Args:
+            generator_factory: Hàm tạo generator, được gọi trên luồng xử lý
+            transform: Hàm biến đổi từng phần tử, chạy trên luồng xử lý trước khi chuyển cho coroutine
+            maxsize: Số phần tử tối đa chờ coroutine lấy (mặc định settings.STREAM_QUEUE_SIZE)
+        """
+        self._generator_factory = generator_factory
+        self._transform = transform
+        self._maxsize = max(1, maxsize if maxsize is not None else settings.STREAM_QUEUE_SIZE)
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._finished = False
+
+        self.items = 0
+        self.blocked_puts = 0
+
+    async def start(self) -> "AsyncFrameStream":
+        """Khởi động luồng xử lý (gọi tự động khi dùng async with)"""
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue(maxsize=self._maxsize)
+            self._thread = threading.Thread(target=self._run, name="async-frame-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def _put(self, item: Any) -> None:
+        """Chuyển một phần tử sang event loop, chờ khi hàng đợi đầy"""
+        if self._queue.full():
+            self.blocked_puts += 1
+        try:
+            asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+        except RuntimeError:
+            # Event loop đã đóng, không còn ai nhận kết quả
+            self._stop_event.set()
+
+    def _run(self) -> None:
+        generator = None
+        try:
+            generator = self._generator_factory()
+            for item in generator:
+                if self._stop_event.is_set():
+                    break
+                if self._transform is not None:
+                    item = self._transform(item)
+                self._put(item)
+                self.items += 1
+            if not self._stop_event.is_set():
+                self._put(_END)
+        except Exception as e:
+            logger.error(f"Lỗi trong luồng xử lý của AsyncFrameStream: {str(e)}")
+            if not self._stop_event.is_set():
+                self._put(_PipelineError(e))
+        finally:
+            # Đóng generator ngay trên luồng xử lý để giải phóng các luồng và file của pipeline
+            if generator is not None and hasattr(generator, "close"):
+                try:
+                    generator.close()
+                except Exception as e:
+                    logger.warning(f"Lỗi khi đóng generator: {str(e)}")
+
+    def __aiter__(self) -> "AsyncFrameStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._finished:
+            raise StopAsyncIteration
+        await self.start()
+        item = await self._queue.get()
+        if item is _END:
+            self._finished = True
+            raise StopAsyncIteration
+        if isinstance(item, _PipelineError):
+            self._finished = True
+            raise item.error
+        return item
+
+    async def aclose(self) -> None:
+        """Dừng luồng xử lý (kể cả khi generator chưa chạy hết) và chờ pipeline giải phóng tài nguyên"""
+        self._finished = True
+        self._stop_event.set()
+        if self._thread is None:
+            return
+        # Lấy bớt phần tử để luồng xử lý đang chờ hàng đợi được tiếp tục và thấy cờ dừng
+        while self._thread.is_alive():
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            await asyncio.to_thread(self._thread.join, 0.1)
+
+    async def __aenter__(self) -> "AsyncFrameStream":
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
@@ -0,0 +1,270 @@
+import os
+import math
+import errno
+import time
+import uuid
+import zlib
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Thuật toán checksum hỗ trợ cho từng phần (client trên trình duyệt dùng được sha256 qua crypto.subtle)
+CHECKSUM_ALGORITHMS = ("sha256", "md5", "crc32")
+
+
+def compute_checksum(data: bytes, algorithm: str = "sha256") -> str:
+    """Tính checksum (chuỗi hex) của một phần dữ liệu"""
+    if algorithm == "crc32":
+        return f"{zlib.crc32(data) & 0xFFFFFFFF:08x}"
+    if algorithm in ("sha256", "md5"):
+        return hashlib.new(algorithm, data).hexdigest()
+    raise ValueError(f"Thuật toán checksum không hỗ trợ: {algorithm}. Hỗ trợ: {', '.join(CHECKSUM_ALGORITHMS)}")
+
+
+class ChunkError(ValueError):
+    """Phần dữ liệu không hợp lệ (sai chỉ số, sai kích thước hoặc sai checksum), client có thể gửi lại"""
+
+
+class ChunkedUpload:
+    """
+    Phiên nhận một file theo từng phần, ghi thẳng từng phần vào đúng vị trí trong file spool
+    đã cấp phát trước. Các phần có thể đến không theo thứ tự, mỗi phần được kiểm tra checksum,
+    và client kết nối lại có thể hỏi các phần còn thiếu để gửi tiếp. Bộ nhớ chỉ giữ một phần tại một thời điểm.
+    """
+
+    def __init__(self, upload_id: str, file_size: int, total_chunks: int, chunk_size: int,
+                 file_name: str = "uploaded_video.mp4", mime_type: str = "video/mp4", directory: Optional[str] = None,
+                 owner: Optional[str] = None):
+        """
+        Args:
+            upload_id: ID phiên tải lên (dùng để tiếp tục sau khi kết nối lại)
+            file_size: Kích thước file (byte)
+            total_chunks: Số phần
+            chunk_size: Kích thước mỗi phần (trừ phần cuối) theo cách client chia file, bắt buộc
+            file_name: Tên file gốc
+            mime_type: Kiểu MIME
+            directory: Thư mục chứa file spool (mặc định settings.TEMP_DIR)
+            owner: Client tạo phiên (chỉ client này được tiếp tục phiên)
+
+        Raises:
+            ValueError: Thông tin file không hợp lệ hoặc vượt giới hạn
+            OSError: Không cấp phát được file spool (vd. hết dung lượng ổ đĩa)
+        """
+        # Thông tin file do client gửi: kiểm tra giới hạn trước khi cấp phát ổ đĩa và bộ nhớ
+        try:
+            file_size, total_chunks, chunk_size = int(file_size), int(total_chunks), int(chunk_size)
+        except (TypeError, ValueError):
+            raise ValueError(f"Thông tin file không hợp lệ: file_size={file_size}, total_chunks={total_chunks}, "
+                             f"chunk_size={chunk_size} (cần gửi chunkSize)")
+        if file_size <= 0 or total_chunks <= 0 or chunk_size <= 0:
+            raise ValueError(f"Thông tin file không hợp lệ: file_size={file_size}, total_chunks={total_chunks}, chunk_size={chunk_size}")
+        if file_size > settings.MAX_UPLOAD_SIZE:
+            raise ValueError(f"File quá lớn: {file_size/1024/1024:.2f} MB, tối đa {settings.MAX_UPLOAD_SIZE/1024/1024:.0f} MB")
+        if total_chunks > settings.CHUNK_UPLOAD_MAX_CHUNKS:
+            raise ValueError(f"Quá nhiều phần: {total_chunks}, tối đa {settings.CHUNK_UPLOAD_MAX_CHUNKS}")
+        if math.ceil(file_size / chunk_size) != total_chunks:
+            raise ValueError(f"Kích thước phần không khớp: {total_chunks} phần x {chunk_size} byte cho file {file_size} byte")
+
+        self.upload_id = upload_id
+        self.file_size = file_size
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.owner = owner
+        self.received = [False] * total_chunks
+        self.received_chunks = 0
+        self.updated_at = time.time()
+        self._lock = threading.Lock()
+        # sha256 của toàn bộ file, tính dần theo phần đầu liên tục đã nhận (phần đến đúng thứ tự được băm ngay)
+        self._digest = hashlib.sha256()
+        self._hashed_chunks = 0
+
+        # Cấp phát trước toàn bộ file để ghi từng phần vào đúng vị trí
+        suffix = os.path.splitext(file_name)[1] or ".mp4"
+        fd, self.path = tempfile.mkstemp(suffix=suffix, prefix="upload_", dir=directory or settings.TEMP_DIR)
+        try:
+            try:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, file_size)
+                else:
+                    os.ftruncate(fd, file_size)
+            except OSError as e:
+                # Hệ thống file không hỗ trợ cấp phát trước thì tạo file thưa; hết dung lượng thì báo lỗi
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                os.ftruncate(fd, file_size)
+        except OSError:
+            os.close(fd)
+            os.remove(self.path)
+            raise
+        self._file = os.fdopen(fd, "r+b", buffering=0)
+
+    @property
+    def complete(self) -> bool:
+        return self.received_chunks == self.total_chunks
+
+    def chunk_length(self, index: int) -> int:
+        """Kích thước đúng của phần thứ index"""
+        if index < 0 or index >= self.total_chunks:
+            raise ChunkError(f"Chỉ số chunk không hợp lệ: {index}/{self.total_chunks}")
+        return min(self.chunk_size, self.file_size - index * self.chunk_size)
+
+    def write_chunk(self, index: int, data: bytes, checksum: Optional[str] = None, algorithm: str = "sha256") -> bool:
+        """
+        Kiểm tra và ghi một phần vào file spool
+
+        Args:
+            index: Chỉ số phần
+            data: Dữ liệu của phần
+            checksum: Checksum (hex) client tính, None để bỏ qua kiểm tra
+            algorithm: Thuật toán checksum
+
+        Returns:
+            bool: False nếu phần này đã nhận trước đó (gửi trùng, bỏ qua)
+
+        Raises:
+            ChunkError: Sai chỉ số, sai kích thước hoặc sai checksum
+        """
+        expected = self.chunk_length(index)
+        if len(data) != expected:
+            raise ChunkError(f"Phần {index} có kích thước {len(data)} byte, cần {expected} byte")
+        if checksum is not None:
+            actual = compute_checksum(data, algorithm)
+            if actual != checksum.lower():
+                raise ChunkError(f"Sai checksum ở phần {index}")
+
+        with self._lock:
+            if self.received[index]:
+                return False
+            self._file.seek(index * self.chunk_size)
+            self._file.write(data)
+            self.received[index] = True
+            self.received_chunks += 1
+            self.updated_at = time.time()
+            self._advance_digest(index, data)
+        return True
+
+    def _advance_digest(self, index: int, data: bytes) -> None:
+        """Băm tiếp các phần liên tục đã nhận (gọi khi đang giữ self._lock)"""
+        while self._hashed_chunks < self.total_chunks and self.received[self._hashed_chunks]:
+            if self._hashed_chunks == index:
+                self._digest.update(data)
+            else:
+                # Phần đến trước thứ tự đã nằm trên ổ đĩa (seek + read thay cho os.pread để chạy được trên Windows)
+                self._file.seek(self._hashed_chunks * self.chunk_size)
+                self._digest.update(self._file.read(self.chunk_length(self._hashed_chunks)))
+            self._hashed_chunks += 1
+
+    @property
+    def content_hash(self) -> Optional[str]:
+        """sha256 (hex) của file, None nếu chưa nhận đủ"""
+        if self._hashed_chunks < self.total_chunks:
+            return None
+        return self._digest.hexdigest()
+
+    def missing_chunks(self) -> List[int]:
+        """Danh sách chỉ số các phần chưa nhận"""
+        return [index for index, received in enumerate(self.received) if not received]
+
+    def finish(self) -> str:
+        """Đóng file spool sau khi nhận đủ, trả về đường dẫn (người gọi chịu trách nhiệm xóa)"""
+        if not self.complete:
+            raise ChunkError(f"Còn thiếu {self.total_chunks - self.received_chunks} phần")
+        with self._lock:
+            # Băm nốt các phần chưa băm từ file spool để content_hash luôn có giá trị sau khi hoàn tất
+            self._advance_digest(-1, b"")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return self.path
+
+    def discard(self) -> None:
+        """Hủy phiên, xóa file spool"""
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        if os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except Exception as e:
+                logger.warning(f"Không thể xóa file tạm: {str(e)}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "uploadId": self.upload_id,
+            "totalChunks": self.total_chunks,
+            "chunkSize": self.chunk_size,
+            "receivedChunks": self.received_chunks,
+            "missingChunks": self.missing_chunks(),
+        }
+
+
+class ChunkedUploadRegistry:
+    """
+    Giữ các phiên tải lên dở dang để client kết nối lại có thể tiếp tục.
+    Phiên không có phần mới trong CHUNK_UPLOAD_TTL_S giây bị hủy cùng file spool.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else settings.CHUNK_UPLOAD_TTL_S
+        self._uploads: Dict[str, ChunkedUpload] = {}
+        self._lock = threading.Lock()
+
+    def create(self, file_size: int, total_chunks: int, chunk_size: int,
+               file_name: str = "uploaded_video.mp4", mime_type: str = "video/mp4",
+               owner: Optional[str] = None) -> ChunkedUpload:
+        """
+        Tạo phiên tải lên mới
+
+        Raises:
+            ValueError: Thông tin file không hợp lệ hoặc client đã có quá nhiều phiên dở dang
+            OSError: Không cấp phát được file spool
+        """
+        self.cleanup_expired()
+        with self._lock:
+            sessions = sum(1 for upload in self._uploads.values() if upload.owner == owner)
+        if sessions >= settings.CHUNK_UPLOAD_MAX_SESSIONS:
+            raise ValueError(f"Đã có {sessions} phiên tải lên dở dang, hãy hoàn tất hoặc chờ phiên cũ hết hạn")
+        upload = ChunkedUpload(uuid.uuid4().hex, file_size, total_chunks, chunk_size, file_name, mime_type, owner=owner)
+        with self._lock:
+            self._uploads[upload.upload_id] = upload
+        logger.info(f"Tạo phiên tải lên {upload.upload_id}: {file_name} ({file_size/1024/1024:.2f} MB, {total_chunks} phần)")
+        return upload
+
+    def get(self, upload_id: Optional[str], owner: Optional[str] = None) -> Optional[ChunkedUpload]:
+        """Lấy phiên tải lên dở dang theo ID, None nếu không có, đã hết hạn hoặc thuộc client khác"""
+        self.cleanup_expired()
+        if not upload_id:
+            return None
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None or upload.owner != owner:
+            return None
+        return upload
+
+    def pop(self, upload_id: str) -> Optional[ChunkedUpload]:
+        """Bỏ phiên khỏi registry (khi đã nhận đủ, file spool thuộc về người gọi)"""
+        with self._lock:
+            return self._uploads.pop(upload_id, None)
+
+    def cleanup_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [upload for upload in self._uploads.values() if now - upload.updated_at > self.ttl]
+            for upload in expired:
+                del self._uploads[upload.upload_id]
+        for upload in expired:
+            logger.info(f"Hủy phiên tải lên hết hạn {upload.upload_id} ({upload.received_chunks}/{upload.total_chunks} phần)")
+            upload.discard()
+
+
+# Registry dùng chung cho toàn bộ ứng dụng
+chunked_uploads = ChunkedUploadRegistry()
@@ -0,0 +1,294 @@
+import os
+import zlib
+import struct
+import shutil
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.frame_protocol import BOX_DTYPE, pack_boxes
+from app.services.download_cache import get_download_cache
+from app.utils.cloudinary_service import upload_stream_to_cloudinary, delete_from_cloudinary
+
+logger = logging.getLogger(__name__)
+
+# Timeline phát hiện theo từng frame của một video, lưu dạng cột (mảng numpy kiểu cố định) và nén theo khối
+#   file:     header | khối | khối | ...
+#   khối:     header khối | zlib(mảng TIMELINE_DTYPE) | zlib(mảng BOX_DTYPE)
+# Mỗi khối chứa tối đa TIMELINE_BLOCK_FRAMES frame, truy vấn một đoạn chỉ giải nén các khối liên quan
+TIMELINE_VERSION = 1
+TIMELINE_MAGIC = b"FDTL"
+# magic, version, fps (little-endian, 16 byte)
+TIMELINE_HEADER = struct.Struct("<4sB3xd")
+# frame đầu, frame cuối, số frame, độ dài dữ liệu frame và dữ liệu box đã nén (20 byte)
+BLOCK_HEADER = struct.Struct("<IIIII")
+
+# Mỗi frame: chỉ số frame, thời điểm (giây), có cháy, diện tích cháy (%), confidence trung bình,
+# vị trí box đầu tiên trong mảng box và số box (27 byte)
+TIMELINE_DTYPE = np.dtype([
+    ("frame", "<u4"),
+    ("timestamp", "<f8"),
+    ("fire", "u1"),
+    ("area", "<f4"),
+    ("confidence", "<f4"),
+    ("box_offset", "<u4"),
+    ("box_count", "<u2"),
+])
+
+# Kết quả truy vấn gửi cho client: header | mảng TIMELINE_DTYPE | mảng BOX_DTYPE (không nén, đọc trực tiếp bằng DataView)
+# magic, version, fps, số frame, số box (24 byte)
+TIMELINE_RESPONSE_MAGIC = b"FDTR"
+TIMELINE_RESPONSE_HEADER = struct.Struct("<4sB3xdII")
+
+
+class TimelineWriter:
+    """
+    Ghi timeline trong lúc xử lý: mỗi frame_info được thêm vào bộ đệm cột,
+    đủ một khối thì nén và ghi tiếp vào file nên bộ nhớ không tăng theo độ dài video
+    """
+
+    def __init__(self, path: str, fps: float = 0.0, block_frames: Optional[int] = None, compression_level: int = 6):
+        """
+        Args:
+            path: File timeline
+            fps: FPS của video (để client đổi giữa frame và thời gian); 0 = predict_and_display điền khi mở video
+            block_frames: Số frame mỗi khối (mặc định settings.TIMELINE_BLOCK_FRAMES)
+            compression_level: Mức nén zlib
+        """
+        self.path = path
+        self.fps = fps
+        self.block_frames = max(1, block_frames or settings.TIMELINE_BLOCK_FRAMES)
+        self.compression_level = compression_level
+        self._rows = np.zeros(self.block_frames, dtype=TIMELINE_DTYPE)
+        self._boxes: List[np.ndarray] = []
+        self._box_count = 0
+        self._count = 0
+        self._file = open(path, "wb")
+        # Header được ghi cùng khối đầu tiên, khi đã biết fps
+        self._header_written = False
+
+        self.frames = 0
+        self.fire_frames = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = TIMELINE_HEADER.size
+
+    def append(self, frame_info: Dict[str, Any]) -> None:
+        """
+        Thêm một frame
+
+        Args:
+            frame_info: Thông tin frame từ predict_and_display
+        """
+        boxes = np.frombuffer(pack_boxes(frame_info.get("boxes", ())), dtype=BOX_DTYPE)
+        boxes = boxes[:np.iinfo(np.uint16).max]
+
+        row = self._rows[self._count]
+        row["frame"] = frame_info.get("frame", 0)
+        row["timestamp"] = frame_info.get("timestamp", 0.0)
+        row["fire"] = bool(frame_info.get("fire_detected"))
+        row["area"] = frame_info.get("total_area", 0.0)
+        row["confidence"] = frame_info.get("confidence", 0.0)
+        row["box_offset"] = self._box_count
+        row["box_count"] = len(boxes)
+        if len(boxes):
+            self._boxes.append(boxes)
+            self._box_count += len(boxes)
+
+        self._count += 1
+        self.frames += 1
+        self.fire_frames += int(row["fire"])
+        if self._count == self.block_frames:
+            self.flush()
+
+    def flush(self) -> None:
+        """Nén và ghi các frame đang đệm thành một khối"""
+        if not self._header_written:
+            self._file.write(TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, self.fps))
+            self._header_written = True
+        if self._count == 0:
+            return
+        rows = self._rows[:self._count]
+        boxes = np.concatenate(self._boxes) if self._boxes else np.empty(0, dtype=BOX_DTYPE)
+        rows_data = zlib.compress(rows.tobytes(), self.compression_level)
+        boxes_data = zlib.compress(boxes.tobytes(), self.compression_level)
+        self._file.write(BLOCK_HEADER.pack(int(rows["frame"][0]), int(rows["frame"][-1]), self._count,
+                                           len(rows_data), len(boxes_data)))
+        self._file.write(rows_data)
+        self._file.write(boxes_data)
+
+        self.raw_bytes += rows.nbytes + boxes.nbytes
+        self.compressed_bytes += BLOCK_HEADER.size + len(rows_data) + len(boxes_data)
+        self._count = 0
+        self._boxes = []
+        self._box_count = 0
+
+    def close(self) -> str:
+        """Ghi khối cuối và đóng file, trả về đường dẫn file"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+        return self.path
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "fire_frames": self.fire_frames,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+        }
+
+
+def _gather_boxes(rows: np.ndarray, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Lấy box của các frame trong rows, trả về bản sao rows với box_offset đổi theo mảng box mới"""
+    counts = rows["box_count"].astype(np.int64)
+    starts = np.cumsum(counts) - counts
+    box_index = np.repeat(rows["box_offset"].astype(np.int64) - starts, counts) + np.arange(counts.sum())
+    rows = rows.copy()
+    rows["box_offset"] = starts
+    return rows, boxes[box_index]
+
+
+class TimelineReader:
+    """Đọc timeline, truy vấn theo đoạn frame chỉ giải nén các khối giao với đoạn cần lấy"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # (frame đầu, frame cuối, số frame, vị trí dữ liệu, độ dài dữ liệu frame, độ dài dữ liệu box)
+        self.blocks: List[Tuple[int, int, int, int, int, int]] = []
+        with open(path, "rb") as f:
+            magic, version, self.fps = TIMELINE_HEADER.unpack(f.read(TIMELINE_HEADER.size))
+            if magic != TIMELINE_MAGIC:
+                raise ValueError("File không phải timeline")
+            if version != TIMELINE_VERSION:
+                raise ValueError(f"Phiên bản timeline không hỗ trợ: {version}")
+            while True:
+                header = f.read(BLOCK_HEADER.size)
+                if len(header) < BLOCK_HEADER.size:
+                    break
+                first, last, count, rows_length, boxes_length = BLOCK_HEADER.unpack(header)
+                self.blocks.append((first, last, count, f.tell(), rows_length, boxes_length))
+                f.seek(rows_length + boxes_length, os.SEEK_CUR)
+
+    @property
+    def frames(self) -> int:
+        return sum(block[2] for block in self.blocks)
+
+    def iter_blocks(self, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Giải nén lần lượt từng khối giao với đoạn [start, end), bộ nhớ chỉ giữ một khối mỗi lần
+
+        Yields:
+            Tuple[np.ndarray, np.ndarray]: Mảng TIMELINE_DTYPE (chỉ đọc) và mảng BOX_DTYPE của khối,
+                box_offset tính theo mảng box của khối
+        """
+        with open(self.path, "rb") as f:
+            for first, last, count, offset, rows_length, boxes_length in self.blocks:
+                if last < start or (end is not None and first >= end):
+                    continue
+                f.seek(offset)
+                rows = np.frombuffer(zlib.decompress(f.read(rows_length)), dtype=TIMELINE_DTYPE)
+                boxes = np.frombuffer(zlib.decompress(f.read(boxes_length)), dtype=BOX_DTYPE)
+                yield rows, boxes
+
+    def query(self, start: int = 0, end: Optional[int] = None, step: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lấy các frame có chỉ số trong [start, end)
+
+        Args:
+            start: Frame đầu
+            end: Frame cuối (không gồm), None = đến hết
+            step: Chỉ lấy 1 trong mỗi step frame (giảm dữ liệu cho biểu đồ toàn video)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Mảng TIMELINE_DTYPE và mảng BOX_DTYPE,
+                box_offset đã đổi theo mảng box trả về
+        """
+        step = max(1, step)
+        rows_parts, boxes_parts = [], []
+        box_total = 0
+        for rows, boxes in self.iter_blocks(start, end):
+            selected = rows["frame"] >= start
+            if end is not None:
+                selected &= rows["frame"] < end
+            # Gom box của các frame được chọn, đổi vị trí box theo mảng kết quả
+            rows, boxes = _gather_boxes(rows[selected], boxes)
+            rows["box_offset"] += box_total
+            box_total += len(boxes)
+            rows_parts.append(rows)
+            boxes_parts.append(boxes)
+
+        rows = np.concatenate(rows_parts) if rows_parts else np.empty(0, dtype=TIMELINE_DTYPE)
+        boxes = np.concatenate(boxes_parts) if boxes_parts else np.empty(0, dtype=BOX_DTYPE)
+        if step > 1:
+            rows, boxes = _gather_boxes(rows[::step], boxes)
+        return rows, boxes
+
+
+def encode_timeline_response(fps: float, rows: np.ndarray, boxes: np.ndarray) -> bytes:
+    """Đóng gói kết quả truy vấn thành một khối nhị phân gửi cho client"""
+    header = TIMELINE_RESPONSE_HEADER.pack(TIMELINE_RESPONSE_MAGIC, TIMELINE_VERSION, fps, len(rows), len(boxes))
+    return b"".join((header, rows.tobytes(), boxes.tobytes()))
+
+
+def decode_timeline_response(data: bytes) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Giải mã khối nhị phân của encode_timeline_response (dùng cho client Python và kiểm thử)"""
+    magic, version, fps, row_count, box_count = TIMELINE_RESPONSE_HEADER.unpack_from(data)
+    if magic != TIMELINE_RESPONSE_MAGIC:
+        raise ValueError("Dữ liệu không phải timeline")
+    offset = TIMELINE_RESPONSE_HEADER.size
+    rows = np.frombuffer(data, dtype=TIMELINE_DTYPE, count=row_count, offset=offset)
+    boxes = np.frombuffer(data, dtype=BOX_DTYPE, count=box_count, offset=offset + rows.nbytes)
+    return fps, rows, boxes
+
+
+def store_timeline(path: str, name: str) -> Optional[str]:
+    """
+    Lưu file timeline đã ghi xong vào nơi lưu trữ (settings.TIMELINE_STORAGE), file tạm bị xóa
+
+    Args:
+        path: File timeline đã đóng
+        name: Tên lưu trữ (thường là ID video)
+
+    Returns:
+        Optional[str]: Tham chiếu tới timeline (đường dẫn cục bộ hoặc URL Cloudinary), None nếu lỗi
+    """
+    try:
+        if settings.TIMELINE_STORAGE == "cloudinary":
+            success, message, result = upload_stream_to_cloudinary(path, filename=f"{name}.fdtl", resource_type="raw")
+            if not success:
+                logger.error(f"Không thể lưu timeline lên Cloudinary: {message}")
+                return None
+            return result.get("secure_url")
+
+        os.makedirs(settings.TIMELINE_DIR, exist_ok=True)
+        target = os.path.abspath(os.path.join(settings.TIMELINE_DIR, f"{name}.fdtl"))
+        shutil.move(path, target)
+        return target
+    except Exception as e:
+        logger.error(f"Lỗi khi lưu timeline: {str(e)}")
+        return None
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def open_timeline(ref: str) -> TimelineReader:
+    """Mở timeline từ tham chiếu của store_timeline (URL được tải qua cache trên ổ đĩa)"""
+    if ref.startswith(("http://", "https://")):
+        ref = get_download_cache().fetch(ref)
+    return TimelineReader(ref)
+
+
+def delete_timeline(ref: str) -> None:
+    """Xóa timeline khỏi nơi lưu trữ"""
+    try:
+        if ref.startswith(("http://", "https://")):
+            # public_id của tài nguyên raw gồm cả phần mở rộng, nằm sau /upload/v<version>/
+            public_id = ref.split("/upload/", 1)[1].split("/", 1)[1]
+            delete_from_cloudinary(public_id, resource_type="raw")
+        elif os.path.exists(ref):
+            os.remove(ref)
+    except Exception as e:
+        logger.warning(f"Không thể xóa timeline: {str(e)}")
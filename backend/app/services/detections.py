@@ -0,0 +1,89 @@
+from typing import Any, List, Optional
+
+import numpy as np
+
+# Lớp "fire" của model
+FIRE_CLASS_ID = 0
+
+# Một phát hiện: box (x1, y1, x2, y2), confidence, lớp và ID theo dõi (-1 nếu chưa gán)
+DETECTION_DTYPE = np.dtype([
+    ("xyxy", np.float32, (4,)),
+    ("conf", np.float32),
+    ("cls", np.int32),
+    ("track_id", np.int32),
+])
+
+
+def empty_detections(count: int = 0) -> np.ndarray:
+    """
+    Tạo mảng phát hiện với count phần tử (track_id mặc định -1)
+    """
+    detections = np.zeros(count, dtype=DETECTION_DTYPE)
+    detections["track_id"] = -1
+    return detections
+
+
+def results_to_detections(result: Any) -> np.ndarray:
+    """
+    Chuyển Results của ultralytics thành mảng phát hiện gọn, chỉ một lần chép dữ liệu từ tensor
+    (có thể nằm trên GPU) sang bộ nhớ host cho mỗi frame
+
+    Args:
+        result: Results của ultralytics (hoặc None)
+
+    Returns:
+        np.ndarray: Mảng có kiểu DETECTION_DTYPE
+    """
+    boxes = getattr(result, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return empty_detections()
+
+    # data: (N, 6) x1, y1, x2, y2, conf, cls hoặc (N, 7) x1, y1, x2, y2, track_id, conf, cls
+    data = boxes.data.cpu().numpy()
+    detections = empty_detections(len(data))
+    detections["xyxy"] = data[:, :4]
+    detections["conf"] = data[:, -2]
+    detections["cls"] = data[:, -1]
+    if data.shape[1] == 7:
+        detections["track_id"] = data[:, 4]
+    return detections
+
+
+def results_to_masks(result: Any) -> Optional[np.ndarray]:
+    """
+    Lấy mask (bool, độ phân giải của model) từ Results của ultralytics
+
+    Returns:
+        Optional[np.ndarray]: Mảng (N, H, W) hoặc None nếu model không trả về mask
+    """
+    masks = getattr(result, "masks", None)
+    if masks is None:
+        return None
+    return masks.data.cpu().numpy() > 0.5
+
+
+def fire_only(detections: np.ndarray) -> np.ndarray:
+    """
+    Lọc các phát hiện thuộc lớp lửa
+    """
+    return detections[detections["cls"] == FIRE_CLASS_ID]
+
+
+def box_area_percent(detections: np.ndarray, width: int, height: int) -> float:
+    """
+    Tổng diện tích các box, tính theo % diện tích frame
+    """
+    xyxy = detections["xyxy"].astype(np.int32)
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    return float(areas.sum()) / (width * height) * 100
+
+
+def detections_to_boxes(detections: np.ndarray) -> List[List[float]]:
+    """
+    Chuyển mảng phát hiện thành danh sách [x1, y1, x2, y2, conf, track_id] dùng được với JSON
+    """
+    return [
+        [*xyxy, round(conf, 4), track_id]
+        for xyxy, conf, track_id in zip(detections["xyxy"].round().astype(np.int32).tolist(),
+                                        detections["conf"].tolist(), detections["track_id"].tolist())
+    ]
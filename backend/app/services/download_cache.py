@@ -0,0 +1,236 @@
+import os
+import json
+import mmap
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_INDEX_FILE = "index.json"
+
+
+def create_http_session(pool_size: Optional[int] = None, retries: int = 3) -> requests.Session:
+    """
+    Tạo requests.Session dùng chung với pool kết nối (giữ kết nối keep-alive giữa các lần tải)
+    và tự thử lại khi lỗi mạng / lỗi 5xx
+    """
+    pool_size = pool_size or settings.DOWNLOAD_POOL_SIZE
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                          allowed_methods=("GET", "HEAD")),
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class DownloadCache:
+    """
+    Bộ nhớ đệm đọc xuyên (read-through) trên ổ đĩa cho file tải từ URL (video gốc trên Cloudinary):
+    - tải dạng stream qua session dùng chung, ghi thẳng xuống ổ đĩa nên RAM không phụ thuộc kích thước file
+    - file lưu theo sha256 nội dung (content-addressed), nhiều URL cùng nội dung dùng chung một file
+    - giới hạn tổng dung lượng, vượt quá thì xóa file ít được dùng gần đây nhất (LRU)
+    URL của Cloudinary không đổi nội dung (có version), nên lần phân tích lại một video không cần tải lại.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                 chunk_size: Optional[int] = None, session: Optional[requests.Session] = None):
+        """
+        Args:
+            directory: Thư mục lưu cache (mặc định settings.DOWNLOAD_CACHE_DIR hoặc TEMP_DIR/fire_detection_cache)
+            max_bytes: Tổng dung lượng tối đa (mặc định settings.DOWNLOAD_CACHE_MAX_MB)
+            chunk_size: Kích thước mỗi lần đọc khi tải
+            session: Session HTTP dùng chung (mặc định tạo mới với pool kết nối)
+        """
+        self.directory = directory or settings.DOWNLOAD_CACHE_DIR or os.path.join(settings.TEMP_DIR, "fire_detection_cache")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.DOWNLOAD_CACHE_MAX_MB * 1024 * 1024
+        self.chunk_size = chunk_size or settings.DOWNLOAD_CHUNK_SIZE
+        self.session = session or create_http_session()
+        self._lock = threading.Lock()
+        # url -> [khóa tải, số phiên đang giữ hoặc chờ khóa]; chỉ bỏ khóa khi không còn phiên nào dùng
+        self._url_locks: Dict[str, List[Any]] = {}
+        # url -> sha256 của nội dung
+        self._index: Dict[str, str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _load_index(self) -> None:
+        """Đọc lại chỉ mục url -> nội dung, bỏ các mục mà file đã bị xóa"""
+        try:
+            with open(os.path.join(self.directory, _INDEX_FILE), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._index = {url: digest for url, digest in index.items() if os.path.exists(self._blob_path(digest))}
+
+    def _save_index(self) -> None:
+        """Ghi chỉ mục (gọi khi đang giữ self._lock), ghi ra file tạm rồi đổi tên để không hỏng khi bị ngắt"""
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".json")
+        with os.fdopen(handle, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, os.path.join(self.directory, _INDEX_FILE))
+
+    def _lookup(self, url: str) -> Optional[str]:
+        with self._lock:
+            digest = self._index.get(url)
+            if digest is None:
+                return None
+            path = self._blob_path(digest)
+            try:
+                # Cập nhật thời điểm dùng gần nhất cho LRU
+                os.utime(path)
+            except OSError:
+                del self._index[url]
+                return None
+            return path
+
+    def _download(self, url: str) -> str:
+        """Tải URL dạng stream vào file tạm trong thư mục cache, vừa tải vừa tính sha256"""
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(handle, "wb") as f:
+                with self.session.get(url, stream=True, timeout=(10, 60)) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+            if size == 0:
+                raise IOError("Dữ liệu tải về rỗng")
+
+            path = self._blob_path(digest.hexdigest())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                # Đã có cùng nội dung dưới URL khác
+                os.remove(temp_path)
+                os.utime(path)
+            else:
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._index[url] = digest.hexdigest()
+            self.bytes_downloaded += size
+            self._evict(keep=path)
+            self._save_index()
+        logger.info(f"Đã tải vào cache {size/1024/1024:.2f} MB từ {url}")
+        return path
+
+    def _evict(self, keep: str) -> None:
+        """Xóa các file dùng lâu nhất đến khi tổng dung lượng không vượt max_bytes (gọi khi đang giữ self._lock)"""
+        blobs = []
+        for digest in set(self._index.values()):
+            path = self._blob_path(digest)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, digest, path))
+
+        total = sum(size for _, size, _, _ in blobs)
+        for _, size, digest, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                # Trên Linux, phiên đang đọc file này vẫn đọc được đến khi đóng
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Không thể xóa file cache: {str(e)}")
+                continue
+            total -= size
+            self.evictions += 1
+            for url in [url for url, value in self._index.items() if value == digest]:
+                del self._index[url]
+
+    def fetch(self, url: str) -> str:
+        """
+        Lấy đường dẫn file cục bộ của URL, chỉ tải qua mạng khi chưa có trong cache
+
+        Args:
+            url: URL của file
+
+        Returns:
+            str: Đường dẫn file trong cache (chỉ đọc, không xóa)
+        """
+        path = self._lookup(url)
+        if path is not None:
+            self.hits += 1
+            return path
+
+        with self._lock:
+            entry = self._url_locks.setdefault(url, [threading.Lock(), 0])
+            entry[1] += 1
+        # Nhiều phiên cùng yêu cầu một URL thì chỉ một phiên tải, các phiên khác chờ rồi dùng lại
+        try:
+            with entry[0]:
+                path = self._lookup(url)
+                if path is not None:
+                    self.hits += 1
+                    return path
+                self.misses += 1
+                return self._download(url)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._url_locks[url]
+
+    def open_mmap(self, url: str) -> mmap.mmap:
+        """Lấy nội dung của URL dưới dạng memory-mapped (chỉ đọc), người gọi đóng khi dùng xong"""
+        with open(self.fetch(url), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            digests = set(self._index.values())
+            size = sum(os.path.getsize(self._blob_path(digest)) for digest in digests
+                       if os.path.exists(self._blob_path(digest)))
+        return {
+            "files": len(digests),
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_downloaded": self.bytes_downloaded,
+            "evictions": self.evictions,
+        }
+
+
+_download_cache: Optional[DownloadCache] = None
+_download_cache_lock = threading.Lock()
+
+
+def get_download_cache() -> DownloadCache:
+    """Cache dùng chung cho toàn bộ ứng dụng (tạo khi dùng lần đầu)"""
+    global _download_cache
+    with _download_cache_lock:
+        if _download_cache is None:
+            _download_cache = DownloadCache()
+        return _download_cache
@@ -13,53 +13,153 @@ from pathlib import Path
 import asyncio
 import threading
 import queue
+import tempfile
+import statistics
+from collections import deque
 from fastapi import WebSocket
-import hashlib
 
 from app.core.config import settings
+from app.services.inference_backends import load_yolo_model, resolve_model_path
+from app.services.video_source import open_video_capture, is_memory_source
+from app.services.frame_queue import BoundedFrameQueue
+from app.services.frame_scheduler import FrameScheduler
+from app.services.motion_gate import create_motion_gate
+from app.services.fire_prefilter import FireColorPrefilter, cascade_predict, create_fire_prefilter
+from app.services.detections import detections_to_boxes, fire_only, results_to_detections, results_to_masks
+from app.services.fire_tracker import FireTracker
+from app.services.overlay import FrameRenderer
+from app.services.detection_timeline import TimelineWriter
 from app.utils.cloudinary_service import upload_bytes_to_cloudinary, download_from_cloudinary, delete_from_cloudinary
 
 logger = logging.getLogger(__name__)
 os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "video_codec;h264_cuvid"
 os.environ["OPENCV_VIDEOIO_DEBUG"] = "0"  # Tắt debug messages
 cv2.setLogLevel(0)
-# Cache toàn cục cho các URL Cloudinary để tái sử dụng giữa các lần gọi
-# Sử dụng dict để lưu trữ URL và thông tin liên quan
-global_cloudinary_cache = {}
-# Biến lưu trữ URL của lần tải lên gần nhất
-last_cloudinary_url = None
-last_cloudinary_result = None
 
+# Số frame gần nhất được giữ để tính phân vị độ trễ của phiên
+LATENCY_SAMPLES = 10000
+# Số lần đo mỗi đường suy luận khi ước lượng mức tăng của chế độ batch (lấy trung vị)
+BATCH_SPEEDUP_RUNS = 3
 
-def predict_and_display(model, video_path, output_path=None, initial_skip_frames=2):
+
+def _measure_batch_speedup(model, frame, batch_size: int) -> Tuple[float, float]:
+    """
+    Đo thông lượng suy luận đơn frame và theo batch trên cùng một frame mẫu.
+    Đường batch được warm-up một lần (cấp phát cho kích thước batch mới), mỗi đường lấy
+    trung vị của BATCH_SPEEDUP_RUNS lần đo để một lần đo lệch không làm sai kết quả
+
+    Args:
+        model: Mô hình YOLO đã warm-up
+        frame: Frame mẫu dùng để đo
+        batch_size: Kích thước batch cần so sánh
+
+    Returns:
+        Tuple[float, float]: Số frame/giây của đường đơn frame và của đường batch
+    """
+    def median_time(frames) -> float:
+        durations = []
+        for _ in range(BATCH_SPEEDUP_RUNS):
+            start_time = time.perf_counter()
+            model.predict(frames, save=False, conf=0.5, verbose=False)
+            durations.append(time.perf_counter() - start_time)
+        return max(statistics.median(durations), 1e-6)
+
+    batch = [frame] * batch_size
+    model.predict(batch, save=False, conf=0.5, verbose=False)
+    single_fps = 1.0 / median_time(frame)
+    batch_fps = batch_size / median_time(batch)
+    return single_fps, batch_fps
+
+
+def predict_and_display(model, video_path, output_path=None,
+                        batch_size: Optional[int] = None, batch_max_wait: Optional[float] = None,
+                        session_stats: Optional[Dict[str, Any]] = None,
+                        queue_size: Optional[int] = None, queue_policy: Optional[str] = None,
+                        target_fps: Optional[float] = None, latency_budget: Optional[float] = None,
+                        max_gap: Optional[float] = None, motion_gating: Optional[bool] = None,
+                        prefilter_mode: Optional[str] = None, timeline: Optional[TimelineWriter] = None):
     """
     Xử lý video để phát hiện đám cháy và trả về từng frame đã xử lý.
     Hoạt động như một generator để hỗ trợ streaming realtime.
     
     Args:
         model: Mô hình YOLO cho phát hiện đám cháy
-        video_path: Đường dẫn hoặc URL của video
+        video_path: Đường dẫn, URL, bytes hoặc file-like object của video
         output_path: Đường dẫn lưu video kết quả (nếu None, không lưu)
-        initial_skip_frames: Số frame ban đầu bỏ qua
+        batch_size: Số frame tối đa gom lại cho một lần suy luận
+            (mặc định lấy từ settings.INFERENCE_BATCH_SIZE, 1 = suy luận từng frame)
+        batch_max_wait: Thời gian tối đa (giây) chờ gom đủ batch trước khi suy luận
+            (mặc định lấy từ settings.INFERENCE_BATCH_MAX_WAIT_MS)
+        session_stats: Dict (tùy chọn) để nhận thống kê hiệu năng của phiên xử lý
+        queue_size: Số frame tối đa trong mỗi hàng đợi giữa các luồng
+            (mặc định lấy từ settings.FRAME_QUEUE_SIZE / settings.RESULT_QUEUE_SIZE)
+        queue_policy: Chính sách khi hàng đợi đầy: "block" (giữ đủ frame) hoặc
+            "drop_oldest" (bỏ frame cũ nhất, chỉ dùng cho xem trực tiếp không lưu kết quả);
+            mặc định settings.QUEUE_POLICY. Khi có output_path hoặc timeline, mọi frame đều được
+            ghi và lưu nên luôn dùng "block"
+        target_fps: Số frame suy luận mỗi giây video (0 = mọi frame; mặc định settings.ANALYSIS_TARGET_FPS)
+        latency_budget: Độ trễ tối đa (giây) của một frame trong pipeline, vượt quá thì bỏ qua
+            suy luận để đuổi kịp (0 = không giới hạn; mặc định settings.ANALYSIS_LATENCY_BUDGET_MS)
+        max_gap: Khoảng cách tối đa (giây video) giữa hai frame được suy luận
+            (mặc định settings.ANALYSIS_MAX_GAP_MS)
+        motion_gating: Dùng lại kết quả của frame suy luận trước khi khung cảnh không đổi
+            (mặc định settings.MOTION_GATE_ENABLED)
+        prefilter_mode: Bộ lọc màu lửa trước model: "off", "on" hoặc "evaluate"
+            (mặc định settings.PREFILTER_MODE)
+        timeline: TimelineWriter (tùy chọn) nhận thông tin phát hiện của mọi frame để lưu lại
         
     Yields:
         Tuple[np.ndarray, Dict]: Frame đã xử lý và thông tin kèm theo
     """
-    cap = cv2.VideoCapture(str(video_path))
+    if batch_size is None:
+        batch_size = settings.INFERENCE_BATCH_SIZE
+    if batch_max_wait is None:
+        batch_max_wait = settings.INFERENCE_BATCH_MAX_WAIT_MS / 1000.0
+    batch_size = max(1, int(batch_size))
+    if target_fps is None:
+        target_fps = settings.ANALYSIS_TARGET_FPS
+    if latency_budget is None:
+        latency_budget = settings.ANALYSIS_LATENCY_BUDGET_MS / 1000.0
+    if max_gap is None:
+        max_gap = settings.ANALYSIS_MAX_GAP_MS / 1000.0
+    stats = session_stats if session_stats is not None else {}
+
+    # Nguồn trong bộ nhớ (bytes/file-like) được giải mã trực tiếp, không ghi ra file tạm
+    cap, release_capture = open_video_capture(video_path)
     if not cap.isOpened():
-        print(f"Không thể mở video: {video_path}")
+        release_capture()
+        print(f"Không thể mở video: {video_path if not is_memory_source(video_path) else '<dữ liệu trong bộ nhớ>'}")
         return
 
-    # Warm-up model với frame đầu tiên
-    ret, dummy_frame = cap.read()
+    # Warm-up model với frame đầu tiên. Frame này được đưa lại vào pipeline thay vì seek về đầu,
+    # vì seek trên nguồn HTTP/bộ nhớ phải đọc lại dữ liệu
+    ret, first_frame = cap.read()
     if ret:
-        model.predict(dummy_frame, save=False, conf=0.5, verbose=False)
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        model.predict(first_frame, save=False, conf=0.5, verbose=False)
+        # Đo trước mức tăng thông lượng của chế độ batch so với suy luận từng frame
+        if batch_size > 1:
+            single_fps, batch_fps = _measure_batch_speedup(model, first_frame, batch_size)
+            stats["single_frame_fps"] = round(single_fps, 2)
+            stats["expected_batch_speedup"] = round(batch_fps / single_fps, 2)
+    else:
+        first_frame = None
 
     fps_video = cap.get(cv2.CAP_PROP_FPS) or 30
+    if timeline is not None and not timeline.fps:
+        timeline.fps = fps_video
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    stats.update({
+        "fps": fps_video,
+        "width": width,
+        "height": height,
+        "total_frames": total_frames,
+        "batch_size": batch_size,
+        "inferred_frames": 0,
+        "inference_batches": 0,
+        "inference_time": 0.0,
+    })
 
     # Khởi tạo VideoWriter nếu có output_path
     out = None
@@ -67,159 +167,183 @@ def predict_and_display(model, video_path, output_path=None, initial_skip_frames
         fourcc = cv2.VideoWriter_fourcc(*'X264')
         out = cv2.VideoWriter(output_path, fourcc, fps_video, (width, height))
 
-    frame_queue = queue.Queue(maxsize=0)
-    result_queue = queue.Queue(maxsize=0)
+    # Hàng đợi có giới hạn để luồng giải mã không đọc trước hàng nghìn frame vào RAM
+    if queue_policy is None:
+        queue_policy = settings.QUEUE_POLICY
+    # Video kết quả và timeline phải đủ mọi frame đã giải mã, nếu không kết quả phụ thuộc tốc độ máy
+    # (và được lưu lại trong cache). Bỏ frame chỉ áp dụng cho phiên chỉ xem trước
+    if queue_policy == "drop_oldest" and (out is not None or timeline is not None):
+        logger.info("Có lưu video kết quả / timeline, dùng chính sách hàng đợi block thay cho drop_oldest")
+        queue_policy = "block"
+    frame_queue = BoundedFrameQueue(queue_size or settings.FRAME_QUEUE_SIZE, queue_policy)
+    result_queue = BoundedFrameQueue(queue_size or settings.RESULT_QUEUE_SIZE, queue_policy)
     stop_event = threading.Event()
+    # Báo hiệu luồng suy luận đã kết thúc (kể cả các frame còn giữ trong batch)
+    inference_done = threading.Event()
     frame_idx = 0
+    # Thời gian (giây) của từng công đoạn và độ trễ từ lúc giải mã tới lúc vẽ, ghi xong từng frame
+    stage_time = {"decode": 0.0, "render": 0.0, "encode": 0.0}
+    capture_times = deque()
+    latencies = deque(maxlen=LATENCY_SAMPLES)
 
     def capture_thread():
         nonlocal frame_idx
+        # Ở chế độ drop_oldest (xem trực tiếp), đọc frame theo đúng tốc độ phát của video;
+        # frame chỉ bị bỏ khi suy luận không theo kịp thời gian thực, thay vì giải mã hết video
+        # trong vài giây rồi bỏ gần như toàn bộ
+        realtime = queue_policy == "drop_oldest"
+        start_time = time.time()
+        if first_frame is not None:
+            capture_times.append((frame_idx, time.perf_counter()))
+            frame_queue.put((frame_idx, first_frame))
+            frame_idx += 1
         while not stop_event.is_set():
+            if realtime:
+                delay = start_time + frame_idx / fps_video - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            decode_start = time.perf_counter()
             ret, frame = cap.read()
+            decoded_at = time.perf_counter()
+            stage_time["decode"] += decoded_at - decode_start
             if not ret:
                 stop_event.set()
                 break
-            frame_queue.put((frame_idx, frame))
+            capture_times.append((frame_idx, decoded_at))
+            if not frame_queue.put((frame_idx, frame)):
+                break
             frame_idx += 1
 
+    # Chọn frame cần suy luận theo tốc độ mục tiêu, ngân sách độ trễ và độ phủ thời gian tối thiểu
+    scheduler = FrameScheduler(fps_video, target_fps=target_fps, latency_budget=latency_budget, max_gap=max_gap)
+    # Cổng chuyển động: frame không đổi so với frame suy luận gần nhất thì dùng lại kết quả cũ
+    motion_gate = create_motion_gate(motion_gating)
+    # Bộ lọc màu lửa: frame không có điểm ảnh màu lửa thì không cần chạy model
+    prefilter = create_fire_prefilter(prefilter_mode)
+
     def inference_thread():
         processing_times = []
         max_samples = 10
-        skip_frames = initial_skip_frames
-        frame_duration = 1.0 / fps_video
+        # Các frame đang chờ gom batch, giữ nguyên thứ tự để trả kết quả đúng thứ tự frame
+        # Mỗi frame có một chế độ: "infer" (chạy model), "reuse" (dùng lại kết quả gần nhất), "skip"
+        pending = []
+        batch_deadline = None
+        # Kết quả (mảng phát hiện, mask) của frame được suy luận gần nhất theo thứ tự frame
+        last_result = None
+        avg_time = 0
+
+        def emit(idx, frame, mode):
+            if mode == "skip" or last_result is None:
+                result_queue.put((idx, frame, None, None, True, 0.0, True))
+            else:
+                detections, segments = last_result
+                result_queue.put((idx, frame, detections, segments, False, avg_time, False))
+            frame_queue.task_done()
+
+        def flush_batch():
+            nonlocal batch_deadline, last_result, avg_time
+            infer_frames = [frame for _, frame, mode in pending if mode == "infer"]
+            results = []
+            if infer_frames:
+                start_time = time.time()
+                results = cascade_predict(model, infer_frames, prefilter, conf=0.5)
+                processing_time = time.time() - start_time
 
-        while not stop_event.is_set() or not frame_queue.empty():
-            try:
-                idx, frame = frame_queue.get(timeout=0.1)
-                frames_left = total_frames - idx
-                if frames_left <= fps_video:
-                    skip = False
-                else:
-                    skip = idx % skip_frames != 0
+                stats["inferred_frames"] += len(infer_frames)
+                stats["inference_batches"] += 1
+                stats["inference_time"] += processing_time
+
+                # Thời gian xử lý được chia đều cho từng frame trong batch
+                per_frame_time = processing_time / len(infer_frames)
+                processing_times.extend([per_frame_time] * len(infer_frames))
+                del processing_times[:-max_samples]
+                scheduler.record_inference(len(infer_frames), processing_time)
+
+            avg_time = sum(processing_times) / len(processing_times) if processing_times else 0
+            result_iter = iter(results)
+            for idx, frame, mode in pending:
+                if mode == "infer":
+                    # Chép kết quả sang bộ nhớ host một lần cho mỗi frame suy luận, ngay trong luồng suy luận
+                    result = next(result_iter)
+                    last_result = (results_to_detections(result), results_to_masks(result))
+                emit(idx, frame, mode)
+            pending.clear()
+            batch_deadline = None
 
-                if skip:
-                    result_queue.put((idx, frame, None, None, True, 0.0, True))
-                    frame_queue.task_done()
+        try:
+            while not stop_event.is_set() or not frame_queue.empty():
+                if result_queue.closed:
+                    # Phía đọc đã dừng, không cần suy luận các frame còn lại
+                    pending.clear()
+                    break
+                timeout = 0.1
+                if batch_deadline is not None:
+                    timeout = min(timeout, max(batch_deadline - time.time(), 0.001))
+                try:
+                    idx, frame = frame_queue.get(timeout=timeout)
+                except queue.Empty:
+                    # Hết thời gian chờ gom batch thì suy luận với số frame hiện có
+                    if pending and time.time() >= batch_deadline:
+                        flush_batch()
                     continue
 
-                start_time = time.time()
-                result = model.predict(frame, save=False, conf=0.5, verbose=False)[0]
-                detections = result.boxes
-                segments = getattr(result, 'masks', None)
-                processing_time = time.time() - start_time
+                mode = "skip"
+                if scheduler.should_infer(idx, frame_queue.qsize() + len(pending)):
+                    if motion_gate is None or motion_gate.should_infer(frame, idx / fps_video):
+                        mode = "infer"
+                    else:
+                        mode = "reuse"
 
-                processing_times.append(processing_time)
-                if len(processing_times) > max_samples:
-                    processing_times.pop(0)
+                # Không có frame nào chờ suy luận phía trước thì trả kết quả ngay
+                if mode != "infer" and not pending:
+                    emit(idx, frame, mode)
+                    continue
 
-                if idx >= 10:
-                    avg_processing_time = sum(processing_times) / len(processing_times)
-                    skip_frames = min(int(np.ceil(avg_processing_time / frame_duration)), 3) if avg_processing_time > frame_duration else 0
+                pending.append((idx, frame, mode))
+                if batch_deadline is None:
+                    batch_deadline = time.time() + batch_max_wait
+                infer_count = sum(1 for _, _, mode in pending if mode == "infer")
+                if infer_count >= batch_size or time.time() >= batch_deadline:
+                    flush_batch()
 
-                result_queue.put((idx, frame, detections, segments, False,
-                                  sum(processing_times) / len(processing_times) if processing_times else 0, False))
-                frame_queue.task_done()
-            except queue.Empty:
-                continue
+            if pending:
+                flush_batch()
+        finally:
+            inference_done.set()
 
     def draw_and_yield():
         prev_time = time.time()
         avg_fps = 0.0
         
-        # Bộ nhớ tạm để giữ bounding box
-        bbox_cache = {}  
-        # Số frame giữ lại bounding box sau khi mất
-        max_hold_frames = 3
-        # Bộ nhớ tạm cho các mask
-        mask_cache = {}
-        mask_hold_frames = 2
-
-        while not stop_event.is_set() or not result_queue.empty() or not frame_queue.empty():
+        # Bộ vẽ lớp phủ của phiên, dùng lại bộ đệm giữa các frame
+        renderer = FrameRenderer()
+        # Theo dõi các vùng cháy qua nhiều frame: ID ổn định, nội suy box trên frame không suy luận
+        tracker = FireTracker(
+            iou_threshold=settings.TRACKER_IOU_THRESHOLD,
+            max_misses=settings.TRACKER_MAX_MISSES,
+            max_age=settings.TRACKER_MAX_AGE_FRAMES,
+        )
+
+        while not inference_done.is_set() or not result_queue.empty():
             try:
                 idx, frame, detections, segments, skip_frames, avg_processing_time, is_skipped = result_queue.get(timeout=0.1)
+                render_start = time.perf_counter()
                 video_time = idx / fps_video
                 video_time_str = time.strftime("%H:%M:%S", time.gmtime(video_time))
 
-                fire_detected = False
-                total_fire_area = 0.0
-                current_boxes = []
-                current_masks = []
-                current_confidences = []  # Thêm list để lưu confidence của frame hiện tại
-                
-                # Xử lý và lưu trữ mask
-                if segments is not None:
-                    masks = segments.data.cpu().numpy()
-                    for mask in masks:
-                        mask_resized = cv2.resize(mask, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_NEAREST)
-                        mask_hash = hash(mask_resized.tobytes())
-                        current_masks.append((mask_resized, mask_hash))
-                        
-                        blue_mask = np.zeros_like(frame, dtype=np.uint8)
-                        blue_mask[mask_resized > 0.5] = (255, 0, 0)
-                        alpha = 0.6
-                        overlay = frame.copy()
-                        overlay[mask_resized > 0.5] = blue_mask[mask_resized > 0.5]
-                        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-                
-                        fire_pixels = np.sum(mask_resized > 0.5)
-                        fire_area = fire_pixels / (width * height) * 100
-                        total_fire_area += fire_area
-                        
-                # Cập nhật cache mask
-                new_mask_cache = {}
-                for mask_resized, mask_hash in current_masks:
-                    new_mask_cache[mask_hash] = (mask_resized, mask_hold_frames)
+                # Cập nhật tracker với kết quả của frame vừa suy luận (mask giữ ở độ phân giải của model)
+                if detections is not None:
+                    tracker.update(idx, detections, segments)
                 
-                for mask_hash, (stored_mask, remain) in mask_cache.items():
-                    if mask_hash not in new_mask_cache and remain > 0:
-                        new_mask_cache[mask_hash] = (stored_mask, remain - 1)
-                        blue_mask = np.zeros_like(frame, dtype=np.uint8)
-                        blue_mask[stored_mask > 0.5] = (255, 0, 0)
-                        alpha = 0.6
-                        overlay = frame.copy()
-                        overlay[stored_mask > 0.5] = blue_mask[stored_mask > 0.5]
-                        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+                tracks, track_masks = tracker.active(idx)
                 
-                mask_cache = new_mask_cache
+                # Tô mask của các track còn sống trong một lượt, diện tích cháy tính trên mask hợp nhất
+                total_fire_area = renderer.draw_masks(frame, track_masks, color=(255, 0, 0), alpha=0.6)
 
-                # Xử lý bounding box và confidence
-                if detections is not None:
-                    for det in detections:
-                        if int(det.cls[0].item()) == 0:  # Nếu là class fire
-                            x1, y1, x2, y2 = det.xyxy[0].cpu().numpy().astype(int)
-                            conf = float(det.conf[0].item())
-                            current_boxes.append(((x1, y1, x2, y2), conf))
-                            current_confidences.append(conf)  # Thêm confidence vào list
-
-                # Cập nhật cache bounding box
-                new_cache = {}
-                for (x1, y1, x2, y2), conf in current_boxes:
-                    key = (x1, y1, x2, y2)
-                    new_cache[key] = (max_hold_frames, conf)
-
-                for key, (remain, old_conf) in bbox_cache.items():
-                    if key not in new_cache and remain > 0:
-                        new_cache[key] = (remain - 1, old_conf)
-                        current_confidences.append(old_conf)  # Thêm confidence của box cũ vào list
-
-                bbox_cache = new_cache
-
-                # Vẽ tất cả bounding box từ cache và tính diện tích
-                for (x1, y1, x2, y2), (remain, conf) in bbox_cache.items():
-                    if remain > 0:
-                        box_alpha = 1.0 if remain == max_hold_frames else 0.6 + (0.4 * remain / max_hold_frames)
-                        color_intensity = min(255, int(200 + (conf * 55)))
-                        box_color = (color_intensity, 0, 0)
-                        
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 4)
-                        label = f"{conf:.2f}"
-                        (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 1.5, 1)
-                        cv2.rectangle(frame, (x1, y1 - text_height - 8), (x1 + text_width + 6, y1), box_color, -1)
-                        cv2.putText(frame, label, (x1 + 3, y1 - 4), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
-                        
-                        # area = ((x2 - x1) * (y2 - y1)) / (width * height) * 100
-                        # total_fire_area += area
-                        fire_detected = True
+                # Vẽ bounding box (đã nội suy) của các track lửa từ một mảng gọn
+                fire_tracks = fire_only(tracks)
+                renderer.draw_boxes(frame, fire_tracks)
+                fire_detected = len(fire_tracks) > 0
 
                 # Tính FPS
                 if not is_skipped:
@@ -227,37 +351,38 @@ def predict_and_display(model, video_path, output_path=None, initial_skip_frames
                     avg_fps = 1.0 / (current_time - prev_time)
                     prev_time = current_time
 
-                # Vẽ FPS
-                text = f"FPS: {avg_fps:.0f}"
-                position = (5, 35)
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                font_scale = 1.2
-                thickness = 2
-
-                (text_width, text_height), _ = cv2.getTextSize(text, font, font_scale, thickness)
-                x, y = position
-                box_coords = ((x - 5, y - text_height - 10), (x + text_width + 5, y + 5))
-
-                overlay = frame.copy()
-                cv2.rectangle(overlay, box_coords[0], box_coords[1], (255, 0, 0), -1)
-                alpha = 0.25
-                cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-                cv2.putText(frame, text, position, font, font_scale, (255, 255, 255), thickness)
+                # Vẽ FPS (chỉ trộn màu trong vùng hộp FPS)
+                renderer.draw_fps(frame, avg_fps)
 
                 # Tính confidence trung bình cho frame hiện tại
-                avg_confidence = sum(current_confidences) / len(current_confidences) if current_confidences else 0.0
+                avg_confidence = float(fire_tracks["conf"].mean()) if fire_detected else 0.0
 
                 # Cập nhật frame_info với confidence
                 frame_info = {
                     "frame": idx,
                     "video_time": video_time_str,
+                    "timestamp": round(video_time, 3),
                     "fire_detected": fire_detected,
                     "total_area": round(float(total_fire_area), 4),
-                    "confidence": round(float(avg_confidence), 4)  # Thêm confidence vào frame_info
+                    "confidence": round(float(avg_confidence), 4),  # Thêm confidence vào frame_info
+                    "track_ids": fire_tracks["track_id"].tolist(),
+                    "boxes": detections_to_boxes(fire_tracks),  # [x1, y1, x2, y2, conf, track_id] của các vùng cháy
                 }
 
+                if timeline is not None:
+                    timeline.append(frame_info)
+                encode_start = time.perf_counter()
+                stage_time["render"] += encode_start - render_start
                 if out is not None:
                     out.write(frame)
+                    stage_time["encode"] += time.perf_counter() - encode_start
+
+                # Bỏ mốc thời gian của các frame đã bị loại khỏi hàng đợi (drop_oldest)
+                while capture_times and capture_times[0][0] < idx:
+                    capture_times.popleft()
+                if capture_times and capture_times[0][0] == idx:
+                    latencies.append(time.perf_counter() - capture_times.popleft()[1])
+
                 if not is_skipped:
                     yield frame, frame_info
 
@@ -275,15 +400,78 @@ def predict_and_display(model, video_path, output_path=None, initial_skip_frames
         yield from draw_and_yield()
     finally:
         stop_event.set()
+        # Đóng hàng đợi để giải phóng các luồng đang chờ ghi khi phía đọc dừng sớm
+        frame_queue.close()
+        result_queue.close()
         capture_t.join(timeout=1)
         inference_t.join(timeout=1)
-        cap.release()
+        release_capture()
         if out is not None:
             out.release()
 
+        # Thời gian từng công đoạn và phân vị độ trễ của frame trong pipeline
+        stats["stage_time"] = {
+            "decode": round(stage_time["decode"], 3),
+            "infer": round(stats["inference_time"], 3),
+            "render": round(stage_time["render"], 3),
+            "encode": round(stage_time["encode"], 3),
+        }
+        if latencies:
+            values = np.array(latencies) * 1000
+            stats["latency_ms"] = {
+                "p50": round(float(np.percentile(values, 50)), 2),
+                "p90": round(float(np.percentile(values, 90)), 2),
+                "p99": round(float(np.percentile(values, 99)), 2),
+                "max": round(float(values.max()), 2),
+            }
+
+        # Tốc độ phân tích thực tế đạt được (frame suy luận / giây video) và độ phủ thời gian
+        stats["scheduler"] = scheduler.stats()
+        stats["analysis_fps"] = stats["scheduler"]["effective_analysis_fps"]
+        logger.info(
+            f"Lập lịch suy luận: {stats['analysis_fps']} frame/giây video "
+            f"(mục tiêu {target_fps or 'mọi frame'}), khoảng trống lớn nhất "
+            f"{stats['scheduler']['max_observed_gap']} giây"
+        )
+
+        # Số lần suy luận tiết kiệm được nhờ cổng chuyển động
+        if motion_gate is not None:
+            stats["motion_gate"] = motion_gate.stats()
+            stats["saved_inferences"] = motion_gate.reused
+            logger.info(
+                f"Cổng chuyển động: dùng lại kết quả cho {motion_gate.reused}/{motion_gate.checked} frame"
+            )
+
+        if prefilter is not None:
+            stats["prefilter"] = prefilter.stats()
+            logger.info(f"Bộ lọc màu lửa: {stats['prefilter']}")
+
+        # Thống kê hàng đợi: số frame bị bỏ (drop_oldest) và số lần phải chờ (block)
+        stats["frame_queue"] = frame_queue.stats()
+        stats["result_queue"] = result_queue.stats()
+        stats["dropped_frames"] = frame_queue.dropped + result_queue.dropped
+        stats["blocked_puts"] = frame_queue.blocked + result_queue.blocked
+        if stats["dropped_frames"] or stats["blocked_puts"]:
+            logger.info(
+                f"Hàng đợi ({queue_policy}): bỏ {stats['dropped_frames']} frame, "
+                f"chờ ghi {stats['blocked_puts']} lần"
+            )
+
+        # Báo cáo thông lượng suy luận của phiên và mức tăng so với đường đơn frame
+        if stats["inference_time"] > 0:
+            stats["inference_fps"] = round(stats["inferred_frames"] / stats["inference_time"], 2)
+            if "single_frame_fps" in stats:
+                stats["batch_speedup"] = round(stats["inference_fps"] / stats["single_frame_fps"], 2)
+            logger.info(
+                f"Suy luận {stats['inferred_frames']} frame trong {stats['inference_batches']} batch "
+                f"(batch_size={batch_size}): {stats['inference_fps']} frame/giây"
+                + (f", nhanh gấp {stats['batch_speedup']} lần so với suy luận từng frame" if "batch_speedup" in stats else "")
+            )
+
 class FireDetectionService:      
-    def __init__(self):
-        self.model_path = settings.MODEL_PATH
+    def __init__(self, model_path: Optional[str] = None, backend: Optional[str] = None):
+        self.model_path = model_path or settings.MODEL_PATH
+        self.backend = backend or settings.INFERENCE_BACKEND
         self.model = None
         self.device = None
         
@@ -310,8 +498,7 @@ class FireDetectionService:
             # Xử lý đường dẫn tương đối nếu cần
             if self.model_path.startswith('./') or self.model_path.startswith('../'):
                 # Nếu là đường dẫn tương đối, chuyển nó thành đường dẫn tuyệt đối
-                base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                absolute_model_path = os.path.normpath(os.path.join(base_dir, self.model_path))
+                absolute_model_path = resolve_model_path(self.model_path)
                 logger.info(f"Chuyển đổi đường dẫn model từ {self.model_path} thành {absolute_model_path}")
                 self.model_path = absolute_model_path
               # Kiểm tra xem file model có tồn tại hay không
@@ -332,38 +519,28 @@ class FireDetectionService:
             except:
                 logger.warning("Không thể xác định phiên bản ultralytics")
             
-            # Đặt biến môi trường để tắt kiểm tra bảo mật của PyTorch 2.6
-            os.environ["TORCH_WEIGHTS_ONLY"] = "0"
-            
             try:
-                # Import thư viện sau khi đặt biến môi trường
-                from ultralytics import YOLO
-                
                 # Configure torch serialization to allow loading model
                 torch.backends.cudnn.benchmark = True  # Cải thiện hiệu suất
                 
-                # Patch the torch.load function to use weights_only=False
-                original_load = torch.load
-                def patched_load(*args, **kwargs):
-                    kwargs['weights_only'] = False
-                    return original_load(*args, **kwargs)
-                
-                # Apply the patch
-                torch.load = patched_load
-                
-                # Tải model
+                # Tải model theo backend đã cấu hình (torch, onnx hoặc openvino)
                 start_time = time.time()
-                self.model = YOLO(self.model_path)
+                try:
+                    self.model = load_yolo_model(self.model_path, self.backend, settings.INFERENCE_THREADS)
+                except Exception as e:
+                    if self.backend == "torch":
+                        raise
+                    logger.error(f"Không thể tải model với backend {self.backend}: {str(e)}")
+                    logger.warning("Chuyển sang backend torch mặc định")
+                    self.backend = "torch"
+                    self.model = load_yolo_model(self.model_path, self.backend, settings.INFERENCE_THREADS)
                 
-                # Đưa model lên GPU nếu có
-                if self.use_gpu:
+                # Đưa model lên GPU nếu có (chỉ áp dụng cho backend torch)
+                if self.use_gpu and self.backend == "torch":
                     self.model.to(self.device)
                 
-                # Restore original torch.load
-                torch.load = original_load
-                
                 logger.info(f"Thời gian tải model: {time.time() - start_time:.2f} giây")
-                logger.info(f"Đã tải model YOLO thành công từ {self.model_path}")
+                logger.info(f"Đã tải model YOLO thành công từ {self.model_path} (backend: {self.backend})")
                 return True
             except AttributeError as e:                
                 if "C3k2" in str(e):
@@ -377,7 +554,157 @@ class FireDetectionService:
             logger.error(f"Lỗi khi tải model YOLO: {str(e)}")
             self.model = None
             return False
+    def predict(self, frames: Union[np.ndarray, List[np.ndarray]], prefilter: Optional[FireColorPrefilter] = None,
+                conf: float = 0.5) -> List[Any]:
+        """
+        Suy luận một hoặc nhiều frame, qua bộ lọc màu lửa nếu có
+        
+        Args:
+            frames: Một frame hoặc danh sách frame BGR
+            prefilter: Bộ lọc màu lửa của phiên (None = luôn chạy model)
+            conf: Ngưỡng confidence
             
-
-
-        
\ No newline at end of file
+        Returns:
+            List[Any]: Danh sách Results của ultralytics theo thứ tự frame
+        """
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        return cascade_predict(self.model, frames, prefilter, conf=conf)
+    
+    def analyze_video(self, video_data: Union[bytes, BinaryIO, str], output_path: Optional[str] = None,
+                      session_stats: Optional[Dict[str, Any]] = None, merge_gap: float = 1.0,
+                      timeline: Optional[TimelineWriter] = None, target_fps: Optional[float] = 0.0,
+                      motion_gating: Optional[bool] = False) -> Dict[str, Any]:
+        """
+        Phân tích video trong một lượt giải mã và một lượt suy luận duy nhất.
+        Trả về cùng lúc các khoảng thời gian có cháy, frame có diện tích cháy lớn nhất
+        và (nếu có output_path) video đã đánh dấu vùng cháy.
+        
+        Args:
+            video_data: Bytes, file-like object hoặc đường dẫn/URL của video
+            output_path: Đường dẫn lưu video đã xử lý (nếu None, không lưu)
+            session_stats: Dict (tùy chọn) để nhận thống kê hiệu năng của phiên xử lý
+            merge_gap: Khoảng cách tối đa (giây) giữa hai frame có cháy để gộp thành một khoảng
+            timeline: TimelineWriter (tùy chọn) nhận thông tin phát hiện của mọi frame
+            target_fps: Số frame suy luận mỗi giây video; mặc định 0 = suy luận mọi frame như trước,
+                None = dùng settings.ANALYSIS_TARGET_FPS
+            motion_gating: Dùng lại kết quả khi khung cảnh không đổi; mặc định False,
+                None = dùng settings.MOTION_GATE_ENABLED
+            
+        Returns:
+            Dict[str, Any]: 
+                - fire_detected: Có phát hiện cháy hay không
+                - detections: Danh sách khoảng thời gian có cháy (fire_start_time, fire_end_time, confidence, max_fire_frame, time)
+                - max_fire_frame: Tuple (dữ liệu JPEG, ".jpg") của frame có diện tích cháy lớn nhất, hoặc None
+                - output_path: Đường dẫn video đã xử lý (hoặc None)
+                - frames_processed: Số frame đã phân tích
+        """
+        if not self.model:
+            raise RuntimeError("Model YOLO chưa được tải")
+        
+        stats = session_stats if session_stats is not None else {}
+        detections = []
+        current = None
+        frames_processed = 0
+        max_area = 0.0
+        max_frame = None
+        
+        def close_interval(interval):
+            interval["confidence"] = round(min(1.0, sum(interval.pop("confidences")) / interval.pop("fire_frames")), 4)
+            interval.pop("max_area")
+            detections.append(interval)
+        
+        # Phân tích offline không có hạn chót thời gian thực: không bỏ frame vì độ trễ.
+        # Kết quả lưu lại mặc định vẫn suy luận mọi frame, không phụ thuộc ANALYSIS_TARGET_FPS / MOTION_GATE_ENABLED
+        for frame, frame_info in predict_and_display(self.model, video_data, output_path, session_stats=stats,
+                                                     latency_budget=0, timeline=timeline,
+                                                     target_fps=target_fps, motion_gating=motion_gating):
+            frames_processed += 1
+            if not frame_info["fire_detected"]:
+                continue
+            
+            fps = stats.get("fps") or 30
+            frame_time = frame_info["frame"] / fps
+            area = frame_info["total_area"]
+            
+            # Gộp các frame có cháy gần nhau thành một khoảng thời gian
+            if current is not None and frame_time - current["fire_end_time"] > merge_gap:
+                close_interval(current)
+                current = None
+            if current is None:
+                current = {
+                    "fire_start_time": round(frame_time, 3),
+                    "fire_end_time": round(frame_time, 3),
+                    "time": frame_info["video_time"],
+                    "max_fire_frame": frame_info["frame"],
+                    "max_area": area,
+                    "confidences": [],
+                    "fire_frames": 0,
+                }
+            # Thời điểm kết thúc tính đến hết frame cuối có cháy (luôn lớn hơn thời điểm bắt đầu)
+            current["fire_end_time"] = round(frame_time + 1.0 / fps, 3)
+            current["fire_frames"] += 1
+            current["confidences"].append(frame_info["confidence"])
+            if area > current["max_area"]:
+                current["max_area"] = area
+                current["max_fire_frame"] = frame_info["frame"]
+            
+            # Chỉ sao chép frame khi tìm được frame có diện tích cháy lớn hơn
+            if max_frame is None or area > max_area:
+                max_area = area
+                max_frame = frame.copy()
+        
+        if current is not None:
+            close_interval(current)
+        
+        max_fire_frame = None
+        if max_frame is not None:
+            success, buffer = cv2.imencode('.jpg', max_frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if success:
+                max_fire_frame = (buffer.tobytes(), ".jpg")
+        
+        logger.info(f"Phân tích xong {frames_processed} frame, phát hiện {len(detections)} khoảng thời gian có cháy")
+        return {
+            "fire_detected": bool(detections),
+            "detections": detections,
+            "max_fire_frame": max_fire_frame,
+            "output_path": output_path,
+            "frames_processed": frames_processed,
+        }
+    
+    def detect_fire_from_memory(self, video_data: Union[bytes, BinaryIO]) -> Tuple[bool, List[Dict[str, Any]], Optional[Tuple[bytes, str]]]:
+        """
+        Phát hiện đám cháy từ dữ liệu video trong bộ nhớ (không tạo video đầu ra)
+        
+        Args:
+            video_data: Bytes hoặc file-like object của video
+            
+        Returns:
+            Tuple[bool, List[Dict], Optional[Tuple[bytes, str]]]: Có cháy hay không, các khoảng có cháy và frame cháy lớn nhất
+        """
+        result = self.analyze_video(video_data)
+        return result["fire_detected"], result["detections"], result["max_fire_frame"]
+    
+    def process_video_from_memory(self, video_data: Union[bytes, BinaryIO]) -> Tuple[bool, Optional[bytes], Dict[str, Any]]:
+        """
+        Xử lý video trong bộ nhớ và trả về video đã đánh dấu vùng cháy
+        
+        Args:
+            video_data: Bytes hoặc file-like object của video
+            
+        Returns:
+            Tuple[bool, Optional[bytes], Dict]: Trạng thái thành công, dữ liệu video đã xử lý và thông tin phát hiện
+        """
+        temp_output = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=settings.TEMP_DIR)
+        temp_output.close()
+        try:
+            result = self.analyze_video(video_data, output_path=temp_output.name)
+            with open(temp_output.name, "rb") as f:
+                processed_data = f.read()
+            return bool(processed_data), processed_data, result
+        except Exception as e:
+            logger.error(f"Lỗi khi xử lý video trong bộ nhớ: {str(e)}")
+            return False, None, {}
+        finally:
+            if os.path.exists(temp_output.name):
+                os.remove(temp_output.name)
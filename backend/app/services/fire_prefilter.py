@@ -0,0 +1,306 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from app.core.config import settings
+from app.services.detections import fire_only, results_to_detections
+
+logger = logging.getLogger(__name__)
+
+# Các chế độ của bộ lọc màu lửa
+# - off: không dùng, mọi frame đều qua model
+# - on: frame không có điểm ảnh màu lửa thì bỏ qua model
+# - evaluate: vẫn chạy model trên mọi frame (kết quả không đổi), đồng thời đo recall bị mất
+#   nếu bật bộ lọc so với luôn chạy model
+PREFILTER_MODES = ("off", "on", "evaluate")
+
+
+class FireColorPrefilter:
+    """
+    Tầng lọc rẻ trước model: kiểm tra màu lửa (HSV và YCrCb) trên frame đã thu nhỏ.
+    Frame không có điểm ảnh ứng viên được coi là không có cháy và không cần chạy model;
+    khi có ứng viên, có thể chỉ suy luận trên các vùng cắt quanh ứng viên.
+    """
+
+    def __init__(self, mode: str = "on", width: int = 160, min_pixels: int = 4, use_crops: bool = False,
+                 crop_margin: float = 0.5, max_crop_ratio: float = 0.5):
+        """
+        Args:
+            mode: "on" hoặc "evaluate"
+            width: Chiều rộng ảnh thu nhỏ dùng để kiểm tra màu
+            min_pixels: Số điểm ảnh màu lửa tối thiểu (trên ảnh thu nhỏ) để coi là có ứng viên
+            use_crops: Chỉ suy luận trên vùng cắt quanh ứng viên thay vì cả frame
+            crop_margin: Phần mở rộng mỗi phía của vùng cắt, tính theo kích thước vùng ứng viên
+            max_crop_ratio: Tổng diện tích vùng cắt vượt tỉ lệ này thì suy luận cả frame
+        """
+        if mode not in PREFILTER_MODES or mode == "off":
+            raise ValueError(f"Chế độ bộ lọc màu lửa không hợp lệ: {mode}")
+        self.mode = mode
+        self.width = max(16, int(width))
+        self.min_pixels = max(1, int(min_pixels))
+        self.use_crops = use_crops
+        self.crop_margin = crop_margin
+        self.max_crop_ratio = max_crop_ratio
+
+        self.frames = 0
+        self.candidate_frames = 0
+        self.model_calls_saved = 0
+        self.crop_frames = 0
+        # Thống kê chế độ evaluate
+        self.model_fire_frames = 0
+        self.kept_fire_frames = 0
+        self.model_fire_boxes = 0
+        self.kept_fire_boxes = 0
+
+    def candidate_mask(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Tạo mask các điểm ảnh có màu lửa trên frame đã thu nhỏ
+
+        Args:
+            frame: Frame BGR
+
+        Returns:
+            np.ndarray: Mask uint8 (255 = ứng viên) ở độ phân giải thu nhỏ
+        """
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, round(height * self.width / width))),
+                           interpolation=cv2.INTER_AREA)
+
+        # HSV: sắc độ đỏ - cam - vàng, độ bão hòa và độ sáng cao
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        hsv_mask = cv2.inRange(hsv, (0, 80, 150), (35, 255, 255)) | cv2.inRange(hsv, (170, 80, 150), (180, 255, 255))
+
+        # YCrCb: Y > Cb, Cr > Cb và Cr - Cb đủ lớn (đặc trưng của vùng lửa sáng)
+        ycrcb = cv2.cvtColor(small, cv2.COLOR_BGR2YCrCb).astype(np.int16)
+        y, cr, cb = ycrcb[..., 0], ycrcb[..., 1], ycrcb[..., 2]
+        ycrcb_mask = (y > cb) & (cr - cb >= 20) & (y >= 100)
+
+        return hsv_mask & (ycrcb_mask.astype(np.uint8) * 255)
+
+    def find_regions(self, frame: np.ndarray) -> Optional[List[Tuple[int, int, int, int]]]:
+        """
+        Tìm các vùng ứng viên màu lửa trên frame
+
+        Args:
+            frame: Frame BGR
+
+        Returns:
+            Optional[List[Tuple[int, int, int, int]]]: Danh sách vùng (x1, y1, x2, y2) ở độ phân giải gốc,
+            danh sách rỗng nếu không có ứng viên, None nếu nên suy luận cả frame
+        """
+        mask = self.candidate_mask(frame)
+        if cv2.countNonZero(mask) < self.min_pixels:
+            return []
+        if not self.use_crops:
+            return None
+
+        height, width = frame.shape[:2]
+        scale = width / mask.shape[1]
+        mask = cv2.dilate(mask, np.ones((3, 3), np.uint8))
+        count, _, components, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        regions = []
+        for x, y, w, h, _ in components[1:count]:
+            margin_x = max(w * self.crop_margin, 4) * scale
+            margin_y = max(h * self.crop_margin, 4) * scale
+            regions.append((
+                max(0, int(x * scale - margin_x)),
+                max(0, int(y * scale - margin_y)),
+                min(width, int((x + w) * scale + margin_x)),
+                min(height, int((y + h) * scale + margin_y)),
+            ))
+        regions = _merge_regions(regions)
+
+        crop_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        if crop_area > self.max_crop_ratio * width * height:
+            return None
+        return regions
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Lấy thống kê của bộ lọc, gồm recall so với luôn chạy model ở chế độ evaluate
+
+        Returns:
+            Dict[str, Any]: Thống kê của bộ lọc
+        """
+        result = {
+            "mode": self.mode,
+            "frames": self.frames,
+            "candidate_frames": self.candidate_frames,
+            "model_calls_saved": self.model_calls_saved,
+            "crop_frames": self.crop_frames,
+            "saved_ratio": round(self.model_calls_saved / self.frames, 4) if self.frames else 0.0,
+        }
+        if self.mode == "evaluate":
+            result.update({
+                "model_fire_frames": self.model_fire_frames,
+                "kept_fire_frames": self.kept_fire_frames,
+                "frame_recall": round(self.kept_fire_frames / self.model_fire_frames, 4) if self.model_fire_frames else 1.0,
+                "model_fire_boxes": self.model_fire_boxes,
+                "kept_fire_boxes": self.kept_fire_boxes,
+                "box_recall": round(self.kept_fire_boxes / self.model_fire_boxes, 4) if self.model_fire_boxes else 1.0,
+            })
+        return result
+
+
+def _merge_regions(regions: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """Gộp các vùng chồng lấn nhau cho đến khi không còn vùng nào chồng lấn"""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for box in merged:
+            for i, other in enumerate(result):
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    result[i] = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(box)
+        merged = result
+    return merged
+
+
+def _empty_result(model, frame: np.ndarray):
+    """Tạo Results rỗng (không có phát hiện) cho frame bị bộ lọc loại"""
+    from ultralytics.engine.results import Results
+
+    return Results(orig_img=frame, path="", names=model.names, boxes=torch.zeros((0, 6)))
+
+
+def _predict_crops(model, frame: np.ndarray, regions: List[Tuple[int, int, int, int]], conf: float):
+    """
+    Suy luận trên các vùng cắt rồi ghép kết quả về tọa độ của frame gốc
+    (box được dịch theo vị trí vùng cắt, mask được đặt vào mask kích thước frame)
+    """
+    from ultralytics.engine.results import Results
+
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+    # retina_masks=True để mask có cùng độ phân giải với vùng cắt, dán thẳng vào frame gốc
+    results = model.predict(crops, save=False, conf=conf, verbose=False, retina_masks=True)
+
+    height, width = frame.shape[:2]
+    boxes = []
+    masks = []
+    for (x1, y1, x2, y2), result in zip(regions, results):
+        if result.boxes is None or len(result.boxes) == 0:
+            continue
+        data = result.boxes.data.clone().cpu()
+        data[:, [0, 2]] += x1
+        data[:, [1, 3]] += y1
+        boxes.append(data)
+        if result.masks is not None:
+            crop_masks = result.masks.data.cpu()
+            full = torch.zeros((crop_masks.shape[0], height, width), dtype=torch.uint8)
+            full[:, y1:y2, x1:x2] = (crop_masks > 0.5).to(torch.uint8)
+            masks.append(full)
+
+    boxes = torch.cat(boxes) if boxes else torch.zeros((0, 6))
+    masks = torch.cat(masks) if masks and sum(len(m) for m in masks) == len(boxes) else None
+    return Results(orig_img=frame, path="", names=model.names, boxes=boxes, masks=masks)
+
+
+def _fire_boxes(result) -> np.ndarray:
+    """Lấy các box thuộc lớp lửa (class 0) của một kết quả"""
+    return fire_only(results_to_detections(result))["xyxy"]
+
+
+def _count_matched(reference: np.ndarray, candidate: np.ndarray, iou_threshold: float = 0.5) -> int:
+    """Đếm số box tham chiếu có box ứng viên khớp (IoU >= ngưỡng)"""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0
+    x1 = np.maximum(reference[:, None, 0], candidate[None, :, 0])
+    y1 = np.maximum(reference[:, None, 1], candidate[None, :, 1])
+    x2 = np.minimum(reference[:, None, 2], candidate[None, :, 2])
+    y2 = np.minimum(reference[:, None, 3], candidate[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_ref = (reference[:, 2] - reference[:, 0]) * (reference[:, 3] - reference[:, 1])
+    area_cand = (candidate[:, 2] - candidate[:, 0]) * (candidate[:, 3] - candidate[:, 1])
+    ious = inter / np.maximum(area_ref[:, None] + area_cand[None, :] - inter, 1e-9)
+    return int(np.count_nonzero(ious.max(axis=1) >= iou_threshold))
+
+
+def cascade_predict(model, frames: List[np.ndarray], prefilter: Optional[FireColorPrefilter], conf: float = 0.5) -> List[Any]:
+    """
+    Suy luận một nhóm frame qua tầng lọc màu lửa rồi mới tới model
+
+    Args:
+        model: Mô hình YOLO
+        frames: Danh sách frame BGR
+        prefilter: Bộ lọc màu lửa (None = luôn chạy model trên cả frame)
+        conf: Ngưỡng confidence
+
+    Returns:
+        List[Any]: Danh sách Results của ultralytics, theo đúng thứ tự frame
+    """
+    if prefilter is None:
+        return list(model.predict(frames, save=False, conf=conf, verbose=False))
+
+    regions = [prefilter.find_regions(frame) for frame in frames]
+    prefilter.frames += len(frames)
+    prefilter.candidate_frames += sum(1 for r in regions if r != [])
+
+    if prefilter.mode == "evaluate":
+        # Kết quả trả về luôn là của model trên cả frame, chỉ đo những gì bộ lọc sẽ làm mất
+        results = list(model.predict(frames, save=False, conf=conf, verbose=False))
+        for frame, frame_regions, result in zip(frames, regions, results):
+            reference = _fire_boxes(result)
+            if frame_regions == []:
+                kept = np.zeros((0, 4))
+                prefilter.model_calls_saved += 1
+            elif frame_regions is None:
+                kept = reference
+            else:
+                prefilter.crop_frames += 1
+                kept = _fire_boxes(_predict_crops(model, frame, frame_regions, conf))
+            if len(reference):
+                prefilter.model_fire_frames += 1
+                prefilter.kept_fire_frames += int(len(kept) > 0)
+                prefilter.model_fire_boxes += len(reference)
+                prefilter.kept_fire_boxes += _count_matched(reference, kept)
+        return results
+
+    results = [None] * len(frames)
+    full_indices = []
+    for i, (frame, frame_regions) in enumerate(zip(frames, regions)):
+        if frame_regions == []:
+            results[i] = _empty_result(model, frame)
+            prefilter.model_calls_saved += 1
+        elif frame_regions is None:
+            full_indices.append(i)
+        else:
+            prefilter.crop_frames += 1
+            results[i] = _predict_crops(model, frame, frame_regions, conf)
+
+    if full_indices:
+        full_results = model.predict([frames[i] for i in full_indices], save=False, conf=conf, verbose=False)
+        for i, result in zip(full_indices, full_results):
+            results[i] = result
+    return results
+
+
+def create_fire_prefilter(mode: Optional[str] = None) -> Optional[FireColorPrefilter]:
+    """
+    Tạo bộ lọc màu lửa theo cấu hình, hoặc None nếu tắt
+
+    Args:
+        mode: "off", "on" hoặc "evaluate" (mặc định settings.PREFILTER_MODE)
+
+    Returns:
+        Optional[FireColorPrefilter]: Bộ lọc mới cho một phiên xử lý
+    """
+    mode = mode or settings.PREFILTER_MODE
+    if mode not in PREFILTER_MODES:
+        raise ValueError(f"Chế độ bộ lọc màu lửa không hợp lệ: {mode}. Hỗ trợ: {', '.join(PREFILTER_MODES)}")
+    if mode == "off":
+        return None
+    return FireColorPrefilter(
+        mode=mode,
+        width=settings.PREFILTER_WIDTH,
+        min_pixels=settings.PREFILTER_MIN_PIXELS,
+        use_crops=settings.PREFILTER_CROPS,
+    )
@@ -0,0 +1,154 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.detections import empty_detections
+
+
+class Track:
+    """Một đối tượng được theo dõi qua nhiều frame (vùng cháy)"""
+
+    __slots__ = ("track_id", "box", "velocity", "conf", "cls", "mask", "last_idx", "hits", "misses")
+
+    def __init__(self, track_id: int, box: np.ndarray, conf: float, cls: int, mask: Optional[np.ndarray], idx: int):
+        self.track_id = track_id
+        self.box = box.astype(np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)  # Vận tốc (pixel / frame) của 4 tọa độ box
+        self.conf = conf
+        self.cls = cls
+        self.mask = mask
+        self.last_idx = idx
+        self.hits = 1
+        self.misses = 0  # Số lần suy luận liên tiếp không ghép được box nào
+
+    def predict(self, idx: int) -> np.ndarray:
+        """Dự đoán box tại frame idx theo mô hình vận tốc không đổi"""
+        return self.box + self.velocity * (idx - self.last_idx)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Tính ma trận IoU giữa hai tập box dạng (N, 4) và (M, 4)
+    """
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class FireTracker:
+    """
+    Bộ theo dõi đa đối tượng gọn nhẹ: ghép box mới với track cũ theo IoU (sau khi dự đoán vị trí
+    bằng vận tốc không đổi), gán ID ổn định cho từng vùng cháy và nội suy vị trí box trên các frame
+    không chạy model. Nhờ đó có thể chỉ suy luận mỗi 3-5 frame mà lớp phủ vẫn mượt.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 1, max_age: int = 30, smoothing: float = 0.5):
+        """
+        Args:
+            iou_threshold: IoU tối thiểu để ghép một box với một track
+            max_misses: Số lần suy luận liên tiếp không thấy lại đối tượng trước khi xóa track
+            max_age: Số frame tối đa giữ track kể từ lần phát hiện cuối (kể cả khi không có suy luận nào)
+            smoothing: Hệ số làm mượt khi cập nhật vận tốc (0-1, càng lớn càng theo sát số đo mới)
+        """
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.max_age = max_age
+        self.smoothing = smoothing
+        self.tracks: List[Track] = []
+        self._next_id = 1
+
+    def update(self, idx: int, detections: np.ndarray,
+               masks: Optional[Sequence[np.ndarray]] = None) -> List[Track]:
+        """
+        Cập nhật tracker với các phát hiện của frame vừa được suy luận
+
+        Args:
+            idx: Chỉ số frame
+            detections: Mảng phát hiện kiểu DETECTION_DTYPE
+            masks: Mask tương ứng với từng phát hiện (nếu có)
+
+        Returns:
+            List[Track]: Các track được cập nhật hoặc tạo mới tại frame này
+        """
+        boxes = detections["xyxy"]
+        confs = detections["conf"]
+        classes = detections["cls"]
+        if masks is not None and len(masks) != len(detections):
+            masks = None
+        self._expire(idx)
+
+        matched_tracks = set()
+        matched_dets = set()
+        current = []
+        if self.tracks and len(boxes):
+            predicted = np.stack([track.predict(idx) for track in self.tracks])
+            ious = box_iou(predicted, boxes)
+            # Ghép tham lam theo IoU giảm dần, chỉ ghép box cùng lớp
+            for flat in np.argsort(-ious, axis=None):
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if t in matched_tracks or d in matched_dets:
+                    continue
+                track = self.tracks[t]
+                if track.cls != int(classes[d]):
+                    continue
+                matched_tracks.add(t)
+                matched_dets.add(d)
+
+                elapsed = max(1, idx - track.last_idx)
+                velocity = (boxes[d] - track.box) / elapsed
+                track.velocity += self.smoothing * (velocity - track.velocity)
+                track.box = boxes[d].copy()
+                track.conf = float(confs[d])
+                track.mask = masks[d] if masks is not None else None
+                track.last_idx = idx
+                track.hits += 1
+                track.misses = 0
+                current.append(track)
+
+        # Track không được ghép ở lần suy luận này bị tính thêm một lần bỏ lỡ
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for d in range(len(boxes)):
+            if d in matched_dets:
+                continue
+            track = Track(self._next_id, boxes[d], float(confs[d]), int(classes[d]),
+                          masks[d] if masks is not None else None, idx)
+            self._next_id += 1
+            self.tracks.append(track)
+            current.append(track)
+        return current
+
+    def active(self, idx: int) -> Tuple[np.ndarray, List[Optional[np.ndarray]]]:
+        """
+        Lấy các track còn sống tại frame idx với box đã nội suy
+
+        Args:
+            idx: Chỉ số frame
+
+        Returns:
+            Mảng phát hiện kiểu DETECTION_DTYPE (track_id là ID của track) và mask tương ứng của từng track
+        """
+        self._expire(idx)
+        detections = empty_detections(len(self.tracks))
+        if not self.tracks:
+            return detections, []
+        detections["xyxy"] = np.stack([
+            track.predict(idx) if idx > track.last_idx else track.box for track in self.tracks
+        ]).round()
+        detections["conf"] = [track.conf for track in self.tracks]
+        detections["cls"] = [track.cls for track in self.tracks]
+        detections["track_id"] = [track.track_id for track in self.tracks]
+        return detections, [track.mask for track in self.tracks]
+
+    def _expire(self, idx: int) -> None:
+        self.tracks = [track for track in self.tracks if idx - track.last_idx <= self.max_age]
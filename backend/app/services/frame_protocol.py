@@ -0,0 +1,184 @@
+import json
+import struct
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Giao thức gửi frame qua WebSocket
+# - json: giao thức cũ, mỗi frame gồm 2 message (ảnh JPEG nhị phân + {"status": "frame", "frame_info": ...})
+# - binary: mỗi frame là 1 message nhị phân duy nhất
+#       header cố định | mảng box | metadata (JSON hoặc msgpack) | ảnh JPEG
+FRAME_PROTOCOLS = ("json", "binary")
+FRAME_PROTOCOL_VERSION = 1
+METADATA_CODECS = ("json", "msgpack")
+
+FRAME_MAGIC = b"FD"
+# magic, version, flags, frame index, timestamp (giây video), số box, độ dài metadata (little-endian, 22 byte)
+FRAME_HEADER = struct.Struct("<2sBBIdHI")
+# Mỗi box: x1, y1, x2, y2, confidence (float32) và ID theo dõi (int32), 24 byte
+BOX_DTYPE = np.dtype([("xyxy", "<f4", (4,)), ("conf", "<f4"), ("track_id", "<i4")])
+
+FLAG_FIRE = 0x01  # Frame có cháy
+FLAG_MSGPACK = 0x02  # Metadata mã hóa bằng msgpack (nếu không là JSON UTF-8)
+
+# Các trường đã nằm trong header / mảng box, không lặp lại trong metadata
+_HEADER_FIELDS = ("frame", "timestamp", "fire_detected", "boxes")
+
+
+def _load_msgpack():
+    try:
+        import msgpack
+        return msgpack
+    except ImportError:
+        return None
+
+
+_msgpack = _load_msgpack()
+
+
+def negotiate_frame_protocol(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chọn giao thức gửi frame theo yêu cầu của client lúc kết nối
+
+    Args:
+        request: Message đầu tiên của client, có thể chứa frame_protocol ("binary" / "json"),
+            protocol_version và metadata ("msgpack" / "json")
+
+    Returns:
+        Dict[str, Any]: Giao thức được chọn: frame_protocol, version, metadata.
+            Client không yêu cầu hoặc yêu cầu phiên bản không hỗ trợ thì dùng giao thức JSON
+    """
+    requested = request.get("frame_protocol", "json")
+    version = request.get("protocol_version", FRAME_PROTOCOL_VERSION)
+    if requested != "binary" or version != FRAME_PROTOCOL_VERSION:
+        return {"frame_protocol": "json", "version": FRAME_PROTOCOL_VERSION, "metadata": "json"}
+
+    metadata = "json"
+    if request.get("metadata") == "msgpack":
+        if _msgpack is not None:
+            metadata = "msgpack"
+        else:
+            logger.info("Client yêu cầu metadata msgpack nhưng chưa cài msgpack, dùng JSON")
+    return {"frame_protocol": "binary", "version": FRAME_PROTOCOL_VERSION, "metadata": metadata}
+
+
+def pack_boxes(boxes: Any) -> bytes:
+    """
+    Đóng gói box thành mảng BOX_DTYPE
+
+    Args:
+        boxes: Danh sách [x1, y1, x2, y2, conf, track_id]
+    """
+    rows = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+    packed = np.empty(len(rows), dtype=BOX_DTYPE)
+    packed["xyxy"] = rows[:, :4]
+    packed["conf"] = rows[:, 4]
+    packed["track_id"] = rows[:, 5]
+    return packed.tobytes()
+
+
+class FrameMessageEncoder:
+    """
+    Mã hóa frame_info và ảnh JPEG thành một message nhị phân của giao thức binary,
+    đồng thời thống kê số byte của từng phần
+    """
+
+    def __init__(self, metadata_codec: str = "json"):
+        if metadata_codec not in METADATA_CODECS:
+            raise ValueError(f"Kiểu metadata không hợp lệ: {metadata_codec}. Hỗ trợ: {', '.join(METADATA_CODECS)}")
+        if metadata_codec == "msgpack" and _msgpack is None:
+            raise ValueError("Chưa cài msgpack")
+        self.metadata_codec = metadata_codec
+
+        self.messages = 0
+        self.header_bytes = 0
+        self.box_bytes = 0
+        self.metadata_bytes = 0
+        self.payload_bytes = 0
+
+    def encode(self, frame_info: Dict[str, Any], jpeg: bytes) -> bytes:
+        """
+        Args:
+            frame_info: Thông tin frame từ predict_and_display
+            jpeg: Ảnh JPEG của frame
+
+        Returns:
+            bytes: Message nhị phân
+        """
+        flags = FLAG_FIRE if frame_info.get("fire_detected") else 0
+        metadata = {key: value for key, value in frame_info.items() if key not in _HEADER_FIELDS}
+        if self.metadata_codec == "msgpack":
+            flags |= FLAG_MSGPACK
+            metadata_bytes = _msgpack.packb(metadata, use_bin_type=True)
+        else:
+            metadata_bytes = json.dumps(metadata, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        boxes = pack_boxes(frame_info.get("boxes", ()))
+        header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_PROTOCOL_VERSION, flags, int(frame_info.get("frame", 0)),
+                                   float(frame_info.get("timestamp", 0.0)), len(boxes) // BOX_DTYPE.itemsize,
+                                   len(metadata_bytes))
+
+        self.messages += 1
+        self.header_bytes += len(header)
+        self.box_bytes += len(boxes)
+        self.metadata_bytes += len(metadata_bytes)
+        self.payload_bytes += len(jpeg)
+        return b"".join((header, boxes, metadata_bytes, jpeg))
+
+    def stats(self) -> Dict[str, Any]:
+        """Số byte trung bình mỗi frame của từng phần message"""
+        count = max(1, self.messages)
+        return {
+            "metadata_codec": self.metadata_codec,
+            "messages": self.messages,
+            "avg_header_bytes": round(self.header_bytes / count, 1),
+            "avg_box_bytes": round(self.box_bytes / count, 1),
+            "avg_metadata_bytes": round(self.metadata_bytes / count, 1),
+            "avg_payload_bytes": round(self.payload_bytes / count, 1),
+        }
+
+
+def decode_frame_message(data: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Giải mã một message của giao thức binary (dùng cho client Python và kiểm thử)
+
+    Returns:
+        Thông tin frame (gồm các trường trong header, boxes và metadata) và ảnh JPEG
+    """
+    magic, version, flags, frame_idx, timestamp, box_count, metadata_length = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Message không thuộc giao thức binary")
+    if version != FRAME_PROTOCOL_VERSION:
+        raise ValueError(f"Phiên bản giao thức không hỗ trợ: {version}")
+
+    offset = FRAME_HEADER.size
+    boxes = np.frombuffer(data, dtype=BOX_DTYPE, count=box_count, offset=offset)
+    offset += boxes.nbytes
+    metadata_bytes = data[offset:offset + metadata_length]
+    offset += metadata_length
+
+    if flags & FLAG_MSGPACK:
+        if _msgpack is None:
+            raise ValueError("Chưa cài msgpack")
+        metadata = _msgpack.unpackb(metadata_bytes, raw=False)
+    else:
+        metadata = json.loads(metadata_bytes.decode("utf-8"))
+
+    frame_info: Dict[str, Any] = {
+        "frame": frame_idx,
+        "timestamp": timestamp,
+        "fire_detected": bool(flags & FLAG_FIRE),
+        "boxes": [[*box["xyxy"].tolist(), float(box["conf"]), int(box["track_id"])] for box in boxes],
+    }
+    frame_info.update(metadata)
+    return frame_info, bytes(data[offset:])
+
+
+def create_frame_encoder(protocol: Dict[str, Any]) -> Optional[FrameMessageEncoder]:
+    """Tạo bộ mã hóa cho giao thức đã thỏa thuận, None nếu dùng giao thức JSON"""
+    if protocol.get("frame_protocol") != "binary":
+        return None
+    return FrameMessageEncoder(protocol.get("metadata", "json"))
@@ -0,0 +1,118 @@
+import time
+import queue
+import threading
+from typing import Any, Dict, Optional
+
+# Chính sách khi hàng đợi đầy
+# - block: luồng ghi chờ cho đến khi có chỗ (giữ đủ mọi frame, dùng cho xử lý offline)
+# - drop_oldest: bỏ phần tử cũ nhất để nhường chỗ (ưu tiên frame mới, dùng cho xem trực tiếp)
+QUEUE_POLICIES = ("block", "drop_oldest")
+
+
+class BoundedFrameQueue:
+    """
+    Hàng đợi frame có giới hạn kích thước và chính sách xử lý khi đầy (backpressure).
+    Giới hạn số frame thô nằm trong RAM khi luồng giải mã nhanh hơn luồng suy luận,
+    đồng thời đếm số frame bị bỏ và số lần luồng ghi phải chờ.
+    """
+
+    def __init__(self, maxsize: int, policy: str = "block"):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Chính sách hàng đợi không hợp lệ: {policy}. Hỗ trợ: {', '.join(QUEUE_POLICIES)}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._closed = threading.Event()
+        # Khóa cho thao tác "bỏ phần tử cũ nhất rồi thêm mới" của chính sách drop_oldest
+        self._drop_lock = threading.Lock()
+
+        self.put_count = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.blocked_time = 0.0
+        self.max_depth = 0
+
+    def put(self, item: Any) -> bool:
+        """
+        Thêm phần tử vào hàng đợi theo chính sách đã chọn
+
+        Args:
+            item: Phần tử cần thêm
+
+        Returns:
+            bool: False nếu hàng đợi đã đóng (phía đọc đã dừng), phần tử không được thêm
+        """
+        if self._closed.is_set():
+            return False
+
+        if self.policy == "drop_oldest":
+            with self._drop_lock:
+                while True:
+                    try:
+                        self._queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            self._queue.get_nowait()
+                            self._queue.task_done()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.blocked += 1
+                start_time = time.time()
+                # Chờ theo từng khoảng ngắn để thoát kịp khi hàng đợi bị đóng
+                while True:
+                    if self._closed.is_set():
+                        self.blocked_time += time.time() - start_time
+                        return False
+                    try:
+                        self._queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                self.blocked_time += time.time() - start_time
+
+        self.put_count += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        return self._queue.get(timeout=timeout)
+
+    def task_done(self) -> None:
+        self._queue.task_done()
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def close(self) -> None:
+        """Đóng hàng đợi, giải phóng các luồng đang chờ ghi"""
+        self._closed.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Lấy thống kê của hàng đợi
+
+        Returns:
+            Dict[str, Any]: Kích thước, chính sách, số phần tử đã nhận, bị bỏ, số lần phải chờ
+        """
+        return {
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "put": self.put_count,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "blocked_time": round(self.blocked_time, 3),
+            "max_depth": self.max_depth,
+        }
@@ -0,0 +1,139 @@
+from typing import Any, Dict, Optional
+
+
+class FrameScheduler:
+    """
+    Bộ lập lịch chọn frame cần suy luận theo tốc độ phân tích mục tiêu và ngân sách độ trễ.
+    Quyết định dựa trên thời gian suy luận đo được và số frame đang chờ trong hàng đợi,
+    đồng thời đảm bảo khoảng cách giữa hai frame được suy luận không vượt quá max_gap
+    (độ phủ thời gian tối thiểu). Chỉ dựa vào chỉ số frame và FPS của video, không phụ thuộc
+    CAP_PROP_FRAME_COUNT (không đáng tin với nguồn HTTP).
+    """
+
+    def __init__(self, fps_video: float, target_fps: float = 0.0, latency_budget: float = 0.0,
+                 max_gap: float = 0.5, smoothing: float = 0.2):
+        """
+        Args:
+            fps_video: FPS của video nguồn
+            target_fps: Số frame suy luận mỗi giây video mong muốn (0 = suy luận mọi frame)
+            latency_budget: Độ trễ tối đa (giây) cho phép của một frame từ lúc vào hàng đợi
+                đến khi có kết quả (0 = không giới hạn, dùng cho xử lý offline)
+            max_gap: Khoảng cách tối đa (giây video) giữa hai frame được suy luận
+            smoothing: Hệ số làm mượt (EMA) cho thời gian suy luận đo được
+        """
+        self.fps_video = fps_video if fps_video and fps_video > 0 else 30.0
+        self.frame_duration = 1.0 / self.fps_video
+        self.target_fps = max(0.0, float(target_fps or 0.0))
+        self.latency_budget = max(0.0, float(latency_budget or 0.0))
+        self.max_gap = max(self.frame_duration, float(max_gap or 0.0))
+        self.smoothing = smoothing
+
+        # Khoảng cách (giây video) tối thiểu giữa hai frame suy luận theo tốc độ mục tiêu
+        self.target_interval = 1.0 / self.target_fps if self.target_fps > 0 else 0.0
+
+        self.inference_time: Optional[float] = None  # Thời gian suy luận trung bình mỗi frame
+        self.last_inferred_idx: Optional[int] = None
+        # Thời điểm (giây video) đến lượt suy luận tiếp theo, cộng dồn target_interval để giữ đúng
+        # tốc độ mục tiêu khi không chia hết FPS video (vd. 15/25 fps thay vì làm tròn thành 12.5)
+        self.next_due = 0.0
+        self.last_seen_idx = -1
+        self.inferred = 0
+        self.skipped = 0
+        self.skipped_by_rate = 0
+        self.skipped_by_deadline = 0
+        self.forced_by_coverage = 0
+        self.max_observed_gap = 0.0
+
+    def estimated_latency(self, queue_depth: int) -> float:
+        """
+        Ước lượng độ trễ của frame mới nếu được suy luận: các frame đang chờ phía trước
+        cộng chính nó, nhân với thời gian suy luận trung bình mỗi frame
+        """
+        if self.inference_time is None:
+            return 0.0
+        return (queue_depth + 1) * self.inference_time
+
+    def should_infer(self, idx: int, queue_depth: int = 0) -> bool:
+        """
+        Quyết định có suy luận frame idx hay không
+
+        Args:
+            idx: Chỉ số frame trong video
+            queue_depth: Số frame đang chờ suy luận (trong hàng đợi và batch đang gom)
+
+        Returns:
+            bool: True nếu cần suy luận frame này
+        """
+        self.last_seen_idx = max(self.last_seen_idx, idx)
+
+        if self.last_inferred_idx is None:
+            return self._mark_inferred(idx)
+
+        gap = (idx - self.last_inferred_idx) * self.frame_duration
+        # Đảm bảo độ phủ thời gian: không để khoảng trống vượt quá max_gap
+        if gap + self.frame_duration / 2 >= self.max_gap:
+            self.forced_by_coverage += 1
+            return self._mark_inferred(idx)
+
+        # Giới hạn theo tốc độ phân tích mục tiêu (sai số nhỏ cho phép bù lỗi làm tròn số thực)
+        if idx * self.frame_duration < self.next_due - self.frame_duration * 1e-3:
+            self.skipped += 1
+            self.skipped_by_rate += 1
+            return False
+
+        # Ngân sách độ trễ: hàng đợi tồn quá nhiều thì bỏ qua để đuổi kịp
+        if self.latency_budget > 0 and self.estimated_latency(queue_depth) > self.latency_budget:
+            self.skipped += 1
+            self.skipped_by_deadline += 1
+            return False
+
+        return self._mark_inferred(idx)
+
+    def _mark_inferred(self, idx: int) -> bool:
+        if self.last_inferred_idx is not None:
+            gap = (idx - self.last_inferred_idx) * self.frame_duration
+            self.max_observed_gap = max(self.max_observed_gap, gap)
+        # Khi bị chậm (bỏ vì độ trễ, suy luận bắt buộc) không suy luận dồn để bù, chỉ giữ nhịp từ frame này
+        timestamp = idx * self.frame_duration
+        self.next_due = max(self.next_due + self.target_interval, timestamp + self.target_interval - self.frame_duration)
+        self.last_inferred_idx = idx
+        self.inferred += 1
+        return True
+
+    def record_inference(self, frame_count: int, elapsed: float) -> None:
+        """
+        Cập nhật thời gian suy luận đo được sau một lần predict
+
+        Args:
+            frame_count: Số frame trong lần suy luận (kích thước batch)
+            elapsed: Thời gian thực hiện (giây)
+        """
+        if frame_count <= 0:
+            return
+        per_frame = elapsed / frame_count
+        if self.inference_time is None:
+            self.inference_time = per_frame
+        else:
+            self.inference_time += self.smoothing * (per_frame - self.inference_time)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Lấy thống kê lập lịch, gồm tốc độ phân tích thực tế (frame suy luận / giây video)
+
+        Returns:
+            Dict[str, Any]: Thống kê của bộ lập lịch
+        """
+        video_duration = (self.last_seen_idx + 1) * self.frame_duration
+        return {
+            "target_fps": self.target_fps,
+            "latency_budget": self.latency_budget,
+            "max_gap": round(self.max_gap, 3),
+            "scheduled_frames": self.inferred,
+            "skipped_frames": self.skipped,
+            "skipped_by_rate": self.skipped_by_rate,
+            "skipped_by_deadline": self.skipped_by_deadline,
+            "forced_by_coverage": self.forced_by_coverage,
+            "max_observed_gap": round(self.max_observed_gap, 3),
+            "effective_analysis_fps": round(self.inferred / video_duration, 2) if video_duration > 0 else 0.0,
+            "avg_inference_time": round(self.inference_time, 4) if self.inference_time is not None else None,
+        }
@@ -0,0 +1,209 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Các backend suy luận được hỗ trợ
+# - torch: tải trực tiếp checkpoint .pt qua ultralytics (mặc định, hỗ trợ GPU)
+# - onnx: export sang ONNX một lần và chạy bằng ONNX Runtime trên CPU
+# - openvino: export sang OpenVINO IR một lần và chạy bằng OpenVINO Runtime
+# - onnx_int8: model ONNX lượng tử hóa INT8 (xem app/services/quantization.py)
+SUPPORTED_BACKENDS = ("torch", "onnx", "openvino", "onnx_int8")
+
+
+@contextmanager
+def allow_full_torch_load():
+    """
+    Tạm thời cho phép torch.load nạp toàn bộ checkpoint (weights_only=False).
+    PyTorch >= 2.6 mặc định chặn việc này, khiến checkpoint ultralytics không tải được.
+    """
+    os.environ["TORCH_WEIGHTS_ONLY"] = "0"
+    original_load = torch.load
+
+    def patched_load(*args, **kwargs):
+        kwargs['weights_only'] = False
+        return original_load(*args, **kwargs)
+
+    torch.load = patched_load
+    try:
+        yield
+    finally:
+        torch.load = original_load
+
+
+def resolve_model_path(model_path: str) -> str:
+    """
+    Chuyển đường dẫn model tương đối (./ hoặc ../) thành đường dẫn tuyệt đối tính từ thư mục backend
+
+    Args:
+        model_path: Đường dẫn model trong cấu hình
+
+    Returns:
+        str: Đường dẫn tuyệt đối đã chuẩn hóa
+    """
+    if model_path.startswith('./') or model_path.startswith('../'):
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return os.path.normpath(os.path.join(base_dir, model_path))
+    return model_path
+
+
+def exported_model_path(model_path: str, backend: str) -> str:
+    """
+    Lấy đường dẫn file đã export của một backend, nằm cạnh checkpoint gốc
+
+    Args:
+        model_path: Đường dẫn tới checkpoint .pt
+        backend: Tên backend ("onnx" hoặc "openvino")
+
+    Returns:
+        str: Đường dẫn file .onnx hoặc thư mục *_openvino_model
+    """
+    stem = os.path.splitext(model_path)[0]
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    raise ValueError(f"Backend không hỗ trợ export: {backend}")
+
+
+def _is_export_fresh(model_path: str, export_path: str) -> bool:
+    """Kiểm tra file export đã tồn tại và không cũ hơn checkpoint gốc"""
+    if not os.path.exists(export_path):
+        return False
+    return os.path.getmtime(export_path) >= os.path.getmtime(model_path)
+
+
+def export_model(model_path: str, backend: str) -> str:
+    """
+    Export checkpoint .pt sang định dạng của backend, chỉ thực hiện một lần.
+    File export được cache cạnh checkpoint và chỉ export lại khi checkpoint thay đổi.
+
+    Args:
+        model_path: Đường dẫn tuyệt đối tới checkpoint .pt
+        backend: Tên backend ("onnx" hoặc "openvino")
+
+    Returns:
+        str: Đường dẫn tới model đã export
+    """
+    export_path = exported_model_path(model_path, backend)
+    if _is_export_fresh(model_path, export_path):
+        logger.info(f"Sử dụng model {backend} đã export trước đó: {export_path}")
+        return export_path
+
+    from ultralytics import YOLO
+
+    logger.info(f"Đang export model {model_path} sang {backend}...")
+    start_time = time.time()
+    with allow_full_torch_load():
+        # dynamic=True để model chấp nhận batch có kích thước thay đổi (dùng cho suy luận theo batch)
+        exported = YOLO(model_path).export(format=backend, dynamic=True, verbose=False)
+    logger.info(f"Export model {backend} hoàn tất sau {time.time() - start_time:.2f} giây: {exported}")
+    return str(exported)
+
+
+def exported_model_task(export_path: str) -> Optional[str]:
+    """
+    Đọc task (detect, segment, ...) từ metadata của model đã export.
+    Nếu không truyền task, ultralytics đoán theo tên file và có thể nhầm model segment thành detect.
+
+    Args:
+        export_path: Đường dẫn file .onnx hoặc thư mục *_openvino_model
+
+    Returns:
+        Optional[str]: Tên task hoặc None nếu không đọc được
+    """
+    try:
+        if os.path.isdir(export_path):
+            from ultralytics.utils import yaml_load
+            return yaml_load(os.path.join(export_path, "metadata.yaml")).get("task")
+        from app.services.quantization import read_onnx_metadata
+        return read_onnx_metadata(export_path).get("task")
+    except Exception as e:
+        logger.warning(f"Không đọc được task từ metadata của {export_path}: {str(e)}")
+        return None
+
+
+def _tune_onnx_session(model, onnx_path: str, num_threads: int) -> None:
+    """
+    Thay session ONNX Runtime mặc định của ultralytics bằng session đã tinh chỉnh số luồng
+
+    Args:
+        model: Đối tượng YOLO đã tải từ file .onnx
+        onnx_path: Đường dẫn file .onnx
+        num_threads: Số luồng intra-op cho ONNX Runtime
+    """
+    import onnxruntime
+
+    # Chạy warm-up một lần để ultralytics khởi tạo predictor và AutoBackend
+    model.predict(np.zeros((64, 64, 3), dtype=np.uint8), save=False, verbose=False)
+    backend = model.predictor.model
+    if not getattr(backend, "dynamic", False):
+        # Session tĩnh dùng io_binding gắn với session cũ, không thể thay thế an toàn
+        logger.warning("Model ONNX không có batch động, giữ nguyên session mặc định của ONNX Runtime")
+        return
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = num_threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    backend.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    logger.info(f"ONNX Runtime sử dụng {num_threads} luồng intra-op")
+
+
+def resolve_num_threads(num_threads: Optional[int] = None) -> int:
+    """
+    Xác định số luồng CPU dùng cho suy luận
+
+    Args:
+        num_threads: Số luồng mong muốn (0 hoặc None = dùng toàn bộ lõi CPU)
+
+    Returns:
+        int: Số luồng thực tế
+    """
+    if num_threads and num_threads > 0:
+        return num_threads
+    return os.cpu_count() or 1
+
+
+def load_yolo_model(model_path: str, backend: str = "torch", num_threads: Optional[int] = None):
+    """
+    Tải model YOLO theo backend được chọn. Các backend đều trả về đối tượng ultralytics YOLO,
+    nên kết quả predict vẫn có cùng giao diện boxes/masks cho toàn bộ pipeline.
+
+    Args:
+        model_path: Đường dẫn tuyệt đối tới checkpoint .pt
+        backend: "torch", "onnx", "openvino" hoặc "onnx_int8"
+        num_threads: Số luồng CPU cho suy luận (0 hoặc None = tự động)
+
+    Returns:
+        YOLO: Model đã sẵn sàng suy luận
+    """
+    from ultralytics import YOLO
+
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Backend suy luận không hợp lệ: {backend}. Hỗ trợ: {', '.join(SUPPORTED_BACKENDS)}")
+
+    threads = resolve_num_threads(num_threads)
+
+    if backend == "torch":
+        if num_threads:
+            torch.set_num_threads(threads)
+        with allow_full_torch_load():
+            return YOLO(model_path)
+
+    if backend == "onnx_int8":
+        from app.services.quantization import quantize_model
+        export_path = quantize_model(model_path)
+    else:
+        export_path = export_model(model_path, backend)
+    model = YOLO(export_path, task=exported_model_task(export_path))
+    if backend in ("onnx", "onnx_int8"):
+        _tune_onnx_session(model, export_path, threads)
+    return model
@@ -0,0 +1,177 @@
+import gc
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple, Any
+
+import torch
+
+from app.core.config import settings
+from app.services.fire_detection import FireDetectionService
+from app.services.inference_backends import resolve_model_path
+
+logger = logging.getLogger(__name__)
+
+
+class SerializedModel:
+    """
+    Bọc model YOLO dùng chung, tuần tự hóa các lần gọi predict.
+    Predictor của ultralytics giữ trạng thái (batch, kết quả trung gian) nên không an toàn khi nhiều
+    luồng suy luận cùng gọi trên một instance; các thuộc tính khác được chuyển thẳng tới model gốc.
+    """
+
+    def __init__(self, model: Any):
+        self._model = model
+        self._predict_lock = threading.Lock()
+
+    def predict(self, *args, **kwargs):
+        with self._predict_lock:
+            return self._model.predict(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        with self._predict_lock:
+            return self._model(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model, name)
+
+
+class _RegistryEntry:
+    """Một model đã đăng ký: service dùng chung, số tham chiếu và khóa tải model"""
+
+    def __init__(self):
+        self.service: Optional[FireDetectionService] = None
+        self.ref_count = 0
+        self.load_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Registry dùng chung model trong toàn bộ tiến trình.
+    Mỗi cặp (đường dẫn model, backend) chỉ được tải một lần, khi có yêu cầu đầu tiên (lazy),
+    và được đếm tham chiếu để có thể giải phóng chủ động khi không còn ai sử dụng.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], _RegistryEntry] = {}
+
+    @staticmethod
+    def _make_key(model_path: Optional[str], backend: Optional[str]) -> Tuple[str, str]:
+        return resolve_model_path(model_path or settings.MODEL_PATH), backend or settings.INFERENCE_BACKEND
+
+    def acquire(self, model_path: Optional[str] = None, backend: Optional[str] = None) -> FireDetectionService:
+        """
+        Lấy service phát hiện đám cháy dùng chung, tải model nếu chưa có.
+        Mỗi lần acquire thành công cần một lần release tương ứng. Tải model thất bại thì không
+        lưu service, lần acquire sau sẽ tải lại.
+
+        Args:
+            model_path: Đường dẫn model (mặc định settings.MODEL_PATH)
+            backend: Backend suy luận (mặc định settings.INFERENCE_BACKEND)
+
+        Returns:
+            FireDetectionService: Service dùng chung của tiến trình (model đã được tải)
+
+        Raises:
+            RuntimeError: Không tải được model
+        """
+        key = self._make_key(model_path, backend)
+        with self._lock:
+            entry = self._entries.setdefault(key, _RegistryEntry())
+            entry.ref_count += 1
+
+        # Tải model ngoài khóa chung để không chặn các model khác; khóa riêng đảm bảo chỉ tải một lần
+        try:
+            with entry.load_lock:
+                if entry.service is None:
+                    logger.info(f"Registry: tải model {key[0]} (backend: {key[1]})")
+                    service = FireDetectionService(model_path=key[0], backend=key[1])
+                    if service.model is None:
+                        raise RuntimeError(f"Không thể tải model YOLO: {key[0]} (backend: {key[1]})")
+                    # Nhiều phiên dùng chung một model nên các lần predict được tuần tự hóa
+                    service.model = SerializedModel(service.model)
+                    entry.service = service
+        except Exception:
+            with self._lock:
+                entry.ref_count -= 1
+                # Không giữ mục rỗng của model tải lỗi trong registry
+                if entry.ref_count == 0 and entry.service is None and self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        return entry.service
+
+    def release(self, service: FireDetectionService) -> None:
+        """
+        Trả lại service đã acquire. Model vẫn được giữ trong bộ nhớ cho lần dùng sau
+        cho đến khi gọi unload.
+
+        Args:
+            service: Service đã nhận từ acquire
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.service is service:
+                    entry.ref_count = max(0, entry.ref_count - 1)
+                    return
+        logger.warning("Registry: release một service không được quản lý bởi registry")
+
+    def unload(self, model_path: Optional[str] = None, backend: Optional[str] = None, force: bool = False) -> bool:
+        """
+        Giải phóng model khỏi bộ nhớ
+
+        Args:
+            model_path: Đường dẫn model (mặc định settings.MODEL_PATH)
+            backend: Backend suy luận (mặc định settings.INFERENCE_BACKEND)
+            force: Giải phóng kể cả khi vẫn còn tham chiếu
+
+        Returns:
+            bool: True nếu model đã được giải phóng
+        """
+        key = self._make_key(model_path, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry.ref_count > 0 and not force:
+                logger.warning(f"Registry: không thể giải phóng model {key[0]} vì còn {entry.ref_count} tham chiếu")
+                return False
+            del self._entries[key]
+
+        with entry.load_lock:
+            if entry.service is not None:
+                entry.service.model = None
+                entry.service = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f"Registry: đã giải phóng model {key[0]} (backend: {key[1]})")
+        return True
+
+    def unload_all(self) -> None:
+        """Giải phóng mọi model trong registry (gọi khi tắt ứng dụng)"""
+        with self._lock:
+            keys = list(self._entries)
+        for model_path, backend in keys:
+            self.unload(model_path, backend, force=True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Lấy trạng thái các model trong registry
+
+        Returns:
+            List[Dict[str, Any]]: Đường dẫn, backend, số tham chiếu và trạng thái tải của từng model
+        """
+        with self._lock:
+            return [
+                {
+                    "model_path": key[0],
+                    "backend": key[1],
+                    "ref_count": entry.ref_count,
+                    "loaded": entry.service is not None and entry.service.model is not None,
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+# Registry dùng chung cho toàn bộ tiến trình
+model_registry = ModelRegistry()
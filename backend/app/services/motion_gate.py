@@ -0,0 +1,123 @@
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+
+class MotionGate:
+    """
+    Cổng chuyển động: so sánh frame hiện tại với frame được suy luận gần nhất bằng hiệu tuyệt đối
+    trên ảnh xám đã thu nhỏ. Khi khung cảnh không đổi (camera cố định, không có gì chuyển động),
+    kết quả phát hiện trước đó được dùng lại thay vì chạy model; model chỉ chạy lại khi có thay đổi
+    hoặc khi kết quả cũ đã quá max_staleness giây.
+    """
+
+    def __init__(self, width: int = 160, pixel_threshold: int = 15, changed_ratio: float = 0.001,
+                 max_staleness: float = 2.0):
+        """
+        Args:
+            width: Chiều rộng ảnh thu nhỏ dùng để so sánh (giữ nguyên tỉ lệ khung hình)
+            pixel_threshold: Chênh lệch mức xám (0-255) để coi một điểm ảnh là thay đổi
+            changed_ratio: Tỉ lệ điểm ảnh thay đổi tối thiểu để coi là có chuyển động
+            max_staleness: Thời gian tối đa (giây) được dùng lại kết quả cũ
+        """
+        self.width = max(8, int(width))
+        self.pixel_threshold = pixel_threshold
+        self.changed_ratio = changed_ratio
+        self.max_staleness = max_staleness
+
+        self._reference: Optional[np.ndarray] = None
+        self._reference_time: Optional[float] = None
+        # Kết quả của frame suy luận gần nhất, để nơi gọi dùng lại khi frame không đổi
+        self.last_result: Any = None
+
+        self.checked = 0
+        self.inferred = 0
+        self.reused = 0
+        self.forced_by_staleness = 0
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, round(height * self.width / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Làm mờ nhẹ để nhiễu cảm biến không bị coi là chuyển động
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def should_infer(self, frame: np.ndarray, timestamp: float) -> bool:
+        """
+        Kiểm tra frame có cần chạy model hay có thể dùng lại kết quả trước đó.
+        Khi trả về True, frame này trở thành frame tham chiếu cho các lần so sánh sau.
+
+        Args:
+            frame: Frame BGR cần kiểm tra
+            timestamp: Thời điểm của frame (giây, theo thời gian video hoặc thời gian thực)
+
+        Returns:
+            bool: True nếu có thay đổi hoặc kết quả cũ đã quá hạn
+        """
+        self.checked += 1
+        small = self._downscale(frame)
+
+        infer = self._reference is None or self._reference.shape != small.shape
+        if not infer and timestamp - self._reference_time >= self.max_staleness:
+            infer = True
+            self.forced_by_staleness += 1
+        if not infer:
+            diff = cv2.absdiff(small, self._reference)
+            changed = np.count_nonzero(diff > self.pixel_threshold)
+            infer = changed >= self.changed_ratio * diff.size
+
+        if infer:
+            self._reference = small
+            self._reference_time = timestamp
+            self.inferred += 1
+        else:
+            self.reused += 1
+        return infer
+
+    def reset(self) -> None:
+        """Bỏ frame tham chiếu, lần kiểm tra tiếp theo chắc chắn chạy model"""
+        self._reference = None
+        self._reference_time = None
+        self.last_result = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Lấy thống kê của cổng chuyển động
+
+        Returns:
+            Dict[str, Any]: Số frame đã kiểm tra, số lần chạy model, số lần suy luận tiết kiệm được
+        """
+        return {
+            "checked_frames": self.checked,
+            "inferred_frames": self.inferred,
+            "saved_inferences": self.reused,
+            "forced_by_staleness": self.forced_by_staleness,
+            "saved_ratio": round(self.reused / self.checked, 4) if self.checked else 0.0,
+        }
+
+
+def create_motion_gate(enabled: Optional[bool] = None) -> Optional[MotionGate]:
+    """
+    Tạo cổng chuyển động theo cấu hình, hoặc None nếu tính năng bị tắt
+
+    Args:
+        enabled: Bật/tắt cổng chuyển động (mặc định settings.MOTION_GATE_ENABLED)
+
+    Returns:
+        Optional[MotionGate]: Cổng chuyển động mới cho một phiên xử lý
+    """
+    if enabled is None:
+        enabled = settings.MOTION_GATE_ENABLED
+    if not enabled:
+        return None
+    return MotionGate(
+        width=settings.MOTION_GATE_WIDTH,
+        pixel_threshold=settings.MOTION_PIXEL_THRESHOLD,
+        changed_ratio=settings.MOTION_CHANGED_RATIO,
+        max_staleness=settings.MOTION_MAX_STALENESS_MS / 1000.0,
+    )
@@ -0,0 +1,201 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+def union_masks(masks: Sequence[Optional[np.ndarray]]) -> Optional[np.ndarray]:
+    """
+    Hợp tất cả mask thành một mask duy nhất ở độ phân giải của model
+
+    Args:
+        masks: Các mask (bool hoặc float 0-1), có thể có phần tử None
+
+    Returns:
+        Optional[np.ndarray]: Mask bool hợp nhất, None nếu không có mask nào
+    """
+    union = None
+    for mask in masks:
+        if mask is None:
+            continue
+        if union is None:
+            union = np.zeros(mask.shape[:2], dtype=bool)
+        elif mask.shape[:2] != union.shape:
+            # Mask từ nguồn khác (vd. vùng cắt của bộ lọc màu lửa) được đưa về cùng kích thước
+            mask = cv2.resize(mask.astype(np.uint8), (union.shape[1], union.shape[0]), interpolation=cv2.INTER_NEAREST)
+        union |= mask > 0.5
+    return union
+
+
+def _mask_region(frame: np.ndarray, masks: Sequence[Optional[np.ndarray]]):
+    """
+    Hợp các mask và phóng to phần nằm trong vùng bao lên độ phân giải của frame
+
+    Returns:
+        Vùng bao (y1, y2, x1, x2) trên frame và mask bool của vùng đó, None nếu mask rỗng
+    """
+    union = union_masks(masks)
+    if union is None:
+        return None
+    rows = np.flatnonzero(union.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(union.any(axis=0))
+
+    frame_height, frame_width = frame.shape[:2]
+    mask_height, mask_width = union.shape
+
+    # Vùng bao của mask hợp nhất trên frame: các hàng/cột của frame mà phép phóng to
+    # nearest-neighbor (src = floor(dst * mask / frame)) rơi vào vùng bao ở độ phân giải model
+    y1 = -(-rows[0] * frame_height // mask_height)
+    y2 = min(frame_height, -(-(rows[-1] + 1) * frame_height // mask_height))
+    x1 = -(-cols[0] * frame_width // mask_width)
+    x2 = min(frame_width, -(-(cols[-1] + 1) * frame_width // mask_width))
+    if y2 <= y1 or x2 <= x1:
+        return None
+
+    # Phóng to chỉ phần mask trong vùng bao, cho kết quả giống hệt phóng to cả mask
+    src_rows = np.arange(y1, y2) * mask_height // frame_height
+    src_cols = np.arange(x1, x2) * mask_width // frame_width
+    roi_mask = union[np.ix_(src_rows, src_cols)]
+    return (y1, y2, x1, x2), roi_mask
+
+
+def composite_masks(frame: np.ndarray, masks: Sequence[Optional[np.ndarray]],
+                    color: Tuple[int, int, int] = (255, 0, 0), alpha: float = 0.6,
+                    additive: bool = False) -> float:
+    """
+    Tô màu tất cả mask lên frame trong một lượt duy nhất: hợp các mask ở độ phân giải của model,
+    chỉ phóng to vùng bao quanh mask hợp nhất lên độ phân giải của frame và chỉ trộn màu trong vùng đó.
+    Diện tích cháy được tính trên chính mask hợp nhất nên các mask chồng lấn không bị đếm hai lần.
+
+    Args:
+        frame: Frame BGR, được vẽ trực tiếp
+        masks: Các mask ở độ phân giải của model (mask phủ toàn bộ khung hình)
+        color: Màu tô (BGR)
+        alpha: Độ đậm của màu tô
+        additive: True để cộng màu vào ảnh (frame + alpha * color) thay vì trộn theo tỉ lệ
+
+    Returns:
+        float: Diện tích vùng được tô, tính theo % diện tích frame
+    """
+    region = _mask_region(frame, masks)
+    if region is None:
+        return 0.0
+    (y1, y2, x1, x2), roi_mask = region
+    roi = frame[y1:y2, x1:x2]
+    colored = np.empty_like(roi)
+    colored[:] = color
+    blended = cv2.addWeighted(roi, 1.0 if additive else 1.0 - alpha, colored, alpha, 0)
+    np.copyto(roi, blended, where=roi_mask[..., None])
+    return np.count_nonzero(roi_mask) / (frame.shape[0] * frame.shape[1]) * 100
+
+
+class FrameRenderer:
+    """
+    Bộ vẽ lớp phủ cho một phiên xử lý, không cấp phát bộ nhớ cỡ frame cho mỗi frame:
+    - chỉ trộn màu trong vùng (ROI) dưới mask, hộp FPS và nhãn thay vì sao chép cả frame
+    - dùng lại các bộ đệm tạm (scratch) của phiên cho ảnh màu và ảnh trộn
+    - lưu kích thước chữ theo từng chuỗi nhãn, không gọi cv2.getTextSize lặp lại
+    - vẽ tất cả box từ một mảng phát hiện gọn (xyxy, conf, cls, track_id)
+    """
+
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    # Giới hạn số chuỗi nhãn được lưu kích thước để bộ nhớ không tăng mãi
+    MAX_CACHED_LABELS = 1024
+
+    def __init__(self):
+        self._text_sizes: Dict[Tuple[str, float, int], Tuple[int, int]] = {}
+        self._color_buffers: Dict[Tuple[int, int, int], np.ndarray] = {}
+        self._blend_buffer: Optional[np.ndarray] = None
+
+    def text_size(self, text: str, font_scale: float, thickness: int) -> Tuple[int, int]:
+        """Lấy (rộng, cao) của chuỗi, có lưu lại theo chuỗi, cỡ chữ và độ dày"""
+        key = (text, font_scale, thickness)
+        size = self._text_sizes.get(key)
+        if size is None:
+            if len(self._text_sizes) >= self.MAX_CACHED_LABELS:
+                self._text_sizes.clear()
+            size = cv2.getTextSize(text, self.FONT, font_scale, thickness)[0]
+            self._text_sizes[key] = size
+        return size
+
+    def _buffers(self, frame: np.ndarray, color: Tuple[int, int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Lấy bộ đệm màu (đã tô sẵn) và bộ đệm trộn có kích thước bằng frame, cấp phát lại khi đổi kích thước"""
+        color = tuple(int(c) for c in color)
+        colored = self._color_buffers.get(color)
+        if colored is None or colored.shape != frame.shape:
+            colored = np.empty_like(frame)
+            colored[:] = color
+            self._color_buffers[color] = colored
+        if self._blend_buffer is None or self._blend_buffer.shape != frame.shape:
+            self._blend_buffer = np.empty_like(frame)
+        return colored, self._blend_buffer
+
+    def blend_rect(self, frame: np.ndarray, x1: int, y1: int, x2: int, y2: int,
+                   color: Tuple[int, int, int], alpha: float) -> None:
+        """Tô một hình chữ nhật bán trong suốt, chỉ trộn màu trong vùng của nó"""
+        height, width = frame.shape[:2]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 <= x1 or y2 <= y1:
+            return
+        colored, _ = self._buffers(frame, color)
+        roi = frame[y1:y2, x1:x2]
+        cv2.addWeighted(roi, 1.0 - alpha, colored[y1:y2, x1:x2], alpha, 0, dst=roi)
+
+    def draw_masks(self, frame: np.ndarray, masks: Sequence[Optional[np.ndarray]],
+                   color: Tuple[int, int, int] = (255, 0, 0), alpha: float = 0.6,
+                   additive: bool = False) -> float:
+        """
+        Tô tất cả mask trong một lượt như composite_masks, nhưng dùng bộ đệm của phiên
+
+        Returns:
+            float: Diện tích vùng được tô, tính theo % diện tích frame
+        """
+        region = _mask_region(frame, masks)
+        if region is None:
+            return 0.0
+        (y1, y2, x1, x2), roi_mask = region
+        colored, blended = self._buffers(frame, color)
+        roi = frame[y1:y2, x1:x2]
+        blended_roi = blended[y1:y2, x1:x2]
+        cv2.addWeighted(roi, 1.0 if additive else 1.0 - alpha, colored[y1:y2, x1:x2], alpha, 0, dst=blended_roi)
+        np.copyto(roi, blended_roi, where=roi_mask[..., None])
+        return np.count_nonzero(roi_mask) / (frame.shape[0] * frame.shape[1]) * 100
+
+    def draw_boxes(self, frame: np.ndarray, detections: np.ndarray, color: Optional[Tuple[int, int, int]] = None,
+                   font_scale: float = 1.5, label_background: bool = True, show_track_id: bool = True) -> None:
+        """
+        Vẽ tất cả box từ một mảng phát hiện gọn
+
+        Args:
+            frame: Frame BGR, được vẽ trực tiếp
+            detections: Mảng kiểu DETECTION_DTYPE (track_id < 0 nếu không có)
+            color: Màu box cố định; None = màu theo confidence
+            font_scale: Cỡ chữ của nhãn
+            label_background: Vẽ nền đặc phía sau nhãn
+            show_track_id: Hiển thị ID theo dõi trong nhãn
+        """
+        # Chuyển sang kiểu Python một lần cho cả mảng thay vì từng phần tử numpy
+        boxes = detections["xyxy"].astype(np.int32).tolist()
+        confs = detections["conf"].tolist()
+        track_ids = detections["track_id"].tolist()
+        for (x1, y1, x2, y2), conf, track_id in zip(boxes, confs, track_ids):
+            box_color = color if color is not None else (min(255, int(200 + (conf * 55))), 0, 0)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 4)
+
+            label = f"#{track_id} {conf:.2f}" if show_track_id and track_id >= 0 else f"{conf:.2f}"
+            if label_background:
+                text_width, text_height = self.text_size(label, font_scale, 1)
+                cv2.rectangle(frame, (x1, y1 - text_height - 8), (x1 + text_width + 6, y1), box_color, -1)
+            cv2.putText(frame, label, (x1 + 3, y1 - 4), self.FONT, font_scale, (255, 255, 255), 2)
+
+    def draw_fps(self, frame: np.ndarray, fps: float, position: Tuple[int, int] = (5, 35),
+                 font_scale: float = 1.2, thickness: int = 2) -> None:
+        """Vẽ FPS trên hộp nền bán trong suốt, chỉ trộn màu trong vùng hộp"""
+        text = f"FPS: {fps:.0f}"
+        text_width, text_height = self.text_size(text, font_scale, thickness)
+        x, y = position
+        self.blend_rect(frame, x - 5, y - text_height - 10, x + text_width + 6, y + 6, (255, 0, 0), 0.25)
+        cv2.putText(frame, text, position, self.FONT, font_scale, (255, 255, 255), thickness)
@@ -0,0 +1,176 @@
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _load_turbojpeg():
+    """Tải bộ mã hóa libjpeg-turbo (PyTurboJPEG) nếu có, None nếu chưa cài"""
+    try:
+        from turbojpeg import TurboJPEG
+        return TurboJPEG()
+    except Exception as e:
+        logger.info(f"Không dùng được libjpeg-turbo, chuyển sang cv2.imencode: {str(e)}")
+        return None
+
+
+class PreviewEncoder:
+    """
+    Bộ mã hóa JPEG cho frame xem trước gửi qua WebSocket, chạy trên thread pool riêng:
+    - thu nhỏ frame về độ phân giải xem trước (video đã xử lý vẫn giữ nguyên độ phân giải gốc)
+    - dùng libjpeg-turbo khi có, nếu không thì dùng cv2.imencode
+    - tự điều chỉnh chất lượng và độ phân giải theo thời gian gửi đo được: mạng chậm thì giảm chất
+      lượng trước rồi mới giảm độ phân giải, mạng nhanh trở lại thì khôi phục theo thứ tự ngược lại
+    """
+
+    # Số frame tối thiểu giữa hai lần điều chỉnh, tránh dao động
+    ADJUST_INTERVAL = 10
+    QUALITY_STEP = 5
+    WIDTH_STEP = 0.8
+
+    def __init__(self, max_width: Optional[int] = None, quality: Optional[int] = None,
+                 min_quality: Optional[int] = None, min_width: Optional[int] = None,
+                 target_send_ms: Optional[float] = None, threads: Optional[int] = None,
+                 use_turbojpeg: Optional[bool] = None, smoothing: float = 0.2):
+        """
+        Args:
+            max_width: Chiều rộng tối đa của frame xem trước (0 = giữ nguyên)
+            quality: Chất lượng JPEG ban đầu (và tối đa)
+            min_quality: Chất lượng JPEG thấp nhất khi mạng chậm
+            min_width: Chiều rộng thấp nhất khi mạng chậm
+            target_send_ms: Thời gian gửi mục tiêu cho mỗi frame
+            threads: Số luồng mã hóa
+            use_turbojpeg: Dùng libjpeg-turbo nếu đã cài
+            smoothing: Hệ số làm mượt thời gian gửi (0-1)
+        """
+        self.max_width = max(0, max_width if max_width is not None else settings.PREVIEW_MAX_WIDTH)
+        self.max_quality = int(np.clip(quality if quality is not None else settings.PREVIEW_JPEG_QUALITY, 1, 100))
+        self.min_quality = int(np.clip(min_quality if min_quality is not None else settings.PREVIEW_MIN_QUALITY,
+                                       1, self.max_quality))
+        self.min_width = max(1, min_width if min_width is not None else settings.PREVIEW_MIN_WIDTH)
+        self.target_send = (target_send_ms if target_send_ms is not None else settings.PREVIEW_TARGET_SEND_MS) / 1000.0
+        self.smoothing = smoothing
+
+        self.quality = self.max_quality
+        self.width = self.max_width
+        use_turbojpeg = use_turbojpeg if use_turbojpeg is not None else settings.PREVIEW_USE_TURBOJPEG
+        self._turbo = _load_turbojpeg() if use_turbojpeg else None
+        threads = threads if threads is not None else settings.PREVIEW_ENCODER_THREADS
+        self._executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="preview-encoder")
+        self._lock = threading.Lock()
+
+        self.frames = 0
+        self.encoded_bytes = 0
+        self.encode_time = 0.0
+        self.sent_frames = 0
+        self.send_time = 0.0
+        self.avg_send_time: Optional[float] = None
+        self.adjustments = 0
+        self._frames_since_adjust = 0
+        self._source_width = 0
+
+    @property
+    def codec(self) -> str:
+        return "turbojpeg" if self._turbo is not None else "opencv"
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        """
+        Thu nhỏ và mã hóa một frame thành JPEG với chất lượng / độ phân giải hiện tại
+
+        Args:
+            frame: Frame BGR
+
+        Returns:
+            bytes: Ảnh JPEG
+        """
+        start_time = time.perf_counter()
+        height, frame_width = frame.shape[:2]
+        with self._lock:
+            quality, width = self.quality, self.width
+            self._source_width = frame_width
+
+        if width and frame_width > width:
+            frame = cv2.resize(frame, (width, max(1, round(height * width / frame_width))), interpolation=cv2.INTER_AREA)
+
+        if self._turbo is not None:
+            data = self._turbo.encode(frame, quality=quality)
+        else:
+            data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+        with self._lock:
+            self.frames += 1
+            self.encoded_bytes += len(data)
+            self.encode_time += time.perf_counter() - start_time
+        return data
+
+    def submit(self, frame: np.ndarray) -> Future:
+        """Đưa frame vào thread pool để mã hóa, trả về Future chứa ảnh JPEG"""
+        return self._executor.submit(self.encode, frame)
+
+    def record_send(self, seconds: float) -> None:
+        """
+        Ghi nhận thời gian gửi một frame xem trước và điều chỉnh chất lượng / độ phân giải
+
+        Args:
+            seconds: Thời gian gửi frame (giây)
+        """
+        with self._lock:
+            self.sent_frames += 1
+            self.send_time += seconds
+            if self.avg_send_time is None:
+                self.avg_send_time = seconds
+            else:
+                self.avg_send_time += self.smoothing * (seconds - self.avg_send_time)
+
+            self._frames_since_adjust += 1
+            if self._frames_since_adjust < self.ADJUST_INTERVAL or self.target_send <= 0:
+                return
+
+            quality, width = self.quality, self.width
+            if self.avg_send_time > self.target_send:
+                # Mạng chậm: giảm chất lượng trước, sau đó mới giảm độ phân giải
+                if self.quality > self.min_quality:
+                    self.quality = max(self.min_quality, self.quality - self.QUALITY_STEP)
+                else:
+                    current = min(self.width, self._source_width) if self.width else self._source_width
+                    if current > self.min_width:
+                        self.width = max(self.min_width, int(current * self.WIDTH_STEP))
+            elif self.avg_send_time < self.target_send / 2:
+                # Mạng nhanh: khôi phục độ phân giải trước, sau đó tới chất lượng
+                limit = self.max_width or self._source_width
+                if self.width and self.width < limit:
+                    self.width = min(limit, int(self.width / self.WIDTH_STEP))
+                    if self.width >= self._source_width and not self.max_width:
+                        self.width = 0
+                elif self.quality < self.max_quality:
+                    self.quality = min(self.max_quality, self.quality + self.QUALITY_STEP)
+
+            if (quality, width) != (self.quality, self.width):
+                self.adjustments += 1
+                self._frames_since_adjust = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê của bộ mã hóa trong phiên"""
+        with self._lock:
+            return {
+                "codec": self.codec,
+                "frames": self.frames,
+                "avg_bytes": round(self.encoded_bytes / self.frames) if self.frames else 0,
+                "avg_encode_ms": round(self.encode_time / self.frames * 1000, 2) if self.frames else 0.0,
+                "avg_send_ms": round(self.send_time / self.sent_frames * 1000, 2) if self.sent_frames else 0.0,
+                "quality": self.quality,
+                "width": self.width,
+                "adjustments": self.adjustments,
+            }
+
+    def close(self) -> None:
+        """Dừng thread pool, các frame đang chờ mã hóa bị hủy"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
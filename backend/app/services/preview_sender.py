@@ -0,0 +1,140 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.services.frame_protocol import FrameMessageEncoder
+from app.services.preview_encoder import PreviewEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewSender:
+    """
+    Task gửi riêng cho một kết nối WebSocket, tách phân tích video khỏi việc gửi frame xem trước:
+    - message điều khiển (cảnh báo, tiến độ, thông báo) vào hàng đợi FIFO và luôn được gửi, ưu tiên trước frame
+    - frame xem trước chỉ giữ một chỗ, frame mới thay frame chưa kịp gửi (frame mới nhất thắng)
+    Client mạng chậm chỉ nhận ít frame xem trước hơn, vòng phân tích và việc ghi video đã xử lý không bị chặn.
+    """
+
+    def __init__(self, websocket: WebSocket, preview_encoder: Optional[PreviewEncoder] = None,
+                 frame_encoder: Optional[FrameMessageEncoder] = None):
+        """
+        Args:
+            websocket: Kết nối WebSocket
+            preview_encoder: Bộ mã hóa JPEG, được báo thời gian gửi để điều chỉnh chất lượng
+            frame_encoder: Bộ mã hóa của giao thức binary (None = giao thức JSON)
+        """
+        self._websocket = websocket
+        self._preview_encoder = preview_encoder
+        self._frame_encoder = frame_encoder
+        self._control: Deque[Dict[str, Any]] = deque()
+        self._frame: Optional[Tuple[Future, Dict[str, Any]]] = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self.error: Optional[BaseException] = None
+
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.control_sent = 0
+
+    def start(self) -> "PreviewSender":
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    def raise_if_disconnected(self) -> None:
+        """Ném WebSocketDisconnect nếu task gửi đã phát hiện client ngắt kết nối"""
+        if self.error is not None:
+            raise WebSocketDisconnect()
+
+    def send_json(self, message: Dict[str, Any]) -> None:
+        """Xếp hàng một message điều khiển, luôn được gửi theo đúng thứ tự"""
+        self.raise_if_disconnected()
+        self._control.append(message)
+        self._wakeup.set()
+
+    def send_frame(self, encoded_frame: Future, frame_info: Dict[str, Any]) -> None:
+        """
+        Đặt frame xem trước mới nhất, thay frame chưa kịp gửi (nếu có)
+
+        Args:
+            encoded_frame: Future chứa ảnh JPEG (từ PreviewEncoder.submit)
+            frame_info: Thông tin frame
+        """
+        self.raise_if_disconnected()
+        if self._frame is not None:
+            # Frame cũ chưa gửi bị bỏ, hủy luôn việc mã hóa nếu chưa bắt đầu
+            self._frame[0].cancel()
+            self.frames_dropped += 1
+        self._frame = (encoded_frame, frame_info)
+        self._wakeup.set()
+
+    async def _send_frame(self, encoded_frame: Future, frame_info: Dict[str, Any]) -> None:
+        frame_bytes = await asyncio.wrap_future(encoded_frame)
+        send_start = time.perf_counter()
+        if self._frame_encoder is not None:
+            # Giao thức binary: ảnh và thông tin frame trong cùng một message
+            await self._websocket.send_bytes(self._frame_encoder.encode(frame_info, frame_bytes))
+        else:
+            await self._websocket.send_bytes(frame_bytes)
+            await self._websocket.send_json({"status": "frame", "frame_info": frame_info})
+        if self._preview_encoder is not None:
+            self._preview_encoder.record_send(time.perf_counter() - send_start)
+        self.frames_sent += 1
+
+    async def _run(self) -> None:
+        while True:
+            if not self._control and self._frame is None:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            try:
+                if self._control:
+                    await self._websocket.send_json(self._control.popleft())
+                    self.control_sent += 1
+                else:
+                    encoded_frame, frame_info = self._frame
+                    self._frame = None
+                    await self._send_frame(encoded_frame, frame_info)
+            except (WebSocketDisconnect, RuntimeError) as e:
+                # Client đã ngắt kết nối (hoặc socket đã đóng): dừng gửi, vòng phân tích sẽ được báo
+                self.error = e
+                self._control.clear()
+                self._frame = None
+                return
+            except Exception as e:
+                logger.error(f"Lỗi khi gửi frame: {str(e)}")
+
+    async def close(self, flush: bool = True) -> None:
+        """
+        Dừng task gửi
+
+        Args:
+            flush: True để gửi hết message điều khiển và frame đang chờ trước khi dừng
+        """
+        self._closing = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        if not flush:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "control_sent": self.control_sent,
+        }
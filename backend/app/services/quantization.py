@@ -0,0 +1,213 @@
+import os
+import ast
+import time
+import logging
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+
+
+def int8_model_path(model_path: str) -> str:
+    """
+    Lấy đường dẫn model INT8, nằm cạnh checkpoint gốc
+
+    Args:
+        model_path: Đường dẫn tới checkpoint .pt
+
+    Returns:
+        str: Đường dẫn file .int8.onnx
+    """
+    return f"{os.path.splitext(model_path)[0]}.int8.onnx"
+
+
+def read_onnx_metadata(onnx_path: str) -> Dict[str, str]:
+    """
+    Đọc metadata (task, imgsz, names, ...) mà ultralytics ghi vào file ONNX khi export
+
+    Args:
+        onnx_path: Đường dẫn file .onnx
+
+    Returns:
+        Dict[str, str]: Metadata dạng chuỗi
+    """
+    import onnx
+
+    model = onnx.load(onnx_path, load_external_data=False)
+    return {prop.key: prop.value for prop in model.metadata_props}
+
+
+def collect_calibration_frames(calibration_dir: str, max_frames: int = 64) -> List[np.ndarray]:
+    """
+    Thu thập frame hiệu chuẩn từ thư mục ảnh/video cục bộ.
+    Với video, các frame được lấy mẫu đều trên toàn bộ độ dài.
+
+    Args:
+        calibration_dir: Thư mục chứa ảnh hoặc video mẫu
+        max_frames: Số frame tối đa
+
+    Returns:
+        List[np.ndarray]: Danh sách frame BGR
+    """
+    if not os.path.isdir(calibration_dir):
+        raise FileNotFoundError(f"Không tìm thấy thư mục hiệu chuẩn: {calibration_dir}")
+
+    files = sorted(os.listdir(calibration_dir))
+    images = [f for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
+    videos = [f for f in files if f.lower().endswith(VIDEO_EXTENSIONS)]
+
+    frames = []
+    for name in images:
+        if len(frames) >= max_frames:
+            break
+        frame = cv2.imread(os.path.join(calibration_dir, name))
+        if frame is not None:
+            frames.append(frame)
+
+    # Chia đều số frame còn lại cho các video
+    remaining = max_frames - len(frames)
+    for i, name in enumerate(videos):
+        if remaining <= 0:
+            break
+        per_video = max(1, remaining // (len(videos) - i))
+        cap = cv2.VideoCapture(os.path.join(calibration_dir, name))
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or per_video
+        step = max(1, total // per_video)
+        idx = 0
+        taken = 0
+        while taken < per_video:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if idx % step == 0:
+                frames.append(frame)
+                taken += 1
+            idx += 1
+        cap.release()
+        remaining -= taken
+
+    if not frames:
+        raise ValueError(f"Không có ảnh/video hợp lệ trong thư mục hiệu chuẩn: {calibration_dir}")
+    logger.info(f"Thu thập {len(frames)} frame hiệu chuẩn từ {calibration_dir}")
+    return frames
+
+
+def preprocess_frame(frame: np.ndarray, imgsz: int) -> np.ndarray:
+    """
+    Tiền xử lý frame giống hệt predictor của ultralytics cho model ONNX
+    (letterbox về imgsz x imgsz, BGR -> RGB, chuẩn hóa về [0, 1], NCHW)
+
+    Args:
+        frame: Frame BGR
+        imgsz: Kích thước đầu vào của model
+
+    Returns:
+        np.ndarray: Tensor float32 dạng (1, 3, imgsz, imgsz)
+    """
+    from ultralytics.data.augment import LetterBox
+
+    image = LetterBox(new_shape=(imgsz, imgsz), auto=False)(image=frame)
+    image = image[..., ::-1].transpose(2, 0, 1)
+    image = np.ascontiguousarray(image, dtype=np.float32) / 255.0
+    return image[None]
+
+
+def _make_calibration_reader(frames: List[np.ndarray], input_name: str, imgsz: int):
+    """Tạo CalibrationDataReader của ONNX Runtime từ danh sách frame"""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class FrameCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._iter = iter(frames)
+
+        def get_next(self):
+            frame = next(self._iter, None)
+            if frame is None:
+                return None
+            return {input_name: preprocess_frame(frame, imgsz)}
+
+        def rewind(self):
+            self._iter = iter(frames)
+
+    return FrameCalibrationReader()
+
+
+def quantize_model(model_path: str, calibration_dir: Optional[str] = None, max_frames: Optional[int] = None) -> str:
+    """
+    Tạo model INT8 bằng lượng tử hóa tĩnh sau huấn luyện (post-training static quantization).
+    Model FP32 được export sang ONNX trước, sau đó hiệu chuẩn bằng các frame cục bộ.
+    Kết quả được cache cạnh checkpoint và chỉ tạo lại khi model FP32 thay đổi.
+
+    Args:
+        model_path: Đường dẫn tuyệt đối tới checkpoint .pt
+        calibration_dir: Thư mục ảnh/video hiệu chuẩn (mặc định settings.QUANT_CALIBRATION_DIR)
+        max_frames: Số frame hiệu chuẩn tối đa (mặc định settings.QUANT_CALIBRATION_FRAMES)
+
+    Returns:
+        str: Đường dẫn file .int8.onnx
+    """
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType, CalibrationMethod
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    from app.services.inference_backends import export_model, resolve_model_path
+
+    fp32_path = export_model(model_path, "onnx")
+    int8_path = int8_model_path(model_path)
+    if os.path.exists(int8_path) and os.path.getmtime(int8_path) >= os.path.getmtime(fp32_path):
+        logger.info(f"Sử dụng model INT8 đã tạo trước đó: {int8_path}")
+        return int8_path
+
+    # Đường dẫn tương đối được tính từ thư mục backend, giống đường dẫn model
+    calibration_dir = resolve_model_path(calibration_dir or settings.QUANT_CALIBRATION_DIR)
+    frames = collect_calibration_frames(calibration_dir, max_frames or settings.QUANT_CALIBRATION_FRAMES)
+
+    metadata = read_onnx_metadata(fp32_path)
+    imgsz = int(ast.literal_eval(metadata.get("imgsz", "[640, 640]"))[0])
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    start_time = time.time()
+    logger.info(f"Đang lượng tử hóa INT8 model {fp32_path} với {len(frames)} frame hiệu chuẩn...")
+
+    # Chuẩn bị model (suy luận shape, tối ưu đồ thị) trước khi lượng tử hóa
+    prepared_path = f"{os.path.splitext(fp32_path)[0]}.prep.onnx"
+    try:
+        quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+        source_path = prepared_path
+    except Exception as e:
+        logger.warning(f"Bỏ qua bước tiền xử lý lượng tử hóa: {str(e)}")
+        source_path = fp32_path
+
+    try:
+        # Chỉ lượng tử hóa Conv/MatMul, phần giải mã đầu ra (Sigmoid, Mul, Concat...) giữ FP32 để hạn chế mất độ chính xác
+        quantize_static(
+            source_path,
+            int8_path,
+            _make_calibration_reader(frames, input_name, imgsz),
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=["Conv", "MatMul"],
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+
+    # Giữ lại metadata của ultralytics để YOLO nhận đúng task, imgsz và tên lớp
+    int8_model = onnx.load(int8_path)
+    props = {**metadata, **{prop.key: prop.value for prop in int8_model.metadata_props}}
+    onnx.helper.set_model_props(int8_model, props)
+    onnx.save(int8_model, int8_path)
+
+    logger.info(f"Lượng tử hóa INT8 hoàn tất sau {time.time() - start_time:.2f} giây: {int8_path}")
+    return int8_path
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.core.config import settings
+from app.services.inference_backends import resolve_model_path
+
+logger = logging.getLogger(__name__)
+
+# Tăng khi thay đổi cách phân tích (ngưỡng trong code, cách gộp kết quả...) để bỏ toàn bộ kết quả cũ
+RESULT_CACHE_VERSION = 2
+
+# Các cấu hình ảnh hưởng tới kết quả phân tích, thay đổi cấu hình nào thì kết quả cũ không dùng lại được
+_ANALYSIS_SETTINGS = (
+    "ANALYSIS_TARGET_FPS", "ANALYSIS_MAX_GAP_MS",
+    "MOTION_GATE_ENABLED", "MOTION_GATE_WIDTH", "MOTION_PIXEL_THRESHOLD", "MOTION_CHANGED_RATIO", "MOTION_MAX_STALENESS_MS",
+    "PREFILTER_MODE", "PREFILTER_CROPS", "PREFILTER_WIDTH", "PREFILTER_MIN_PIXELS",
+    "TRACKER_IOU_THRESHOLD", "TRACKER_MAX_MISSES", "TRACKER_MAX_AGE_FRAMES",
+)
+
+
+def content_sha256(data: bytes) -> str:
+    """sha256 (hex) của nội dung video"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """sha256 (hex) của file video trên ổ đĩa, đọc theo từng khối để không nạp cả file vào RAM"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_version(model_path: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """
+    Định danh phiên bản model: đường dẫn, backend, kích thước và thời điểm sửa file model.
+    Thay file model (hoặc đổi backend) thì định danh đổi và kết quả cũ tự hết hiệu lực.
+    """
+    path = resolve_model_path(model_path or settings.MODEL_PATH)
+    try:
+        stat = os.stat(path)
+        file_info = f"{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        file_info = "missing"
+    return f"{os.path.basename(path)}:{backend or settings.INFERENCE_BACKEND}:{file_info}"
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Khóa độc quyền giữa các tiến trình (nhiều worker) trên file khóa path"""
+    with open(path, "a+b") as lock_file:
+        try:
+            import fcntl
+        except ImportError:
+            # Windows: khóa byte đầu tiên của file khóa
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def analysis_params() -> Dict[str, Any]:
+    """Cấu hình phân tích hiện tại (một phần của khóa cache)"""
+    params = {name: getattr(settings, name) for name in _ANALYSIS_SETTINGS}
+    params["version"] = RESULT_CACHE_VERSION
+    return params
+
+
+class ResultCache:
+    """
+    Cache kết quả phân tích theo nội dung video: khóa là sha256 của video cùng phiên bản model
+    và cấu hình phân tích. Video giống hệt (tải lên lại, gửi lại cùng link YouTube) được trả ngay
+    video đã xử lý và kết quả đã lưu, không suy luận và tải lên lại.
+    - giới hạn số mục, vượt quá thì bỏ mục dùng lâu nhất (LRU)
+    - đổi model thì các mục của model cũ bị bỏ
+    - lưu ra file JSON để giữ lại sau khi khởi động lại; file được dùng chung giữa các worker:
+      mỗi lần ghi giữ khóa file, đọc lại bản trên ổ đĩa rồi mới áp thay đổi, nên không mất mục của worker khác
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        """
+        Args:
+            path: File JSON lưu cache (mặc định settings.RESULT_CACHE_PATH hoặc TEMP_DIR/fire_detection_results.json)
+            max_entries: Số mục tối đa (mặc định settings.RESULT_CACHE_MAX_ENTRIES)
+        """
+        self.path = path or settings.RESULT_CACHE_PATH or os.path.join(settings.TEMP_DIR, "fire_detection_results.json")
+        self.max_entries = max_entries if max_entries is not None else settings.RESULT_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Thời điểm sửa của file cache lần nạp gần nhất, đổi thì worker khác đã ghi và cần nạp lại
+        self._mtime: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        self._refresh()
+        if self._entries:
+            logger.info(f"Đã nạp {len(self._entries)} kết quả phân tích từ cache")
+
+    def _refresh(self) -> None:
+        """Nạp lại file cache nếu đã bị worker khác ghi (gọi khi đang giữ self._lock)"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = OrderedDict(json.load(f))
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không thể đọc cache kết quả: {str(e)}")
+
+    def _save(self) -> None:
+        """Ghi cache (gọi khi đang giữ self._lock và khóa file), ghi ra file tạm rồi đổi tên để không hỏng khi bị ngắt"""
+        temp_path = None
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".json")
+            with os.fdopen(handle, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Không thể lưu cache kết quả: {str(e)}")
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _update(self, mutate: Callable[["OrderedDict[str, Dict[str, Any]]"], bool]) -> None:
+        """
+        Thay đổi cache và ghi ra file dưới khóa file: đọc lại bản mới nhất trên ổ đĩa trước khi áp thay đổi
+        để không ghi đè mục do worker khác vừa thêm. mutate trả về False nếu không có gì thay đổi
+        """
+        with self._lock:
+            try:
+                with _file_lock(self.path + ".lock"):
+                    self._refresh()
+                    if mutate(self._entries):
+                        self._save()
+            except OSError as e:
+                logger.warning(f"Không thể khóa file cache kết quả: {str(e)}")
+
+    @staticmethod
+    def make_key(content_hash: str, model: Optional[str] = None, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Tạo khóa cache
+
+        Args:
+            content_hash: sha256 của nội dung video
+            model: Phiên bản model (mặc định model_version())
+            params: Cấu hình phân tích (mặc định analysis_params())
+        """
+        params_hash = hashlib.sha256(json.dumps(params or analysis_params(), sort_keys=True).encode()).hexdigest()[:16]
+        return f"{content_hash}:{model or model_version()}:{params_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Lấy kết quả đã lưu, None nếu chưa có"""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["result"]
+
+    def put(self, key: str, result: Dict[str, Any], model: Optional[str] = None) -> None:
+        """
+        Lưu kết quả phân tích
+
+        Args:
+            key: Khóa từ make_key
+            result: Kết quả (phải tuần tự hóa được thành JSON)
+            model: Phiên bản model đã dùng khi tạo khóa (mặc định model_version())
+        """
+        model = model or model_version()
+
+        def mutate(entries) -> bool:
+            # Kết quả của model cũ không còn dùng được
+            for stale_key in [k for k, entry in entries.items() if entry.get("model") != model]:
+                del entries[stale_key]
+            entries[key] = {"created_at": time.time(), "model": model, "result": result}
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            return True
+
+        self._update(mutate)
+
+    def invalidate_asset(self, public_id: str) -> int:
+        """
+        Bỏ các kết quả tham chiếu tới tài nguyên (video trên Cloudinary hoặc timeline) khi tài nguyên bị xóa
+
+        Returns:
+            int: Số mục đã bỏ
+        """
+        keys = []
+
+        def mutate(entries) -> bool:
+            keys.extend(key for key, entry in entries.items()
+                        if public_id in (entry["result"].get("cloudinary_public_id"),
+                                         entry["result"].get("cloudinary_processed_id"),
+                                         entry["result"].get("timeline_url")))
+            for key in keys:
+                del entries[key]
+            return bool(keys)
+
+        self._update(mutate)
+        return len(keys)
+
+    def clear(self) -> None:
+        def mutate(entries) -> bool:
+            entries.clear()
+            return True
+
+        self._update(mutate)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Cache kết quả dùng chung cho toàn bộ ứng dụng (tạo khi dùng lần đầu)"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
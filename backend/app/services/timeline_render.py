@@ -0,0 +1,146 @@
+import time
+import queue
+import logging
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.services.video_source import VideoSource, open_video_capture
+from app.services.frame_queue import BoundedFrameQueue
+from app.services.detections import FIRE_CLASS_ID, empty_detections
+from app.services.detection_timeline import TimelineReader
+from app.services.overlay import FrameRenderer
+
+logger = logging.getLogger(__name__)
+
+
+def _timeline_boxes(timeline: TimelineReader) -> Iterator[Tuple[int, np.ndarray]]:
+    """Duyệt timeline theo thứ tự frame, trả về (chỉ số frame, mảng BOX_DTYPE của frame)"""
+    for rows, boxes in timeline.iter_blocks():
+        offsets = rows["box_offset"].tolist()
+        counts = rows["box_count"].tolist()
+        for frame, offset, count in zip(rows["frame"].tolist(), offsets, counts):
+            yield frame, boxes[offset:offset + count]
+
+
+def render_from_timeline(video_path: VideoSource, timeline: TimelineReader, output_path: str,
+                         min_confidence: float = 0.0, scale: float = 1.0, fill_alpha: float = 0.3,
+                         box_color: Optional[Tuple[int, int, int]] = None, show_track_id: bool = True,
+                         session_stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Vẽ lại video đã xử lý từ video gốc và timeline phát hiện đã lưu, không chạy model.
+    Tốc độ chỉ phụ thuộc giải mã và mã hóa video nên dùng để đổi kiểu lớp phủ, ngưỡng hiển thị
+    hoặc độ phân giải đầu ra mà không phải phân tích lại.
+    Timeline không lưu mask phân đoạn, vùng cháy được tô theo bounding box.
+
+    Args:
+        video_path: Đường dẫn, URL, bytes hoặc file-like object của video gốc
+        timeline: Timeline phát hiện của video
+        output_path: Đường dẫn lưu video kết quả
+        min_confidence: Chỉ vẽ box có confidence từ ngưỡng này
+        scale: Tỉ lệ độ phân giải đầu ra so với video gốc
+        fill_alpha: Độ đậm khi tô vùng cháy (0 = chỉ vẽ khung)
+        box_color: Màu box cố định (BGR); None = màu theo confidence như khi xử lý
+        show_track_id: Hiển thị ID theo dõi trong nhãn
+        session_stats: Dict (tùy chọn) để nhận thống kê của lần vẽ lại
+
+    Returns:
+        Dict[str, Any]: Thống kê (số frame, số frame có cháy sau ngưỡng, thời gian, tốc độ)
+    """
+    stats = session_stats if session_stats is not None else {}
+    start_time = time.time()
+
+    cap, release_capture = open_video_capture(video_path)
+    if not cap.isOpened():
+        release_capture()
+        raise IOError("Không thể mở video gốc")
+
+    fps_video = timeline.fps or cap.get(cv2.CAP_PROP_FPS) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # Bộ mã hóa H.264 cần kích thước chẵn
+    out_width = max(2, int(round(width * scale)) // 2 * 2)
+    out_height = max(2, int(round(height * scale)) // 2 * 2)
+    resize = (out_width, out_height) != (width, height)
+    scale_xy = np.array([out_width / width, out_height / height] * 2, dtype=np.float32)
+
+    fourcc = cv2.VideoWriter_fourcc(*'X264')
+    out = cv2.VideoWriter(output_path, fourcc, fps_video, (out_width, out_height))
+
+    # Giải mã ở luồng riêng để chồng lên thời gian vẽ và mã hóa
+    frame_queue = BoundedFrameQueue(settings.FRAME_QUEUE_SIZE, "block")
+    decode_done = threading.Event()
+
+    def capture_thread():
+        try:
+            idx = 0
+            while not frame_queue.closed:
+                ret, frame = cap.read()
+                if not ret or not frame_queue.put((idx, frame)):
+                    break
+                idx += 1
+        finally:
+            decode_done.set()
+
+    renderer = FrameRenderer()
+    entries = _timeline_boxes(timeline)
+    entry = next(entries, None)
+    frames = fire_frames = missing_frames = 0
+
+    capture_t = threading.Thread(target=capture_thread, daemon=True)
+    capture_t.start()
+    try:
+        while not decode_done.is_set() or not frame_queue.empty():
+            try:
+                idx, frame = frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if resize:
+                frame = cv2.resize(frame, (out_width, out_height), interpolation=cv2.INTER_AREA)
+
+            # Timeline ghi mọi frame theo thứ tự, bỏ qua các mục phía trước (nếu có)
+            while entry is not None and entry[0] < idx:
+                entry = next(entries, None)
+            if entry is not None and entry[0] == idx:
+                boxes = entry[1][entry[1]["conf"] >= min_confidence]
+                if len(boxes):
+                    detections = empty_detections(len(boxes))
+                    detections["xyxy"] = boxes["xyxy"] * scale_xy
+                    detections["conf"] = boxes["conf"]
+                    detections["cls"] = FIRE_CLASS_ID
+                    detections["track_id"] = boxes["track_id"]
+                    if fill_alpha > 0:
+                        for x1, y1, x2, y2 in detections["xyxy"].astype(np.int32).tolist():
+                            renderer.blend_rect(frame, x1, y1, x2, y2, (255, 0, 0), fill_alpha)
+                    renderer.draw_boxes(frame, detections, color=box_color, show_track_id=show_track_id)
+                    fire_frames += 1
+            else:
+                missing_frames += 1
+
+            out.write(frame)
+            frames += 1
+            frame_queue.task_done()
+    finally:
+        frame_queue.close()
+        capture_t.join(timeout=1)
+        release_capture()
+        out.release()
+
+    elapsed = time.time() - start_time
+    stats.update({
+        "frames": frames,
+        "fire_frames": fire_frames,
+        "missing_frames": missing_frames,
+        "width": out_width,
+        "height": out_height,
+        "render_time": round(elapsed, 3),
+        "render_fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+    })
+    if missing_frames:
+        logger.warning(f"Timeline thiếu {missing_frames}/{frames} frame so với video gốc")
+    logger.info(f"Vẽ lại {frames} frame từ timeline trong {elapsed:.2f} giây ({stats['render_fps']} frame/giây)")
+    return stats
@@ -0,0 +1,158 @@
+import os
+import re
+import uuid
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, BinaryIO, Callable, Tuple, Union
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Kích thước mỗi lần ghi dữ liệu ra socket
+_SEND_CHUNK_SIZE = 256 * 1024
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+VideoSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+
+class MemoryVideoServer:
+    """
+    Phục vụ một video nằm trong bộ nhớ qua HTTP trên loopback (hỗ trợ Range request).
+    OpenCV/FFmpeg đọc video qua URL này như một nguồn HTTP thông thường, có thể seek tùy ý
+    (kể cả file mp4 có moov atom ở cuối), nên không cần ghi bản sao tạm ra đĩa.
+    """
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview, BinaryIO]):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self._buffer = memoryview(data)
+            self._file = None
+            self._size = len(self._buffer)
+        else:
+            self._buffer = None
+            self._file = data
+            self._file.seek(0, os.SEEK_END)
+            self._size = self._file.tell()
+        self._file_lock = threading.Lock()
+        # Đường dẫn ngẫu nhiên để tiến trình khác trên máy không đoán được URL
+        self._path = f"/{uuid.uuid4().hex}.mp4"
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self._path}"
+
+    def _read(self, start: int, length: int) -> bytes:
+        if self._buffer is not None:
+            return self._buffer[start:start + length]
+        with self._file_lock:
+            self._file.seek(start)
+            return self._file.read(length)
+
+    def _make_handler(self):
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass  # Không ghi log cho từng request
+
+            def _send_headers(self):
+                if self.path != source._path:
+                    self.send_error(404)
+                    return None
+                start, end = 0, source._size - 1
+                match = _RANGE_PATTERN.match(self.headers.get("Range", ""))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        if match.group(2):
+                            end = min(int(match.group(2)), source._size - 1)
+                    else:
+                        start = max(0, source._size - int(match.group(2)))
+                    if start >= source._size:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{source._size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return None
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{source._size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                return start, end
+
+            def do_HEAD(self):
+                self._send_headers()
+
+            def do_GET(self):
+                byte_range = self._send_headers()
+                if byte_range is None:
+                    return
+                position, end = byte_range
+                try:
+                    while position <= end:
+                        length = min(_SEND_CHUNK_SIZE, end - position + 1)
+                        self.wfile.write(source._read(position, length))
+                        position += length
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # FFmpeg đóng kết nối khi seek sang vị trí khác
+
+        return Handler
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def is_memory_source(source: Any) -> bool:
+    """
+    Kiểm tra nguồn video là dữ liệu trong bộ nhớ (bytes hoặc file-like) thay vì đường dẫn/URL
+    """
+    return isinstance(source, (bytes, bytearray, memoryview)) or hasattr(source, "read")
+
+
+def open_video_capture(source: VideoSource) -> Tuple[cv2.VideoCapture, Callable[[], None]]:
+    """
+    Mở cv2.VideoCapture cho đường dẫn, URL, bytes hoặc file-like object.
+    Với dữ liệu trong bộ nhớ, video được giải mã trực tiếp qua MemoryVideoServer.
+
+    Args:
+        source: Đường dẫn/URL, bytes hoặc file-like object (hỗ trợ seek) của video
+
+    Returns:
+        Tuple[cv2.VideoCapture, Callable[[], None]]: Capture và hàm giải phóng tài nguyên
+    """
+    if not is_memory_source(source):
+        cap = cv2.VideoCapture(str(source))
+        return cap, cap.release
+
+    if hasattr(source, "read") and not (hasattr(source, "seekable") and source.seekable()):
+        # File-like không seek được thì phải đọc hết vào bộ nhớ
+        source = source.read()
+
+    server = MemoryVideoServer(source)
+    cap = cv2.VideoCapture(server.url)
+
+    def release():
+        cap.release()
+        server.close()
+
+    return cap, release
@@ -1,17 +1,26 @@
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
+import cloudinary.utils
 import os
 import logging
+import threading
 import traceback
-from typing import Dict, Optional, Tuple, BinaryIO, Union
+from typing import Callable, Dict, Optional, Tuple, BinaryIO, Union
 import io
 import uuid
 
 from app.core.config import settings
+from app.services.download_cache import get_download_cache
 
 logger = logging.getLogger(__name__)
 
+# Cloudinary yêu cầu mỗi phần (trừ phần cuối) tối thiểu 5 MB khi tải lên theo phần
+MIN_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
+# Hàm nhận tiến trình tải lên: (số byte đã tải, tổng số byte)
+UploadProgressCallback = Callable[[int, int], None]
+
 # Khởi tạo Cloudinary (sẽ lấy thông tin từ biến môi trường)
 def init_cloudinary():
     try:
@@ -21,6 +30,9 @@ def init_cloudinary():
             api_secret=settings.CLOUDINARY_API_SECRET,
             secure=True
         )
+        if settings.CLOUDINARY_UPLOAD_PREFIX:
+            cloudinary.config(upload_prefix=settings.CLOUDINARY_UPLOAD_PREFIX)
+            logger.info(f"Cloudinary dùng địa chỉ tải lên: {settings.CLOUDINARY_UPLOAD_PREFIX}")
         logger.info("Cloudinary đã được khởi tạo thành công")
         logger.info(f"Cloudinary config: cloud_name={settings.CLOUDINARY_CLOUD_NAME}, api_key={settings.CLOUDINARY_API_KEY[:5]}***")
     except Exception as e:
@@ -138,6 +150,104 @@ def upload_bytes_to_cloudinary(file_data: Union[bytes, BinaryIO], filename: str
         logger.error(f"Chi tiết lỗi: {error_details}")
         return False, error_msg, None
 
+# Tải video lên Cloudinary theo từng phần từ đường dẫn hoặc file-like object
+def upload_stream_to_cloudinary(source: Union[str, BinaryIO], filename: str = None, resource_type: str = "video",
+                                chunk_size: Optional[int] = None,
+                                progress_callback: Optional[UploadProgressCallback] = None,
+                                cancel_event: Optional[threading.Event] = None) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    Tải file lên Cloudinary theo chế độ tải lên theo phần (upload large), đọc và gửi lần lượt từng phần
+    nên bộ nhớ chỉ giữ một phần tại một thời điểm dù file lớn đến đâu
+    
+    Args:
+        source: Đường dẫn file cục bộ hoặc file-like object (đọc từ vị trí hiện tại đến hết)
+        filename: Tên file để Cloudinary sử dụng
+        resource_type: Loại tài nguyên (mặc định là "video")
+        chunk_size: Kích thước mỗi phần (mặc định settings.CLOUDINARY_UPLOAD_CHUNK_SIZE, tối thiểu 5 MB)
+        progress_callback: Hàm được gọi sau mỗi phần với (số byte đã tải, tổng số byte)
+        cancel_event: Khi được set, dừng trước phần tiếp theo (phần đã gửi dở bị Cloudinary bỏ)
+        
+    Returns:
+        Tuple[bool, str, Optional[Dict]]: 
+            - Trạng thái thành công
+            - Thông báo
+            - Thông tin về video đã tải lên
+    """
+    file_io = None
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            file_io = open(source, "rb")
+            if not filename:
+                filename = os.path.basename(source)
+        else:
+            file_io = source
+        if not filename:
+            filename = f"{uuid.uuid4()}.mp4"
+        
+        # Tổng số byte còn lại kể từ vị trí hiện tại của file
+        start = file_io.tell()
+        file_io.seek(0, os.SEEK_END)
+        file_size = file_io.tell() - start
+        file_io.seek(start)
+        if file_size <= 0:
+            return False, "File rỗng, không có dữ liệu để tải lên", None
+        
+        chunk_size = max(MIN_UPLOAD_CHUNK_SIZE, chunk_size or settings.CLOUDINARY_UPLOAD_CHUNK_SIZE)
+        total_chunks = (file_size + chunk_size - 1) // chunk_size
+        logger.info(f"Bắt đầu tải lên Cloudinary theo phần: {filename} ({file_size/1024/1024:.2f} MB, "
+                    f"{total_chunks} phần x {chunk_size/1024/1024:.0f} MB), folder={settings.CLOUDINARY_FOLDER}")
+        
+        options = {
+            "resource_type": resource_type,
+            "folder": settings.CLOUDINARY_FOLDER,
+            "filename": filename,
+            "use_filename": True,
+            "unique_filename": True,
+            "overwrite": False,
+        }
+        # Các phần cùng một lần tải lên được Cloudinary ghép lại theo X-Unique-Upload-Id và Content-Range
+        upload_id = cloudinary.utils.random_public_id()
+        uploaded = 0
+        result = None
+        
+        while uploaded < file_size:
+            if cancel_event is not None and cancel_event.is_set():
+                logger.info(f"Hủy tải lên {filename} sau {uploaded}/{file_size} byte")
+                return False, "Đã hủy tải lên", None
+            chunk = file_io.read(min(chunk_size, file_size - uploaded))
+            if not chunk:
+                raise IOError(f"File kết thúc sớm ở byte {uploaded}/{file_size}")
+            http_headers = {
+                "Content-Range": f"bytes {uploaded}-{uploaded + len(chunk) - 1}/{file_size}",
+                "X-Unique-Upload-Id": upload_id,
+            }
+            result = cloudinary.uploader.upload_large_part((filename, chunk), http_headers=http_headers, **options)
+            options["public_id"] = result.get("public_id")
+            uploaded += len(chunk)
+            del chunk
+            
+            if progress_callback is not None:
+                try:
+                    progress_callback(uploaded, file_size)
+                except Exception as e:
+                    logger.warning(f"Lỗi trong hàm báo tiến trình tải lên: {str(e)}")
+        
+        logger.info(f"Tải lên Cloudinary thành công: {result.get('public_id')}")
+        logger.info(f"URL Cloudinary: {result.get('secure_url')}")
+        
+        return True, "Tải lên Cloudinary thành công", result
+    
+    except Exception as e:
+        error_details = traceback.format_exc()
+        error_msg = f"Lỗi khi tải lên Cloudinary theo phần: {str(e)}"
+        logger.error(error_msg)
+        logger.error(f"Chi tiết lỗi: {error_details}")
+        return False, error_msg, None
+    finally:
+        # Chỉ đóng file do hàm này mở
+        if file_io is not None and file_io is not source:
+            file_io.close()
+
 # Lấy URL của video từ Cloudinary
 def get_cloudinary_url(public_id: str, resource_type: str = "video") -> str:
     """
@@ -167,8 +277,8 @@ def download_from_cloudinary(url: str) -> Tuple[bool, str, Optional[bytes]]:
             - Dữ liệu nhị phân
     """
     try:
-        import requests
-        response = requests.get(url, stream=True)
+        # Dùng session chung để tái sử dụng kết nối
+        response = get_download_cache().session.get(url, timeout=(10, 60))
         if response.status_code == 200:
             return True, "Tải xuống thành công", response.content
         else:
@@ -179,6 +289,29 @@ def download_from_cloudinary(url: str) -> Tuple[bool, str, Optional[bytes]]:
         logger.error(f"Chi tiết lỗi: {error_details}")
         return False, f"Lỗi khi tải xuống từ Cloudinary: {str(e)}", None
 
+# Tải xuống file từ Cloudinary vào cache trên ổ đĩa
+def download_cloudinary_file(url: str) -> Tuple[bool, str, Optional[str]]:
+    """
+    Lấy file từ URL Cloudinary qua cache trên ổ đĩa: chỉ tải (dạng stream) khi chưa có trong cache,
+    dữ liệu không đi qua bộ nhớ
+    
+    Args:
+        url: URL của tài nguyên trên Cloudinary
+        
+    Returns:
+        Tuple[bool, str, Optional[str]]: 
+            - Trạng thái thành công
+            - Thông báo
+            - Đường dẫn file cục bộ (thuộc cache, chỉ đọc, không xóa)
+    """
+    try:
+        return True, "Tải xuống thành công", get_download_cache().fetch(url)
+    except Exception as e:
+        error_details = traceback.format_exc()
+        logger.error(f"Lỗi khi tải xuống từ Cloudinary: {str(e)}")
+        logger.error(f"Chi tiết lỗi: {error_details}")
+        return False, f"Lỗi khi tải xuống từ Cloudinary: {str(e)}", None
+
 # Xóa video khỏi Cloudinary
 def delete_from_cloudinary(public_id: str, resource_type: str = "video") -> Tuple[bool, str]:
     """
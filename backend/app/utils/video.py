@@ -1,6 +1,8 @@
 import os
 import uuid
+import asyncio
 import logging
+import tempfile
 import traceback
 from typing import Optional, Tuple, BinaryIO, Union
 import requests
@@ -11,7 +13,7 @@ from fastapi import UploadFile, HTTPException, status
 
 from app.core.config import settings
 from app.models.enums import VideoTypeEnum
-from app.utils.cloudinary_service import upload_bytes_to_cloudinary, download_from_cloudinary
+from app.utils.cloudinary_service import upload_stream_to_cloudinary, download_from_cloudinary
 
 logger = logging.getLogger(__name__)
 
@@ -139,13 +141,11 @@ async def save_upload_file(file: UploadFile, filename: Optional[str] = None) ->
             ext = os.path.splitext(file.filename)[1] if file.filename else ".mp4"
             filename = f"{uuid.uuid4()}{ext}"
         
-        # Đọc nội dung file vào bộ nhớ
-        file_content = await file.read()
-        
         try:
-            # Tải lên Cloudinary trực tiếp từ bộ nhớ
+            # Tải lên Cloudinary theo từng phần trực tiếp từ file upload, không đọc toàn bộ vào bộ nhớ
             logger.info(f"Bắt đầu tải lên Cloudinary: {filename}")
-            success, message, result = upload_bytes_to_cloudinary(file_content, filename=filename)
+            await file.seek(0)
+            success, message, result = await asyncio.to_thread(upload_stream_to_cloudinary, file.file, filename=filename)
             logger.info(f"Kết quả tải lên Cloudinary: {success}, {message}")
             
             if not success:
@@ -225,12 +225,9 @@ def download_youtube_video(youtube_url: str) -> Tuple[bool, str, Optional[str],
             if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
                 logger.error(f"File tải về không hợp lệ hoặc rỗng: {tmp_path}")
                 return False, "Không thể tải video từ YouTube (file rỗng)", None, None, None
-            # Đọc nội dung file vừa tải
-            with open(tmp_path, 'rb') as f:
-                video_bytes = f.read()
-            # Upload lên Cloudinary
+            # Upload lên Cloudinary theo từng phần từ file vừa tải
             filename = f"youtube_{uuid.uuid4()}.mp4"
-            success, message, result = upload_bytes_to_cloudinary(video_bytes, filename=filename)
+            success, message, result = upload_stream_to_cloudinary(tmp_path, filename=filename)
         finally:
             # Xóa file tạm
             if os.path.exists(tmp_path):
@@ -270,6 +267,21 @@ def upload_video_to_cloudinary_and_cleanup(local_path: str, folder: str = None):
                 logging.getLogger(__name__).warning(f"Không thể xoá file tạm: {local_path}: {cleanup_err}")
     return cloud_url, public_id
 
+def spool_video_bytes(video_data: bytes, suffix: str = ".mp4") -> str:
+    """
+    Ghi dữ liệu video vào file tạm trong TEMP_DIR để giải mã trực tiếp từ ổ đĩa
+    
+    Args:
+        video_data: Dữ liệu video
+        suffix: Đuôi file
+        
+    Returns:
+        str: Đường dẫn file tạm (người gọi chịu trách nhiệm xóa)
+    """
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False, dir=settings.TEMP_DIR) as spool_file:
+        spool_file.write(video_data)
+        return spool_file.name
+
 def get_absolute_file_path(relative_path: str) -> str:
     """
     Chuyển đổi đường dẫn tương đối thành đường dẫn tuyệt đối
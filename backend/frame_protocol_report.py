@@ -0,0 +1,82 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+# Thêm đường dẫn hiện tại vào sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.frame_protocol import FrameMessageEncoder, decode_frame_message, _msgpack
+
+
+def websocket_frame_header(length):
+    """Số byte header của một WebSocket frame server -> client (không có mask) theo độ dài payload"""
+    if length < 126:
+        return 2
+    if length < 65536:
+        return 4
+    return 10
+
+
+def make_frame_info(idx, num_boxes):
+    """Tạo frame_info giống đầu ra của predict_and_display"""
+    boxes = [[100 + 40 * i, 120, 260 + 40 * i, 300, 0.8731, i + 1] for i in range(num_boxes)]
+    return {
+        "frame": idx,
+        "video_time": time.strftime("%H:%M:%S", time.gmtime(idx / 30)),
+        "timestamp": round(idx / 30, 3),
+        "fire_detected": num_boxes > 0,
+        "total_area": 3.1416,
+        "confidence": 0.8731 if num_boxes else 0.0,
+        "track_ids": [box[5] for box in boxes],
+        "boxes": boxes,
+    }
+
+
+def measure_json(frame_infos, jpeg):
+    """Giao thức cũ: ảnh JPEG + message JSON riêng cho mỗi frame"""
+    overhead = 0
+    start_time = time.perf_counter()
+    for frame_info in frame_infos:
+        text = json.dumps({"status": "frame", "frame_info": frame_info}).encode("utf-8")
+        overhead += len(text) + websocket_frame_header(len(text)) + websocket_frame_header(len(jpeg))
+    elapsed = time.perf_counter() - start_time
+    return 2, overhead / len(frame_infos), elapsed / len(frame_infos) * 1e6
+
+
+def measure_binary(frame_infos, jpeg, metadata_codec):
+    """Giao thức binary: một message duy nhất cho mỗi frame"""
+    encoder = FrameMessageEncoder(metadata_codec)
+    overhead = 0
+    start_time = time.perf_counter()
+    for frame_info in frame_infos:
+        message = encoder.encode(frame_info, jpeg)
+        overhead += len(message) - len(jpeg) + websocket_frame_header(len(message))
+    elapsed = time.perf_counter() - start_time
+    # Kiểm tra message giải mã lại đúng
+    decoded, payload = decode_frame_message(message)
+    assert payload == jpeg and decoded["frame"] == frame_infos[-1]["frame"]
+    return 1, overhead / len(frame_infos), elapsed / len(frame_infos) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh chi phí mỗi frame của giao thức JSON và binary trên /ws/direct-process")
+    parser.add_argument("--frames", type=int, default=2000, help="Số frame mô phỏng")
+    parser.add_argument("--jpeg-bytes", type=int, default=60000, help="Kích thước ảnh JPEG mô phỏng")
+    args = parser.parse_args()
+
+    jpeg = bytes(args.jpeg_bytes)
+    print(f"{'box':>4}  {'giao thức':<18}{'message':>8}{'byte thêm':>12}{'µs / frame':>12}")
+    for num_boxes in (0, 3, 10):
+        frame_infos = [make_frame_info(idx, num_boxes) for idx in range(args.frames)]
+        rows = [("json (cũ)", measure_json(frame_infos, jpeg)),
+                ("binary + json", measure_binary(frame_infos, jpeg, "json"))]
+        if _msgpack is not None:
+            rows.append(("binary + msgpack", measure_binary(frame_infos, jpeg, "msgpack")))
+        for name, (messages, overhead, micros) in rows:
+            print(f"{num_boxes:>4}  {name:<18}{messages:>8}{overhead:>12.1f}{micros:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Add timeline_url to videos
+
+Revision ID: 5b1e9c3d7a42
+Revises: a845c2d7e918
+Create Date: 2026-10-18 09:30:12
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e9c3d7a42'
+down_revision: Union[str, None] = 'a845c2d7e918'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Thêm cột timeline_url (timeline phát hiện theo từng frame) vào bảng videos
+    op.add_column('videos', sa.Column('timeline_url', sa.String(255), nullable=True))
+
+
+def downgrade() -> None:
+    # Xóa cột timeline_url khỏi bảng videos
+    op.drop_column('videos', 'timeline_url')
@@ -0,0 +1,415 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+# Thêm đường dẫn hiện tại vào sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Load biến môi trường
+load_dotenv()
+
+RESOLUTIONS = {"360p": (640, 360), "720p": (1280, 720), "1080p": (1920, 1080)}
+VIDEO_FPS = 25
+# Model giả lập tìm vùng cháy trên ảnh thu nhỏ theo bước này (tương đương mask ở độ phân giải của model)
+MASK_STRIDE = 8
+BASELINE_VERSION = 1
+# Các chỉ số so sánh với baseline: 1 = càng cao càng tốt, -1 = càng thấp càng tốt
+COMPARED_METRICS = {
+    "fps": 1,
+    "decode_fps": 1,
+    "infer_fps": 1,
+    "render_fps": 1,
+    "encode_fps": 1,
+    "send_fps": 1,
+    "latency_p50_ms": -1,
+    "latency_p90_ms": -1,
+    "latency_p99_ms": -1,
+    "peak_rss_mb": -1,
+}
+
+
+def make_synthetic_video(path, width, height, frames, fps=VIDEO_FPS, seed=0):
+    """
+    Tạo video thử cố định: nền có nhiễu nhẹ theo từng frame, một đám lửa (elip đỏ cam, nhấp nháy)
+    di chuyển ngang khung hình trong nửa giữa video, nửa đầu và cuối không có cháy
+    """
+    rng = np.random.default_rng(seed)
+    background = np.zeros((height, width, 3), dtype=np.uint8)
+    background[:] = np.linspace(40, 110, width, dtype=np.uint8)[None, :, None]
+    noise = rng.integers(0, 12, (8, height, width, 1), dtype=np.uint8)
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Không thể tạo video thử: {path}")
+    fire_start, fire_end = frames // 4, frames * 3 // 4
+    for idx in range(frames):
+        frame = background + noise[idx % len(noise)]
+        if fire_start <= idx < fire_end:
+            progress = (idx - fire_start) / max(1, fire_end - fire_start)
+            center = (int(width * (0.2 + 0.6 * progress)), int(height * 0.6))
+            axes = (int(width * (0.06 + 0.01 * (idx % 3))), int(height * 0.12))
+            cv2.ellipse(frame, center, axes, 0, 0, 360, (30, 110, 240), -1)
+            cv2.ellipse(frame, center, (axes[0] // 2, axes[1] // 2), 0, 0, 360, (60, 190, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+class StubFireModel:
+    """
+    Model giả lập có kết quả xác định, thay model YOLO khi đo trên máy không có GPU / không có checkpoint:
+    vùng cháy là các điểm ảnh màu lửa trên ảnh thu nhỏ MASK_STRIDE lần, trả về Results của ultralytics
+    (box + mask) như model phân đoạn thật. Thời gian suy luận giả lập = latency_ms mỗi lần gọi
+    cộng per_frame_ms cho mỗi frame trong batch.
+    """
+
+    names = {0: "fire"}
+
+    def __init__(self, latency_ms=0.0, per_frame_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.per_frame = per_frame_ms / 1000.0
+
+    def predict(self, source, conf=0.25, **kwargs):
+        frames = [source] if isinstance(source, np.ndarray) else list(source)
+        start_time = time.perf_counter()
+        results = [self._detect(frame, conf) for frame in frames]
+        delay = self.latency + self.per_frame * len(frames) - (time.perf_counter() - start_time)
+        if delay > 0:
+            time.sleep(delay)
+        return results
+
+    def _detect(self, frame, conf):
+        import torch
+        from ultralytics.engine.results import Results
+
+        small = frame[::MASK_STRIDE, ::MASK_STRIDE]
+        blue, green, red = small[..., 0], small[..., 1], small[..., 2]
+        mask = (red > 200) & (green > 80) & (blue < 100)
+        if not mask.any():
+            return Results(frame, path="", names=self.names, boxes=torch.zeros((0, 6)))
+
+        ys, xs = np.nonzero(mask)
+        box = [xs.min() * MASK_STRIDE, ys.min() * MASK_STRIDE, (xs.max() + 1) * MASK_STRIDE, (ys.max() + 1) * MASK_STRIDE]
+        # Confidence tăng theo độ đặc của vùng lửa trong box
+        fill = mask.sum() / ((xs.max() - xs.min() + 1) * (ys.max() - ys.min() + 1))
+        confidence = max(conf, min(0.99, 0.5 + 0.5 * float(fill)))
+        return Results(frame, path="", names=self.names,
+                       boxes=torch.tensor([[*box, confidence, 0]], dtype=torch.float32),
+                       masks=torch.from_numpy(mask[None].astype(np.float32)))
+
+
+class ModelService:
+    """Bọc model (thật hoặc giả lập) với cùng hàm predict như FireDetectionService, dùng cho CameraController"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, frames, prefilter=None, conf=0.5):
+        from app.services.fire_prefilter import cascade_predict
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        return cascade_predict(self.model, frames, prefilter, conf=conf)
+
+
+class NullWebSocket:
+    """WebSocket giả: nhận message, đếm số byte và có thể giả lập thời gian gửi qua mạng"""
+
+    def __init__(self, send_delay_ms=0.0):
+        self.send_delay = send_delay_ms / 1000.0
+        self.messages = 0
+        self.bytes = 0
+
+    async def _send(self, size):
+        self.messages += 1
+        self.bytes += size
+        if self.send_delay > 0:
+            await asyncio.sleep(self.send_delay)
+
+    async def send_bytes(self, data):
+        await self._send(len(data))
+
+    async def send_text(self, data):
+        await self._send(len(data.encode("utf-8")))
+
+    async def send_json(self, data):
+        await self._send(len(json.dumps(data, ensure_ascii=False).encode("utf-8")))
+
+
+def stage_fps(count, seconds):
+    return round(count / seconds, 2) if count and seconds > 0 else None
+
+
+def latency_percentiles(latencies):
+    """Phân vị độ trễ (mili giây)"""
+    values = np.array(latencies) * 1000
+    return {
+        "latency_p50_ms": round(float(np.percentile(values, 50)), 2),
+        "latency_p90_ms": round(float(np.percentile(values, 90)), 2),
+        "latency_p99_ms": round(float(np.percentile(values, 99)), 2),
+    }
+
+
+def load_model(case):
+    """Tải model thật (nếu có --model) hoặc model giả lập"""
+    if case["model"]:
+        from app.core.config import settings
+        from app.services.inference_backends import load_yolo_model, resolve_model_path
+        return load_yolo_model(resolve_model_path(case["model"]), settings.INFERENCE_BACKEND, settings.INFERENCE_THREADS)
+    return StubFireModel(case["stub_latency_ms"], case["stub_per_frame_ms"])
+
+
+def analysis_options(case):
+    """Mặc định suy luận mọi frame để kết quả không phụ thuộc bộ lập lịch; --configured dùng cấu hình của ứng dụng"""
+    if case["configured"]:
+        return {}
+    return {"target_fps": 0, "latency_budget": 0, "motion_gating": False, "prefilter_mode": "off"}
+
+
+async def run_pipeline(case, model):
+    """
+    Chạy đúng đường xử lý của WebSocket xử lý video: predict_and_display trên luồng riêng qua AsyncFrameStream,
+    frame xem trước mã hóa JPEG trên thread pool và gửi qua PreviewSender (tới WebSocket giả)
+    """
+    from app.services.fire_detection import predict_and_display
+    from app.services.async_pipeline import AsyncFrameStream
+    from app.services.preview_encoder import PreviewEncoder
+    from app.services.preview_sender import PreviewSender
+    from app.services.frame_protocol import create_frame_encoder
+
+    stats = {}
+    output_path = os.path.join(case["work_dir"], f"{case['name'].replace(' ', '_')}_output.mp4")
+    # drop_oldest chỉ áp dụng cho phiên chỉ xem trước, không ghi video kết quả
+    if case["queue_policy"] == "drop_oldest":
+        output_path = None
+    preview_encoder = PreviewEncoder()
+    websocket = NullWebSocket(case["send_delay_ms"])
+    sender = PreviewSender(websocket, preview_encoder, create_frame_encoder({"frame_protocol": case["protocol"]})).start()
+
+    frames = fire_frames = 0
+    start_time = time.perf_counter()
+    stream = AsyncFrameStream(
+        lambda: predict_and_display(model, case["video"], output_path, session_stats=stats,
+                                    queue_policy=case["queue_policy"], **analysis_options(case)),
+        transform=lambda item: (preview_encoder.submit(item[0]), item[1]),
+    )
+    async with stream:
+        async for encoded_frame, frame_info in stream:
+            frames += 1
+            fire_frames += int(frame_info["fire_detected"])
+            sender.send_frame(encoded_frame, frame_info)
+    await sender.close()
+    elapsed = time.perf_counter() - start_time
+    preview_encoder.close()
+
+    stage_time = stats.get("stage_time", {})
+    total_frames = stats.get("total_frames") or frames
+    # Không có bộ mã hóa H.264 (vd. OpenCV bản pip không kèm) thì video kết quả rỗng, bỏ chỉ số encode
+    encoded = output_path is not None and os.path.exists(output_path) and os.path.getsize(output_path) > 0
+    # Gửi một frame xem trước = mã hóa JPEG + đóng gói và ghi ra WebSocket
+    send_seconds = None
+    if preview_encoder.frames and preview_encoder.sent_frames:
+        send_seconds = (preview_encoder.encode_time / preview_encoder.frames
+                        + preview_encoder.send_time / preview_encoder.sent_frames)
+    result = {
+        "frames": total_frames,
+        "fps": stage_fps(total_frames, elapsed),
+        "decode_fps": stage_fps(total_frames, stage_time.get("decode", 0)),
+        "infer_fps": stage_fps(stats.get("inferred_frames", 0), stage_time.get("infer", 0)),
+        "render_fps": stage_fps(total_frames, stage_time.get("render", 0)),
+        "encode_fps": stage_fps(total_frames, stage_time.get("encode", 0)) if encoded else None,
+        "send_fps": stage_fps(1, send_seconds) if send_seconds else None,
+        "fire_frames": fire_frames,
+        "previews_sent": sender.frames_sent,
+        "previews_dropped": sender.frames_dropped,
+        "sent_bytes": websocket.bytes,
+    }
+    latency = stats.get("latency_ms", {})
+    for name in ("p50", "p90", "p99"):
+        result[f"latency_{name}_ms"] = latency.get(name)
+    return result
+
+
+def run_camera(case, model):
+    """Đo CameraController._process_frame (suy luận, vẽ, JPEG + base64) và json.dumps của message gửi đi"""
+    from app.controllers.camera_controller import CameraController
+    from app.services.overlay import FrameRenderer
+
+    controller = CameraController()
+    controller.fire_detection_service = ModelService(model)
+    renderer = FrameRenderer()
+
+    cap = cv2.VideoCapture(case["video"])
+    frames = []
+    while len(frames) < case["camera_frames"]:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    height, width = frames[0].shape[:2]
+
+    # Warm-up
+    controller._process_frame(frames[0].copy(), 0, width, height, renderer=renderer)
+
+    latencies = []
+    send_time = 0.0
+    start_time = time.perf_counter()
+    for idx, frame in enumerate(frames):
+        frame_start = time.perf_counter()
+        _, frame_info = controller._process_frame(frame, idx, width, height, fps=VIDEO_FPS, renderer=renderer)
+        send_start = time.perf_counter()
+        json.dumps(frame_info)
+        send_time += time.perf_counter() - send_start
+        latencies.append(time.perf_counter() - frame_start)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "frames": len(frames),
+        "fps": stage_fps(len(frames), elapsed),
+        "send_fps": stage_fps(len(frames), send_time),
+        **latency_percentiles(latencies),
+    }
+
+
+def run_case(case):
+    """Chạy một trường hợp đo trong tiến trình con riêng (RAM đỉnh không bị ảnh hưởng bởi các trường hợp khác)"""
+    import torch
+    import app.services.fire_detection  # noqa: F401 (đặt tùy chọn giải mã khi import)
+
+    if not torch.cuda.is_available():
+        # Máy chỉ có CPU: bỏ tùy chọn ép giải mã bằng GPU (h264_cuvid) của fire_detection
+        os.environ.pop("OPENCV_FFMPEG_CAPTURE_OPTIONS", None)
+
+    model = load_model(case)
+    if case["kind"] == "pipeline":
+        result = asyncio.run(run_pipeline(case, model))
+    else:
+        result = run_camera(case, model)
+    # ru_maxrss tính theo KB trên Linux
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    So sánh với baseline, trả về danh sách chỉ số kém đi quá tolerance (tỉ lệ)
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            current, previous = result.get(metric), reference.get(metric)
+            if not current or not previous:
+                continue
+            change = (current - previous) / previous
+            if change * direction < -tolerance:
+                regressions.append(f"{name}: {metric} {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+
+def print_results(results):
+    columns = ["fps", "decode_fps", "infer_fps", "render_fps", "encode_fps", "send_fps",
+               "latency_p50_ms", "latency_p90_ms", "latency_p99_ms", "peak_rss_mb"]
+    headers = ["fps", "decode", "infer", "render", "encode", "send", "p50 ms", "p90 ms", "p99 ms", "RSS MB"]
+    print(f"{'trường hợp':<24}" + "".join(f"{header:>10}" for header in headers))
+    for name, result in results.items():
+        values = [result.get(column) for column in columns]
+        print(f"{name:<24}" + "".join(f"{value:>10}" if value is not None else f"{'-':>10}" for value in values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo hiệu năng pipeline phát hiện cháy (predict_and_display, camera, gửi WebSocket) "
+                                                 "trên video tổng hợp, chạy được trên máy chỉ có CPU, không cần mạng")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS), help="Các độ phân giải")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[4, 12], help="Các độ dài video (giây)")
+    parser.add_argument("--model", default=None, help="Checkpoint model thật (mặc định dùng model giả lập)")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0, help="Thời gian mỗi lần gọi model giả lập")
+    parser.add_argument("--stub-per-frame-ms", type=float, default=5.0, help="Thời gian thêm cho mỗi frame của model giả lập")
+    parser.add_argument("--camera-frames", type=int, default=100, help="Số frame đo cho luồng camera (0 = bỏ qua)")
+    parser.add_argument("--protocol", default="binary", choices=["binary", "json"], help="Giao thức gửi frame xem trước")
+    parser.add_argument("--send-delay-ms", type=float, default=0.0, help="Thời gian gửi giả lập mỗi message WebSocket")
+    parser.add_argument("--queue-policy", default="block", choices=["block", "drop_oldest"], help="Chính sách hàng đợi của pipeline (drop_oldest: chỉ xem trước, không ghi video kết quả)")
+    parser.add_argument("--configured", action="store_true", help="Dùng cấu hình phân tích của ứng dụng thay vì suy luận mọi frame")
+    parser.add_argument("--save-baseline", help="Ghi kết quả ra file baseline JSON")
+    parser.add_argument("--baseline", help="So sánh với file baseline JSON, thoát với mã 1 nếu có chỉ số kém đi")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Mức kém đi cho phép so với baseline (tỉ lệ)")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("save_baseline", "baseline", "tolerance")}
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="fire_benchmark_")
+    # spawn: mỗi trường hợp chạy trong tiến trình mới để đo RAM đỉnh độc lập
+    context = multiprocessing.get_context("spawn")
+    try:
+        cases = []
+        for resolution in args.resolutions:
+            width, height = RESOLUTIONS[resolution]
+            for seconds in args.seconds:
+                frames = int(seconds * VIDEO_FPS)
+                video = os.path.join(work_dir, f"{resolution}_{frames}.mp4")
+                make_synthetic_video(video, width, height, frames)
+                cases.append({"kind": "pipeline", "name": f"pipeline {resolution} {frames}f", "video": video})
+            if args.camera_frames:
+                cases.append({"kind": "camera", "name": f"camera {resolution}", "video": video})
+
+        for case in cases:
+            case.update(config, work_dir=work_dir)
+            print(f"Đang đo: {case['name']}", flush=True)
+            with context.Pool(1) as pool:
+                results[case["name"]] = pool.apply(run_case, (case,))
+    finally:
+        for name in os.listdir(work_dir):
+            os.remove(os.path.join(work_dir, name))
+        os.rmdir(work_dir)
+
+    print()
+    print(f"Model: {args.model or f'giả lập ({args.stub_latency_ms} ms/lần gọi + {args.stub_per_frame_ms} ms/frame)'}; "
+          f"throughput theo frame/giây của từng công đoạn")
+    print_results(results)
+
+    if args.save_baseline:
+        baseline = {
+            "version": BASELINE_VERSION,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "opencv": cv2.__version__,
+            },
+            "config": config,
+            "results": results,
+        }
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi baseline vào {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("\nCảnh báo: cấu hình đo khác với baseline, kết quả so sánh có thể không tương đương")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nCác chỉ số kém đi quá {args.tolerance:.0%} so với baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nKhông có chỉ số nào kém đi quá {args.tolerance:.0%} so với baseline")
+
+
+if __name__ == "__main__":
+    main()
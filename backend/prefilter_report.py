@@ -0,0 +1,57 @@
+import sys
+import os
+import json
+import argparse
+
+from dotenv import load_dotenv
+
+# Thêm đường dẫn hiện tại vào sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Load biến môi trường
+load_dotenv()
+
+from app.core.config import settings
+from app.services.fire_detection import predict_and_display
+from app.services.inference_backends import load_yolo_model, resolve_model_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo recall bị mất và số lần gọi model tiết kiệm được của bộ lọc màu lửa")
+    parser.add_argument("clips", nargs="+", help="Các clip video dùng để đánh giá")
+    parser.add_argument("--model-path", default=settings.MODEL_PATH, help="Checkpoint .pt")
+    parser.add_argument("--backend", default=settings.INFERENCE_BACKEND, help="Backend suy luận")
+    parser.add_argument("--json", dest="json_path", help="Ghi báo cáo ra file JSON")
+    args = parser.parse_args()
+
+    model = load_yolo_model(resolve_model_path(args.model_path), args.backend, settings.INFERENCE_THREADS)
+
+    report = {"crops": settings.PREFILTER_CROPS, "clips": []}
+    for clip in args.clips:
+        stats = {}
+        # Suy luận mọi frame, tắt cổng chuyển động để mỗi frame đều được so sánh với model
+        for _ in predict_and_display(model, clip, session_stats=stats, target_fps=0, latency_budget=0,
+                                     motion_gating=False, prefilter_mode="evaluate"):
+            pass
+        if "prefilter" not in stats:
+            print(f"Bỏ qua clip không đọc được: {clip}")
+            continue
+
+        prefilter_stats = stats["prefilter"]
+        report["clips"].append({"clip": clip, **prefilter_stats})
+        print(f"\n=== {clip} ({prefilter_stats['frames']} frame) ===")
+        print(f"Frame có ứng viên màu lửa: {prefilter_stats['candidate_frames']}, "
+              f"lần gọi model tiết kiệm được: {prefilter_stats['model_calls_saved']} ({prefilter_stats['saved_ratio']:.1%})")
+        print(f"Recall theo frame: {prefilter_stats['frame_recall']} "
+              f"({prefilter_stats['kept_fire_frames']}/{prefilter_stats['model_fire_frames']})")
+        print(f"Recall theo box: {prefilter_stats['box_recall']} "
+              f"({prefilter_stats['kept_fire_boxes']}/{prefilter_stats['model_fire_boxes']})")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi báo cáo vào {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+# Thêm đường dẫn hiện tại vào sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Load biến môi trường
+load_dotenv()
+
+from app.core.config import settings
+from app.services.detections import results_to_detections
+from app.services.inference_backends import load_yolo_model
+
+
+def read_clip_frames(clip_path, max_frames):
+    """
+    Đọc trước các frame của clip vào bộ nhớ để hai model được đo trên cùng dữ liệu
+    """
+    cap = cv2.VideoCapture(clip_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_model(model, frames, conf):
+    """
+    Chạy model trên từng frame, trả về độ trễ (giây) và các phát hiện (xyxy, conf) của mỗi frame
+    """
+    # Warm-up để không tính thời gian khởi tạo vào kết quả
+    model.predict(frames[0], save=False, conf=conf, verbose=False)
+
+    latencies = []
+    detections = []
+    for frame in frames:
+        start_time = time.perf_counter()
+        result = model.predict(frame, save=False, conf=conf, verbose=False)[0]
+        latencies.append(time.perf_counter() - start_time)
+        frame_detections = results_to_detections(result)
+        detections.append((frame_detections["xyxy"], frame_detections["conf"]))
+    return latencies, detections
+
+
+def box_iou(a, b):
+    """
+    Tính ma trận IoU giữa hai tập box dạng (N, 4) và (M, 4)
+    """
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def compare_detections(reference, candidate, iou_threshold):
+    """
+    So khớp tham lam (greedy) các box của model tham chiếu và model ứng viên theo IoU giảm dần
+    """
+    matched_ious = []
+    conf_deltas = []
+    reference_only = 0
+    candidate_only = 0
+    frame_agreement = 0
+
+    for (ref_boxes, ref_conf), (cand_boxes, cand_conf) in zip(reference, candidate):
+        frame_agreement += int((len(ref_boxes) > 0) == (len(cand_boxes) > 0))
+        if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+            reference_only += len(ref_boxes)
+            candidate_only += len(cand_boxes)
+            continue
+
+        ious = box_iou(ref_boxes, cand_boxes)
+        used_ref, used_cand = set(), set()
+        for flat in np.argsort(-ious, axis=None):
+            i, j = np.unravel_index(flat, ious.shape)
+            if ious[i, j] < iou_threshold:
+                break
+            if i in used_ref or j in used_cand:
+                continue
+            used_ref.add(i)
+            used_cand.add(j)
+            matched_ious.append(float(ious[i, j]))
+            conf_deltas.append(float(cand_conf[j] - ref_conf[i]))
+        reference_only += len(ref_boxes) - len(used_ref)
+        candidate_only += len(cand_boxes) - len(used_cand)
+
+    total_ref = len(matched_ious) + reference_only
+    return {
+        "matched_boxes": len(matched_ious),
+        "fp32_only_boxes": reference_only,
+        "int8_only_boxes": candidate_only,
+        "box_recall_vs_fp32": round(len(matched_ious) / total_ref, 4) if total_ref else 1.0,
+        "mean_iou": round(float(np.mean(matched_ious)), 4) if matched_ious else None,
+        "mean_abs_conf_delta": round(float(np.mean(np.abs(conf_deltas))), 4) if conf_deltas else None,
+        "max_abs_conf_delta": round(float(np.max(np.abs(conf_deltas))), 4) if conf_deltas else None,
+        "mean_conf_delta": round(float(np.mean(conf_deltas)), 4) if conf_deltas else None,
+        "frame_fire_flag_agreement": round(frame_agreement / len(reference), 4) if reference else None,
+    }
+
+
+def latency_summary(latencies):
+    """
+    Tóm tắt fps và độ trễ p50/p95 (mili giây)
+    """
+    values = np.array(latencies)
+    return {
+        "fps": round(len(values) / values.sum(), 2),
+        "p50_ms": round(float(np.percentile(values, 50)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(values, 95)) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh model INT8 với model FP32 (fps, độ trễ p95, độ khớp phát hiện)")
+    parser.add_argument("clips", nargs="+", help="Các clip video dùng để so sánh")
+    parser.add_argument("--model-path", default=settings.MODEL_PATH, help="Checkpoint .pt gốc")
+    parser.add_argument("--baseline", default="onnx", choices=["onnx", "torch"], help="Backend FP32 dùng làm tham chiếu")
+    parser.add_argument("--max-frames", type=int, default=300, help="Số frame tối đa mỗi clip")
+    parser.add_argument("--conf", type=float, default=0.5, help="Ngưỡng confidence khi suy luận")
+    parser.add_argument("--iou-threshold", type=float, default=0.5, help="Ngưỡng IoU để coi hai box là khớp")
+    parser.add_argument("--threads", type=int, default=settings.INFERENCE_THREADS, help="Số luồng CPU cho suy luận")
+    parser.add_argument("--json", dest="json_path", help="Ghi báo cáo ra file JSON")
+    args = parser.parse_args()
+
+    model_path = os.path.abspath(args.model_path)
+    print(f"Tải model FP32 ({args.baseline}) và INT8 từ {model_path}")
+    fp32_model = load_yolo_model(model_path, args.baseline, args.threads)
+    int8_model = load_yolo_model(model_path, "onnx_int8", args.threads)
+
+    report = {"model_path": model_path, "baseline": args.baseline, "clips": []}
+    for clip in args.clips:
+        frames = read_clip_frames(clip, args.max_frames)
+        if not frames:
+            print(f"Bỏ qua clip không đọc được: {clip}")
+            continue
+
+        fp32_latencies, fp32_detections = run_model(fp32_model, frames, args.conf)
+        int8_latencies, int8_detections = run_model(int8_model, frames, args.conf)
+        fp32_summary = latency_summary(fp32_latencies)
+        int8_summary = latency_summary(int8_latencies)
+
+        clip_report = {
+            "clip": clip,
+            "frames": len(frames),
+            "fp32": fp32_summary,
+            "int8": int8_summary,
+            "speedup": round(int8_summary["fps"] / fp32_summary["fps"], 2),
+            "agreement": compare_detections(fp32_detections, int8_detections, args.iou_threshold),
+        }
+        report["clips"].append(clip_report)
+
+        agreement = clip_report["agreement"]
+        print(f"\n=== {clip} ({len(frames)} frame) ===")
+        print(f"{'':8}{'fps':>10}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+        for name, summary in (("FP32", fp32_summary), ("INT8", int8_summary)):
+            print(f"{name:8}{summary['fps']:>10}{summary['p50_ms']:>12}{summary['p95_ms']:>12}")
+        print(f"Tăng tốc INT8/FP32: {clip_report['speedup']}x")
+        print(f"Box khớp: {agreement['matched_boxes']}, chỉ FP32: {agreement['fp32_only_boxes']}, "
+              f"chỉ INT8: {agreement['int8_only_boxes']}, recall so với FP32: {agreement['box_recall_vs_fp32']}")
+        print(f"IoU trung bình: {agreement['mean_iou']}, |Δconf| trung bình: {agreement['mean_abs_conf_delta']}, "
+              f"|Δconf| lớn nhất: {agreement['max_abs_conf_delta']}")
+        print(f"Tỷ lệ frame khớp cờ phát hiện lửa: {agreement['frame_fire_flag_agreement']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi báo cáo vào {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import sys
+import os
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+# Thêm đường dẫn hiện tại vào sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.detections import empty_detections
+from app.services.overlay import FrameRenderer
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+# Độ phân giải mask đầu ra của model (imgsz 640, khung 16:9)
+MASK_SHAPE = (384, 640)
+
+
+def make_scene(width, height, num_objects, seed=0):
+    """
+    Tạo frame, mask (ở độ phân giải model) và box ngẫu nhiên nhưng cố định cho một độ phân giải
+    """
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    masks = np.zeros((num_objects, *MASK_SHAPE), dtype=np.float32)
+    boxes = empty_detections(num_objects)
+    for i in range(num_objects):
+        mh, mw = MASK_SHAPE
+        y1, x1 = rng.integers(0, mh // 2), rng.integers(0, mw // 2)
+        y2, x2 = y1 + rng.integers(20, mh // 3), x1 + rng.integers(20, mw // 3)
+        masks[i, y1:y2, x1:x2] = 1
+        sx, sy = width / mw, height / mh
+        boxes[i] = ((x1 * sx, y1 * sy, x2 * sx, y2 * sy), rng.uniform(0.5, 1.0), 0, i + 1)
+    return frame, masks, boxes
+
+
+def render_baseline(frame, masks, boxes, fps):
+    """
+    Cách vẽ cũ của draw_and_yield: mỗi mask một ảnh màu cỡ frame, một bản sao frame và một lần
+    addWeighted trên toàn ảnh; hộp FPS sao chép cả frame; getTextSize cho mọi nhãn
+    """
+    height, width = frame.shape[:2]
+    for mask in masks:
+        mask_resized = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        blue_mask = np.zeros_like(frame, dtype=np.uint8)
+        blue_mask[mask_resized > 0.5] = (255, 0, 0)
+        overlay = frame.copy()
+        overlay[mask_resized > 0.5] = blue_mask[mask_resized > 0.5]
+        cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
+
+    for (x1, y1, x2, y2), conf, _, track_id in boxes:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        box_color = (min(255, int(200 + (conf * 55))), 0, 0)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 4)
+        label = f"#{int(track_id)} {conf:.2f}"
+        (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 1.5, 1)
+        cv2.rectangle(frame, (x1, y1 - text_height - 8), (x1 + text_width + 6, y1), box_color, -1)
+        cv2.putText(frame, label, (x1 + 3, y1 - 4), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
+
+    text = f"FPS: {fps:.0f}"
+    (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1.2, 2)
+    overlay = frame.copy()
+    cv2.rectangle(overlay, (0, 35 - text_height - 10), (5 + text_width + 5, 40), (255, 0, 0), -1)
+    cv2.addWeighted(overlay, 0.25, frame, 0.75, 0, frame)
+    cv2.putText(frame, text, (5, 35), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+
+
+def render_new(renderer, frame, masks, boxes, fps):
+    """Cách vẽ hiện tại bằng FrameRenderer"""
+    renderer.draw_masks(frame, masks, color=(255, 0, 0), alpha=0.6)
+    renderer.draw_boxes(frame, boxes)
+    renderer.draw_fps(frame, fps)
+
+
+def measure(fn, source, repeats):
+    """Đo thời gian vẽ trung bình (mili giây / frame), mỗi lần vẽ trên một bản sao của frame gốc"""
+    frame = source.copy()
+    fn(frame)  # Warm-up
+    total = 0.0
+    for _ in range(repeats):
+        np.copyto(frame, source)
+        start_time = time.perf_counter()
+        fn(frame)
+        total += time.perf_counter() - start_time
+    return total / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo chi phí vẽ lớp phủ mỗi frame ở 720p, 1080p và 4K")
+    parser.add_argument("--objects", type=int, default=3, help="Số vùng cháy (mask + box) mỗi frame")
+    parser.add_argument("--repeats", type=int, default=50, help="Số lần đo mỗi độ phân giải")
+    args = parser.parse_args()
+
+    print(f"{'':8}{'cũ (ms)':>12}{'mới (ms)':>12}{'nhanh hơn':>12}")
+    for name, (width, height) in RESOLUTIONS.items():
+        frame, masks, boxes = make_scene(width, height, args.objects)
+        renderer = FrameRenderer()
+        baseline_ms = measure(lambda f: render_baseline(f, masks, boxes, 30.0), frame, args.repeats)
+        new_ms = measure(lambda f: render_new(renderer, f, masks, boxes, 30.0), frame, args.repeats)
+        print(f"{name:8}{baseline_ms:>12.2f}{new_ms:>12.2f}{baseline_ms / new_ms:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import sys
+import os
+import time
+import tempfile
+import argparse
+
+# Thêm đường dẫn hiện tại vào sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.fire_detection import FireDetectionService
+from app.services.detection_timeline import TimelineWriter, TimelineReader
+from app.services.timeline_render import render_from_timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh xử lý lại toàn bộ video (chạy model) với vẽ lại từ timeline đã lưu")
+    parser.add_argument("video", help="Đường dẫn video thử")
+    parser.add_argument("--model", default=None, help="Đường dẫn model (mặc định settings.MODEL_PATH)")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1.0, 0.5], help="Các tỉ lệ độ phân giải đầu ra khi vẽ lại")
+    parser.add_argument("--min-confidence", type=float, default=0.6, help="Ngưỡng hiển thị khi vẽ lại")
+    args = parser.parse_args()
+
+    service = FireDetectionService(model_path=args.model)
+    if not service.model:
+        raise SystemExit("Không thể tải model")
+
+    temp_dir = tempfile.mkdtemp()
+    timeline_path = os.path.join(temp_dir, "timeline.fdtl")
+    try:
+        # Xử lý đầy đủ: giải mã, suy luận, vẽ, mã hóa (đồng thời ghi timeline)
+        writer = TimelineWriter(timeline_path)
+        start_time = time.perf_counter()
+        analysis = service.analyze_video(args.video, output_path=os.path.join(temp_dir, "full.mp4"), timeline=writer)
+        full_time = time.perf_counter() - start_time
+        writer.close()
+        frames = writer.frames
+        if not frames:
+            raise SystemExit(f"Không thể phân tích video: {args.video}")
+
+        print(f"Video: {args.video}, {frames} frame, timeline {writer.stats()['compressed_bytes'] / 1024:.1f} KB")
+        print(f"{'cách tạo video kết quả':<32}{'giây':>10}{'frame/giây':>12}{'nhanh hơn':>12}")
+        print(f"{'xử lý lại (model)':<32}{full_time:>10.2f}{frames / full_time:>12.1f}{'':>12}")
+
+        reader = TimelineReader(timeline_path)
+        for scale in args.scale:
+            output_path = os.path.join(temp_dir, f"render_{scale}.mp4")
+            start_time = time.perf_counter()
+            stats = render_from_timeline(args.video, reader, output_path,
+                                         min_confidence=args.min_confidence, scale=scale)
+            render_time = time.perf_counter() - start_time
+            assert stats["frames"] == frames and not stats["missing_frames"], "Timeline không khớp video"
+            name = f"vẽ lại từ timeline ({stats['width']}x{stats['height']})"
+            print(f"{name:<32}{render_time:>10.2f}{frames / render_time:>12.1f}{full_time / render_time:>11.1f}x")
+
+        print(f"Khoảng có cháy khi xử lý: {len(analysis['detections'])}")
+    finally:
+        for name in os.listdir(temp_dir):
+            os.remove(os.path.join(temp_dir, name))
+        os.rmdir(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import sys
+import os
+import json
+import time
+import hashlib
+import tempfile
+import argparse
+import tracemalloc
+import multiprocessing
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Thêm đường dẫn hiện tại vào sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Thông tin Cloudinary giả để chạy không cần mạng (phải có trước khi import settings)
+os.environ.setdefault("CLOUDINARY_CLOUD_NAME", "standin")
+os.environ.setdefault("CLOUDINARY_API_KEY", "standin-key")
+os.environ.setdefault("CLOUDINARY_API_SECRET", "standin-secret")
+
+
+class StandInUploadHandler(BaseHTTPRequestHandler):
+    """
+    Giả lập API tải lên của Cloudinary: nhận cả request tải lên thường và tải lên theo phần
+    (Content-Range + X-Unique-Upload-Id), ghép các phần vào file và trả về sha256 để đối chiếu
+    """
+
+    uploads = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        content_type = self.headers["Content-Type"]
+        body = self.rfile.read(length)
+        message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        del body
+        fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                  for part in message.get_payload()}
+        data = fields.pop("file")
+
+        content_range = self.headers.get("Content-Range")
+        if content_range:
+            start, end, total = (int(x) for x in content_range.split(" ")[1].replace("/", "-").split("-"))
+        else:
+            start, end, total = 0, len(data) - 1, len(data)
+        upload_id = self.headers.get("X-Unique-Upload-Id") or os.urandom(8).hex()
+
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            handle, path = tempfile.mkstemp(prefix="standin_")
+            os.close(handle)
+            upload = self.uploads[upload_id] = {"path": path, "received": 0, "parts": 0}
+        with open(upload["path"], "r+b") as f:
+            f.seek(start)
+            f.write(data)
+        upload["received"] += end - start + 1
+        upload["parts"] += 1
+
+        public_id = f"{fields.get('folder', b'').decode()}/{upload_id}"
+        if upload["received"] < total:
+            result = {"done": False, "public_id": public_id}
+        else:
+            with open(upload["path"], "rb") as f:
+                digest = hashlib.file_digest(f, "sha256").hexdigest()
+            os.remove(upload["path"])
+            del self.uploads[upload_id]
+            result = {
+                "public_id": public_id,
+                "secure_url": f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/{public_id}.mp4",
+                "bytes": total,
+                "parts": upload["parts"],
+                "sha256": digest,
+            }
+
+        response = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def serve(port_queue):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInUploadHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_standin_server():
+    """Chạy server giả lập ở tiến trình riêng (để không tính vào bộ nhớ của phía tải lên), trả về (process, địa chỉ)"""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(port_queue,), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+
+
+def measure(name, upload, path, expected_digest):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    success, message, result = upload()
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if not success:
+        raise RuntimeError(f"{name}: {message}")
+    assert result["sha256"] == expected_digest, f"{name}: dữ liệu ghép lại không khớp"
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"{name:<28}{result.get('parts', 1):>6}{elapsed:>10.2f}{size_mb / elapsed:>10.1f}{peak / 1024 / 1024:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh bộ nhớ đỉnh khi tải video lên Cloudinary từ bytes và theo từng phần (server giả lập cục bộ)")
+    parser.add_argument("--size-mb", type=int, default=200, help="Kích thước file thử")
+    parser.add_argument("--chunk-mb", type=int, nargs="+", default=[5, 20], help="Các kích thước phần cần đo")
+    args = parser.parse_args()
+
+    process, upload_prefix = start_standin_server()
+    os.environ["CLOUDINARY_UPLOAD_PREFIX"] = upload_prefix
+
+    from app.utils.cloudinary_service import init_cloudinary, upload_bytes_to_cloudinary, upload_stream_to_cloudinary
+    init_cloudinary()
+
+    handle, path = tempfile.mkstemp(suffix=".mp4")
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(handle, "wb") as f:
+            for _ in range(args.size_mb):
+                block = os.urandom(1024 * 1024)
+                digest.update(block)
+                f.write(block)
+        expected_digest = digest.hexdigest()
+
+        print(f"File thử: {args.size_mb} MB, server giả lập: {upload_prefix}")
+        print(f"{'cách tải lên':<28}{'phần':>6}{'giây':>10}{'MB/s':>10}{'RAM đỉnh (MB)':>14}")
+
+        def upload_bytes():
+            with open(path, "rb") as f:
+                return upload_bytes_to_cloudinary(f.read(), "benchmark.mp4")
+
+        measure("bytes (f.read)", upload_bytes, path, expected_digest)
+        for chunk_mb in args.chunk_mb:
+            measure(f"theo phần ({chunk_mb} MB)",
+                    lambda: upload_stream_to_cloudinary(path, "benchmark.mp4", chunk_size=chunk_mb * 1024 * 1024),
+                    path, expected_digest)
+    finally:
+        os.remove(path)
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -118,7 +118,8 @@ useEffect(() => {
       fileName: videoFile.name,
       fileSize: videoFile.size,
       mimeType: videoFile.type,
-      totalChunks: totalChunks
+      totalChunks: totalChunks,
+      chunkSize: CHUNK_SIZE // Kích thước mỗi phần (trừ phần cuối), server cần để ghi đúng vị trí
     }));
 
     const sendChunkMeta = (chunkIndex) => {
@@ -160,7 +161,13 @@ useEffect(() => {
       if (typeof event.data === 'string') {
         try {
           const data = JSON.parse(event.data);
-          if (data.status === "chunk_ready" && waitingForServerReady) {
+          if (data.status === "chunk_error") {
+            // Server từ chối phần vừa gửi: dừng gửi tiếp thay vì chờ mãi
+            waitingForServerReady = false;
+            addLog(`Lỗi khi gửi phần ${data.chunkIndex}: ${data.message}`, 'error');
+            setStatus("Lỗi khi tải video lên");
+            ws.removeEventListener('message', chunkMessageHandler);
+          } else if (data.status === "chunk_ready" && waitingForServerReady) {
             waitingForServerReady = false;
             sendChunk(currentChunk);
             currentChunk++;